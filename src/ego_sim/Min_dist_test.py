@@ -7,11 +7,28 @@ Created on Wed Nov  6 14:50:41 2019
 """
 import numpy as np
 from numpy import cos, sin
-from stanley_pid import calc_path_error
+from path_index import get_path_index
 #import time
 import matplotlib.pyplot as plt
 
-def calc_off_tracking(x_front, y_front, th1, th2, P, path_x, path_y):
+def calc_off_tracking(x_front, y_front, th1, th2, P, path_x, path_y, spatial_index=True):
+    '''
+    Calculates the sum squared off-tracking of the tractor front axle and the
+    trailer axle from the path over a trajectory.
+
+    Inputs:
+        x_front, y_front: Front axle coordinates at each trajectory sample
+        th1, th2: Absolute orientations of the truck and trailer at each sample
+        P: Truck parameters
+        path_x, path_y: Coordinates of the points that discretize the path
+        spatial_index: If True, the closest path point to every sample is found
+            with one vectorized KD-tree query; otherwise each sample scans the
+            whole path. Both give identical results.
+
+    Outputs:
+        Sum of squared tractor and trailer off-tracking, and the trailer
+        squared off-tracking at each sample
+    '''
     # Preallocate
 #    start_time = time.time()
 #    print("In")
@@ -31,26 +48,27 @@ def calc_off_tracking(x_front, y_front, th1, th2, P, path_x, path_y):
 #        y_trail = y_c - (P['l2']) * sin(th2[i])
 #        y_trail_mat.append(y_trail)
 
-    truck_mindist_mat = []
-    trail_mindist_mat = []
+    if spatial_index:
+        truck_mindist_mat, trail_mindist_mat = off_tracking_errors(x_front, y_front, th1, th2, P, path_x, path_y)
+    else:
+        truck_mindist_mat = []
+        trail_mindist_mat = []
+        path_index = get_path_index(path_x, path_y)
+        for j in range(len(x_front)):
+            dist_squared_truck = [(x_front[j] - x) ** 2 + (y_front[j] - y) ** 2
+                            for x, y in zip(path_x, path_y)]
+            I_min_truck = np.argmin(dist_squared_truck)
+            truck_mindist = path_index.cross_track_error(x_front[j], y_front[j], I_min_truck)
 
-    for j in range(len(x_front)):
-        state_1 = [x_front[j], y_front[j], 0, th1[j], th2[j]]
-        dist_squared_truck = [(x_front[j] - x) ** 2 + (y_front[j] - y) ** 2
-                        for x, y in zip(path_x, path_y)]
-        I_min_truck = np.argmin(dist_squared_truck)
-        truck_mindist, _ = calc_path_error(state_1, path_x, path_y, I_min_truck)
+            x_trail = x_front[j] - (P['l1'] - P['c']) * cos(th1[j]) - (P['l2']) * cos(th2[j])
+            y_trail = y_front[j] - (P['l1'] - P['c']) * sin(th1[j]) - (P['l2']) * sin(th2[j])
+            dist_squared_trail = [(x_trail - x) ** 2 + (y_trail - y) ** 2
+                                  for x, y in zip(path_x, path_y)]
+            I_min_trail = np.argmin(dist_squared_trail)
+            trail_mindist = path_index.cross_track_error(x_trail, y_trail, I_min_trail)
 
-        x_trail = x_front[j] - (P['l1'] - P['c']) * cos(th1[j]) - (P['l2']) * cos(th2[j])
-        y_trail = y_front[j] - (P['l1'] - P['c']) * sin(th1[j]) - (P['l2']) * sin(th2[j])
-        state_2 = [x_trail, y_trail, 0, th1[j], th2[j]]
-        dist_squared_trail = [(x_trail - x) ** 2 + (y_trail - y) ** 2
-                              for x, y in zip(path_x, path_y)]
-        I_min_trail = np.argmin(dist_squared_trail)
-        trail_mindist, _ = calc_path_error(state_2, path_x, path_y, I_min_trail)
-
-        truck_mindist_mat.append(truck_mindist)
-        trail_mindist_mat.append(trail_mindist)
+            truck_mindist_mat.append(truck_mindist)
+            trail_mindist_mat.append(trail_mindist)
 
     err_truck = np.square(truck_mindist_mat)
     sqrd_err_truck = np.sum(err_truck)
@@ -66,3 +84,101 @@ def calc_off_tracking(x_front, y_front, th1, th2, P, path_x, path_y):
 #    plt.show()
     
     return sqrd_err_truck + sqrd_err_trail, err_trail
+
+def off_tracking_errors(x_front, y_front, th1, th2, P, path_x, path_y):
+    '''
+    Vectorized signed off-tracking of the tractor front axle and the trailer
+    axle from a path. Works on one trajectory of shape (T,) or on many
+    trajectories along the same path stacked as (T,N), sharing the path's
+    PathIndex and KD-tree.
+
+    Inputs:
+        x_front, y_front: Front axle coordinates at each trajectory sample
+        th1, th2: Absolute orientations of the truck and trailer at each sample
+        P: Truck parameters
+        path_x, path_y: Coordinates of the points that discretize the path
+
+    Outputs:
+        truck_err: Signed tractor off-tracking, of the same shape as x_front
+        trail_err: Signed trailer off-tracking, of the same shape as x_front
+    '''
+    path_index = get_path_index(path_x, path_y)
+    x_front = np.asarray(x_front, dtype=float)
+    y_front = np.asarray(y_front, dtype=float)
+    th1 = np.asarray(th1, dtype=float)
+    th2 = np.asarray(th2, dtype=float)
+    x_trail = x_front - (P['l1'] - P['c']) * cos(th1) - (P['l2']) * cos(th2)
+    y_trail = y_front - (P['l1'] - P['c']) * sin(th1) - (P['l2']) * sin(th2)
+    I_min_truck = path_index.nearest_point_indices(x_front, y_front)
+    I_min_trail = path_index.nearest_point_indices(x_trail, y_trail)
+    truck_err = path_index.cross_track_errors(x_front, y_front, I_min_truck)
+    trail_err = path_index.cross_track_errors(x_trail, y_trail, I_min_trail)
+    return truck_err, trail_err
+
+class OffTrackingAccumulator(object):
+    def __init__(self, P, path_x, path_y, budget=None, check_every=50):
+        '''
+        Streaming version of calc_off_tracking. Trajectory samples are added one
+        at a time as a rollout runs, and the tractor and trailer squared
+        off-tracking sums are updated every check_every samples with the
+        vectorized off_tracking_errors. If a budget is given, update reports
+        when the running sum exceeds it so the rollout can be stopped early.
+
+        Inputs:
+            P: Truck parameters
+            path_x, path_y: Coordinates of the points that discretize the path
+            budget: Fitness above which the rollout can be abandoned, or None
+            check_every: Number of samples buffered between updates of the sums
+        '''
+        self.P = P
+        self.path_x = path_x
+        self.path_y = path_y
+        self.budget = budget
+        self.check_every = check_every
+        self.sqrd_err_truck = 0.0
+        self.sqrd_err_trail = 0.0
+        self.err_trail = []
+        self.n_samples = 0
+        self.exceeded = False
+        self._buffer = []
+
+    @property
+    def fitness(self):
+        '''
+        Sum squared off-tracking of the samples processed so far.
+        '''
+        return self.sqrd_err_truck + self.sqrd_err_trail
+
+    def update(self, x_front, y_front, th1, th2):
+        '''
+        Adds one trajectory sample.
+
+        Outputs:
+            False once the running fitness has exceeded the budget, True otherwise
+        '''
+        self._buffer.append((x_front, y_front, th1, th2))
+        self.n_samples += 1
+        if len(self._buffer) >= self.check_every:
+            self._flush()
+        return not self.exceeded
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        x_front, y_front, th1, th2 = np.array(self._buffer).T
+        self._buffer = []
+        truck_err, trail_err = off_tracking_errors(x_front, y_front, th1, th2, self.P, self.path_x, self.path_y)
+        self.sqrd_err_truck += np.sum(np.square(truck_err))
+        self.sqrd_err_trail += np.sum(np.square(trail_err))
+        self.err_trail.extend(np.square(trail_err))
+        if self.budget is not None and self.fitness > self.budget:
+            self.exceeded = True
+
+    def result(self):
+        '''
+        Processes any buffered samples and returns the same outputs as
+        calc_off_tracking for the samples added so far. If the rollout was
+        stopped early, the fitness is a lower bound on that of the full rollout.
+        '''
+        self._flush()
+        return self.fitness, np.array(self.err_trail)
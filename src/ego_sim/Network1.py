@@ -19,6 +19,8 @@ import matplotlib.pyplot as plt
 from evolutionary_algorithm import EvolutionaryAlgorithm
 from Min_dist_test import calc_off_tracking
 import test_suite
+from torch_ego_sim import closed_loop_rollout
+from baseline_cache import pid_baseline_fitness
 import pickle
 
 class Net2(nn.Module):
@@ -225,6 +227,25 @@ def train_network(network,k_crosstrack,k_heading):
     plt.ylabel('Y Location, (m)')
     plt.show()
     
+def train_network_through_dynamics(network,num_iterations=50,num_paths=8,end_time=10,learning_rate=1e-4):
+    '''
+    Trains the network by backpropagating the closed-loop off-tracking of batches
+    of random paths through the differentiable truck-trailer simulation.
+    '''
+    rpg = RandomPathGenerator()
+    network = network.float()
+    for i in range(num_iterations):
+        paths = [rpg.get_harder_path(end_time=end_time) for j in range(num_paths)]
+        network.zero_grad()
+        loss = closed_loop_rollout(network,paths).mean()
+        loss.backward()
+        # Gradients through long rollouts can be large; limit the step size
+        torch.nn.utils.clip_grad_norm_(network.parameters(),1.0)
+        for f in network.parameters():
+            f.data.sub_(f.grad.data * learning_rate)
+        print('[%5d] loss: %.3f' % (i + 1, loss.item()))
+    return network
+    
 def train_nn_from_pid(k_crosstrack = {'P':20, 'I':2, 'D':5}, 
               k_heading = {'P':-0.5, 'I':0, 'D':0}):
     network=Net2()
@@ -248,45 +269,32 @@ def test_network_on_benchmark(network,Benchmark):
     y_true= Benchmark[:,1]
     t= Benchmark[:,2]
     vel=Benchmark[:,3]
-    xp=[]
-    yp=[]
     x=[]
     y=[]
-    pid=StanleyPID()
     
-    #Run the same benchmark on both the PID controller and the PID mimicking network and compare  the two
-    for i in  range(2):
-        ego=EgoSim(sim_timestep = t[1]-t[0], world_state_at_front=True)
-        print('controller: ', i)
-        th1t=0
-        th2t=0
-        th1=[]
-        th2=[]
-        x_truck=[]
-        y_truck=[]
-        for j in range(len(t)):
-            if i == 1:
-                state = ego.convert_world_state_to_front()
-                ctrl_delta, ctrl_vel, err, interr, differr = pid.calc_steer_control(t[i],state,x_true,y_true, vel)
-                xt,yt,deltat,th1t,th2t = ego.simulate_timestep([ctrl_vel,ctrl_delta])
-                x_truck.append(xt)
-                y_truck.append(yt)
-                th1.append(th1t)
-                th2.append(th2t)
-                xp.append(xt); yp.append(yt)
-            else:
-                state = ego.convert_world_state_to_front()
-                ctrl_delta, ctrl_vel, err, interr, differr = controller.calc_steer_control(t[i],state,x_true,y_true, vel, th1t-th2t, network)
-                xt,yt,deltat,th1t,th2t = ego.simulate_timestep([ctrl_vel,ctrl_delta])
-                x_truck.append(xt)
-                y_truck.append(yt)
-                th1.append(th1t)
-                th2.append(th2t)
-                x.append(xt); y.append(yt);
-        if i == 1:
-            pid_fitness, CTerr =calc_off_tracking(x_truck, y_truck, th1, th2, ego.P, x_true, y_true)
-        else:
-            controller_fitness, CTerr = calc_off_tracking(x_truck, y_truck, th1, th2, ego.P, x_true, y_true)
+    #The PID controller's run on the benchmark is only simulated if it is not in the baseline cache
+    pid_fitness, pid_states = pid_baseline_fitness(x_true,y_true,t,vel,return_states=True)
+    xp = pid_states[:,0]
+    yp = pid_states[:,1]
+    #Run the same benchmark on the PID mimicking network and compare it to the PID controller
+    ego=EgoSim(sim_timestep = t[1]-t[0], world_state_at_front=True)
+    print('controller: ', 0)
+    th1t=0
+    th2t=0
+    th1=[]
+    th2=[]
+    x_truck=[]
+    y_truck=[]
+    for j in range(len(t)):
+        state = ego.convert_world_state_to_front()
+        ctrl_delta, ctrl_vel, err, interr, differr = controller.calc_steer_control(t[j],state,x_true,y_true, vel, th1t-th2t, network)
+        xt,yt,deltat,th1t,th2t = ego.simulate_timestep([ctrl_vel,ctrl_delta])
+        x_truck.append(xt)
+        y_truck.append(yt)
+        th1.append(th1t)
+        th2.append(th2t)
+        x.append(xt); y.append(yt);
+    controller_fitness, CTerr = calc_off_tracking(x_truck, y_truck, th1, th2, ego.P, x_true, y_true)
     print('Benchmark PID fitness: ', pid_fitness)
     print('Benchmark controller fitness: ', controller_fitness)
     plt.plot(x,y)
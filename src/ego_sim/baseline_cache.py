@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 21:05:37 2026
+
+@author: Zeke
+"""
+import os
+import pickle
+import hashlib
+from ego_sim import EgoSim
+from truck_params import TruckParams
+from stanley_pid import StanleyPID
+from rollout import MultiRateScheduler
+from Min_dist_test import calc_off_tracking
+from fitness_memo import hash_arrays
+from lru_cache import LRUCache
+
+class BaselineFitnessCache(LRUCache):
+    def __init__(self,maxsize=256,filename=None):
+        '''
+        Least-recently-used cache of StanleyPID baseline results, keyed on the
+        contents of the path, the PID gains and the truck parameters (see
+        baseline_key). Each entry is (fitness, world_states), where
+        world_states may be None if only the fitness was recorded.
+
+        Inputs:
+            maxsize: Maximum number of entries kept; the least recently used
+                entry is evicted when the cache is full.
+            filename: Optional pickle file the cache is loaded from, if it
+                exists, and written to by save.
+        '''
+        super(BaselineFitnessCache, self).__init__(maxsize)
+        self.filename = filename
+        if filename is not None and os.path.exists(filename):
+            self.load(filename)
+
+    def save(self,filename=None):
+        '''
+        Writes the entries to filename, or to the cache's own file if not given.
+        '''
+        filename = filename if filename is not None else self.filename
+        if filename is None:
+            raise ValueError('No file given to save the baseline cache to')
+        with open(filename,'wb') as f:
+            pickle.dump(list(self.entries.items()),f)
+
+    def load(self,filename):
+        '''
+        Adds the entries saved in filename to the cache.
+        '''
+        with open(filename,'rb') as f:
+            for key, entry in pickle.load(f):
+                self.put(key,entry)
+
+# Shared by the evolutionary algorithm, the test suite and the benchmarks
+BASELINE_CACHE = BaselineFitnessCache()
+
+def baseline_key(x_true,y_true,t,vel,k_crosstrack=None,k_heading=None,P=None):
+    '''
+    Returns the cache key of a PID baseline run: a hash of the path arrays,
+    the PID gains and the truck parameters. Gains and parameters default to
+    those of StanleyPID() and TruckParams().
+    '''
+    pid = StanleyPID()
+    k_crosstrack = k_crosstrack if k_crosstrack is not None else pid.k_ct
+    k_heading = k_heading if k_heading is not None else pid.k_hd
+    P = P if P is not None else TruckParams()
+    digest = hashlib.sha1(hash_arrays(x_true,y_true,t,vel).encode())
+    gains = (sorted(k_crosstrack.items()),sorted(k_heading.items()))
+    digest.update(repr((gains,P.values_tuple())).encode())
+    return digest.hexdigest()
+
+def pid_baseline_rollout(x_true,y_true,t,vel,k_crosstrack=None,k_heading=None,P=None):
+    '''
+    Simulates a new StanleyPID along the path, updating the controller at
+    every path sample, and returns (fitness, world_states) as computed by
+    calc_off_tracking and MultiRateScheduler.run.
+    '''
+    pid = StanleyPID()
+    if k_crosstrack is not None:
+        pid.k_ct = k_crosstrack
+    if k_heading is not None:
+        pid.k_hd = k_heading
+    ego = EgoSim(sim_timestep = t[1]-t[0], world_state_at_front=True)
+    if P is not None:
+        ego.P = P.copy()
+    world_states, _ = MultiRateScheduler(ego.sim_timestep).run(pid,t,x_true,y_true,vel,ego=ego)
+    x, y, delta, th1, th2 = world_states.T
+    fitness, _ = calc_off_tracking(x, y, th1, th2, ego.P, x_true, y_true)
+    return fitness, world_states
+
+def pid_baseline_fitness(x_true,y_true,t,vel,k_crosstrack=None,k_heading=None,P=None,
+                         cache=None,return_states=False):
+    '''
+    Returns the StanleyPID baseline fitness on a path, simulating it only if
+    the same path, gains and truck parameters are not already in the cache.
+
+    Inputs:
+        x_true, y_true, t, vel: Path coordinates, sample times and velocities
+        k_crosstrack, k_heading: PID gains; StanleyPID's defaults if not given
+        P: TruckParams of the truck; EgoSim's defaults if not given
+        cache: BaselineFitnessCache to use; the shared BASELINE_CACHE if not given
+        return_states: If True, the baseline's world states are returned as well
+
+    Outputs:
+        fitness, or (fitness, world_states) if return_states is set
+    '''
+    cache = cache if cache is not None else BASELINE_CACHE
+    key = baseline_key(x_true,y_true,t,vel,k_crosstrack,k_heading,P)
+    entry = cache.get(key)
+    if entry is None or (return_states and entry[1] is None):
+        entry = pid_baseline_rollout(x_true,y_true,t,vel,k_crosstrack,k_heading,P)
+        cache.put(key,entry)
+    if return_states:
+        return entry
+    return entry[0]
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 09:12:44 2026
+
+@author: Zeke
+"""
+import numpy as np
+from ego_sim import EgoSim, SystemMatrixCache, wrap_angles_to_pi
+
+class BatchEgoSim(object):
+    def __init__(self,n_vehicles=None,sim_timestep=0.02,world_state_at_front=False,
+                 vehicles=None,cache=None):
+        '''
+        Initialization function. BatchEgoSim simulates N truck-trailer rigs at
+        the constant timestep sim_timestep, advancing all of them with batched
+        matrix operations. Each rig may have its own velocity, steer command and
+        parameter set. Rigs are always propagated with the exact zero-order-hold
+        discretization used by EgoSim's 'zoh' propagator.
+
+        Inputs:
+            n_vehicles: Number of rigs to simulate with the default truck
+                parameters. Ignored if vehicles is given.
+            sim_timestep: Simulation timestep to be used, in seconds
+            world_state_at_front: dictates whether the simulation output state
+                is given in coordinates at the truck's front axle (if True) or
+                at the truck's center of gravity (if False).
+            vehicles: Optional list of EgoSim objects whose parameters (P, M and B)
+                define each rig, e.g. after calling modify_parameters on them.
+            cache: SystemMatrixCache shared by all rigs; a new cache is created
+                if not given.
+        '''
+        if vehicles is None:
+            if n_vehicles is None:
+                raise ValueError('Either n_vehicles or vehicles must be given')
+            vehicles = [EgoSim(sim_timestep=sim_timestep) for i in range(n_vehicles)]
+        self.cache = cache if cache is not None else SystemMatrixCache()
+        # The per-rig EgoSim objects are only used as parameter holders and to
+        # look up system matrices; they all share the batch's cache and timestep
+        for vehicle in vehicles:
+            vehicle.sim_timestep = sim_timestep
+            vehicle.cache = self.cache
+        self.vehicles = vehicles
+        self.n = len(vehicles)
+        self.sim_timestep = sim_timestep
+        self.world_state_at_front = world_state_at_front
+        self.world_state = np.zeros((self.n,5))
+        self.truck_state = np.zeros((self.n,4))
+        self.sim_time = 0
+        # Stacked discrete propagators and the velocities they were computed for
+        self.Ad = np.zeros((self.n,4,4))
+        self.Bd = np.zeros((self.n,4))
+        self.a1 = np.zeros(self.n)
+        self.propagator_vel = np.full(self.n,np.nan)
+        self.update_parameters()
+
+    def modify_parameters(self,idx,**alphas):
+        '''
+        Modifies loading conditions and tire stiffness of the rig at index idx.
+        Keyword arguments are passed on to EgoSim.modify_parameters.
+        '''
+        self.vehicles[idx].modify_parameters(**alphas)
+        self.update_parameters()
+
+    def update_parameters(self):
+        '''
+        Forces the per-rig propagators to be recomputed. Must be called after
+        the parameters of any of the rigs in self.vehicles are changed directly.
+        '''
+        self.a1 = np.array([vehicle.P['a1'] for vehicle in self.vehicles])
+        self.propagator_vel[:] = np.nan
+
+    def simulate_timestep(self,ctrl):
+        '''
+        Simulates all rigs for a single timestep, using the saved truck states
+        as the initial conditions.
+
+        Inputs:
+            ctrl: Numpy array of shape (N,2) with the control velocity of each rig
+                in the first column and control steer tire angle (radians) in the
+                second.
+
+        Outputs:
+            Rigs' states in world coordinates as a Numpy array of shape (N,5),
+                either at the front axle (if self.world_state_at_front is True)
+                or at the truck center of gravity (if False)
+        '''
+        ctrl = np.asarray(ctrl,dtype=float)
+        u1 = ctrl[:,0]
+        delta = ctrl[:,1]
+        # Only look up propagators for rigs whose velocity changed
+        changed = np.flatnonzero(u1 != self.propagator_vel)
+        for i in changed:
+            _, _, self.Ad[i], self.Bd[i] = self.vehicles[i].get_system_matrices(u1[i])
+            self.propagator_vel[i] = u1[i]
+        # x[k+1] = Ad*x[k] + Bd*delta[k] for all rigs at once
+        self.truck_state = np.einsum('nij,nj->ni',self.Ad,self.truck_state) + self.Bd*delta[:,None]
+        self.update_world_state(ctrl)
+        self.sim_time += self.sim_timestep
+
+        if self.world_state_at_front:
+            return self.convert_world_state_to_front()
+        else:
+            return self.world_state
+
+    def update_world_state(self,ctrl):
+        '''
+        Updates the world states by integrating the values found in the truck
+        states. Vectorized equivalent of EgoSim.update_world_state.
+
+        Inputs:
+            ctrl: Numpy array of shape (N,2) with the control velocity in the first
+                column and control steer angle (radians) in the second.
+        '''
+        ws = self.world_state
+        ts = self.truck_state
+        dt = self.sim_timestep
+        # Integrate theta1dot
+        ws[:,3] += ts[:,1]*dt
+        # Rotate truck-frame velocity [u1, v1] into the world frame and travel
+        # along it for the time step
+        cos_th = np.cos(ws[:,3])
+        sin_th = np.sin(ws[:,3])
+        ws[:,0] += (cos_th*ctrl[:,0] - sin_th*ts[:,0])*dt
+        ws[:,1] += (sin_th*ctrl[:,0] + cos_th*ts[:,0])*dt
+        # Absolute orientation of the trailer
+        ws[:,4] = ws[:,3] + ts[:,3]
+        # Output steer angle
+        ws[:,2] = ctrl[:,1]
+        ws[:,3] = wrap_angles_to_pi(ws[:,3])
+        ws[:,4] = wrap_angles_to_pi(ws[:,4])
+        ts[:,3] = wrap_angles_to_pi(ts[:,3])
+
+    def convert_world_state_to_front(self):
+        '''
+        Outputs the world states with the truck coordinate frame placed on the
+        front axle rather than the truck's center of gravity. Does not modify
+        the world state in memory.
+        '''
+        state = self.world_state.copy()
+        state[:,0] += self.a1*np.cos(state[:,3])
+        state[:,1] += self.a1*np.sin(state[:,3])
+        return state
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 13:41:52 2026
+
+@author: Zeke
+"""
+import gc
+import sys
+import time
+import tracemalloc
+import warnings
+import numpy as np
+from ego_sim import EgoSim
+import geometry
+
+def allocations_per_step(step, n_steps=1000, n_warmup=10):
+    '''
+    Measures the memory allocated inside each call of a step function, with
+    the garbage collector disabled so that only the step's own allocations
+    are seen. Around every step, sys.getallocatedblocks gives the change in
+    the number of live memory blocks, and the tracemalloc peak gives the
+    bytes allocated during the step, even if they were freed before it
+    returned.
+    
+    Inputs:
+        step: Function taking the step index, called once per step.
+        n_steps: Number of measured steps.
+        n_warmup: Number of steps run before measuring, e.g. to fill caches.
+        
+    Outputs:
+        Dictionary with the mean net number of memory blocks allocated per
+        step, the mean and maximum bytes allocated within a step, and the
+        number of steps that allocated any memory at all.
+    '''
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    blocks = np.zeros(n_warmup + n_steps, dtype=np.int64)
+    step_bytes = np.zeros(n_warmup + n_steps, dtype=np.int64)
+    tracemalloc.start()
+    try:
+        # The warmup steps go through the same measurement, so that one-off
+        # allocations of the measurement itself are not counted either
+        for i in range(n_warmup + n_steps):
+            start_blocks = sys.getallocatedblocks()
+            current = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            step(i)
+            peak = tracemalloc.get_traced_memory()[1]
+            blocks[i] = sys.getallocatedblocks() - start_blocks
+            step_bytes[i] = peak - current
+    finally:
+        tracemalloc.stop()
+        if gc_enabled:
+            gc.enable()
+    blocks = blocks[n_warmup:]
+    step_bytes = step_bytes[n_warmup:]
+    return {'blocks_per_step': blocks.mean(), 'bytes_per_step': step_bytes.mean(),
+            'max_bytes_per_step': int(step_bytes.max()),
+            'allocating_steps': int(np.count_nonzero((blocks != 0) | (step_bytes != 0)))}
+
+def time_per_step(step, n_steps=1000, n_warmup=10):
+    '''
+    Returns the mean wall-clock time of a step function, in seconds.
+    '''
+    for i in range(n_warmup):
+        step(i)
+    start = time.perf_counter()
+    for i in range(n_steps):
+        step(n_warmup + i)
+    return (time.perf_counter() - start)/n_steps
+
+def simulate_timestep_benchmark(n_steps=5000):
+    '''
+    Reports allocations and time per step of EgoSim.simulate_timestep at
+    constant velocity, with and without a caller-provided output buffer, and
+    checks that the buffer path allocates no memory at all per step.
+    '''
+    ctrl = [25.0, 0.0]
+    # Python floats, so that reading the steer angle allocates nothing
+    steer = (0.05*np.sin(np.arange(n_steps + 10)/50.0)).tolist()
+    for name, use_buffer in [('new output array', False), ('output buffer', True)]:
+        ego = EgoSim(world_state_at_front=True)
+        out = np.zeros(5) if use_buffer else None
+        def step(i):
+            ctrl[1] = steer[i]
+            ego.simulate_timestep(ctrl, out=out)
+        alloc = allocations_per_step(step, n_steps)
+        elapsed = time_per_step(step, n_steps)
+        print('simulate_timestep ({}): {:.2f} us/step, {:.3f} blocks/step, '
+              '{:.1f} bytes/step allocated (max {}), {} of {} steps allocating'.format(
+                      name, elapsed*1e6, alloc['blocks_per_step'],
+                      alloc['bytes_per_step'], alloc['max_bytes_per_step'],
+                      alloc['allocating_steps'], n_steps))
+        if use_buffer:
+            assert alloc['allocating_steps'] == 0, \
+                'simulate_timestep allocated memory with an output buffer'
+        
+# Previous implementations of the geometry kernels, as they were duplicated in
+# each controller module, with Numpy operations on 2-element arrays; kept as
+# the benchmark reference.
+
+def _numpy_calc_path_error(state,path_x,path_y,I_min):
+    '''
+    calc_path_error as previously implemented in stanley_pid.
+    '''
+    closest_pt = np.array([path_x[I_min],path_y[I_min]])
+    if I_min > 0:
+        closest_pt_rev = np.array([path_x[I_min-1],path_y[I_min-1]])
+    else:
+        closest_pt_rev = closest_pt
+    if I_min < len(path_x)-1:
+        closest_pt_fwd = np.array([path_x[I_min+1],path_y[I_min+1]])
+    else:
+        closest_pt_fwd = closest_pt
+    ct_error = _numpy_path_distance(closest_pt_rev, closest_pt, closest_pt_fwd, np.array([state[0],state[1]]))
+    tan_vec = closest_pt_fwd - closest_pt_rev
+    path_angle = np.arctan2(tan_vec[1],tan_vec[0])
+    heading_error = _numpy_wrap_to_pi(state[3] - path_angle)
+    return ct_error, heading_error
+
+def _numpy_path_distance(path_pt_rev, path_pt, path_pt_fwd, cur_point):
+    '''
+    path_distance as previously implemented in each controller module.
+    '''
+    dist_rev = _numpy_minimum_distance(path_pt_rev, path_pt, cur_point)
+    dist_fwd = _numpy_minimum_distance(path_pt, path_pt_fwd, cur_point)
+    if abs(dist_rev) < abs(dist_fwd):
+        return dist_rev
+    else:
+        return dist_fwd
+
+def _numpy_minimum_distance(v,w,p):
+    '''
+    minimum_distance as previously implemented in each controller module.
+    '''
+    proj = _numpy_project_point_on_segment(v,w,p)
+    if np.array_equal(v,w):
+        return np.sqrt((p[0]-proj[0])**2 + (p[1]-proj[1])**2)
+    else:
+        return np.cross(p-proj, (w-v)/np.linalg.norm(w-v))
+
+def _numpy_project_point_on_segment(v, w, p):
+    '''
+    project_point_on_segment as previously implemented in each controller module.
+    '''
+    length_sq = (v[0]-w[0])**2 + (v[1]-w[1])**2
+    if length_sq == 0:
+        return v
+    else:
+        t = np.max([0, np.min([1, np.dot(p-v,w-v)/length_sq])])
+        return v + t*(w-v)
+
+def _numpy_wrap_to_pi(angle):
+    '''
+    wrap_to_pi as previously implemented in each controller module.
+    '''
+    wrap = np.remainder(angle, 2*np.pi)
+    if abs(wrap) > np.pi:
+        wrap -= 2*np.pi * np.sign(wrap)
+    return wrap
+
+def geometry_benchmark(n_calls=20000, tolerance=1e-9):
+    '''
+    Reports the per-call latency of the geometry kernels: the previous Numpy
+    implementation on 2-element arrays, the scalar fast path on Python floats,
+    and the vectorized form evaluated on n_calls points at once (time per point).
+    Also checks that the three give the same values, to within tolerance.
+    '''
+    rng = np.random.default_rng(0)
+    v = rng.normal(0,10,(n_calls,2))
+    w = v + rng.normal(0,1,(n_calls,2))
+    # Include zero-length segments, which take a separate branch
+    w[::100] = v[::100]
+    u = w + rng.normal(0,1,(n_calls,2))
+    p = v + rng.normal(0,3,(n_calls,2))
+    angles = rng.normal(0,10,n_calls)
+    path = np.cumsum(rng.normal(0,1,(200,2)),axis=0)
+    path_x, path_y = path[:,0], path[:,1]
+    I_min = rng.integers(0,len(path),n_calls)
+    states = np.column_stack((path[I_min] + rng.normal(0,1,(n_calls,2)),
+                              rng.normal(0,0.1,n_calls), rng.normal(0,4,(n_calls,2))))
+    as_lists = lambda *arrays: list(zip(*[array.tolist() for array in arrays]))
+    path_calls = lambda states: [(state, path_x, path_y, int(i)) for state, i in zip(states,I_min)]
+    calc_path_errors = lambda *args: np.stack(geometry.calc_path_errors(*args),axis=-1)
+    # Kernel name, previous, scalar and vectorized implementations, arguments
+    # of each call of the previous and scalar ones, and vectorized arguments
+    kernels = [
+            ('calc_path_error', _numpy_calc_path_error, geometry.calc_path_error, calc_path_errors,
+             path_calls(states), path_calls(states.tolist()), (states,path_x,path_y,I_min)),
+            ('path_distance', _numpy_path_distance, geometry.path_distance, geometry.path_distances,
+             list(zip(v,w,u,p)), as_lists(v,w,u,p), (v,w,u,p)),
+            ('minimum_distance', _numpy_minimum_distance, geometry.minimum_distance,
+             geometry.minimum_distances, list(zip(v,w,p)), as_lists(v,w,p), (v,w,p)),
+            ('project_point_on_segment', _numpy_project_point_on_segment,
+             geometry.project_point_on_segment, geometry.project_points_on_segments,
+             list(zip(v,w,p)), as_lists(v,w,p), (v,w,p)),
+            ('wrap_to_pi', _numpy_wrap_to_pi, geometry.wrap_to_pi, geometry.wrap_angles_to_pi,
+             [(angle,) for angle in angles], [(angle,) for angle in angles.tolist()], (angles,))]
+    results = {}
+    for name, reference, scalar, vectorized, calls, list_calls, args in kernels:
+        with warnings.catch_warnings():
+            # np.cross on 2-element vectors is deprecated in Numpy 2
+            warnings.simplefilter('ignore', DeprecationWarning)
+            start = time.perf_counter()
+            out_reference = [reference(*call) for call in calls]
+            t_reference = (time.perf_counter() - start)/n_calls
+        start = time.perf_counter()
+        out_scalar = [scalar(*call) for call in list_calls]
+        t_scalar = (time.perf_counter() - start)/n_calls
+        start = time.perf_counter()
+        out_vectorized = vectorized(*[arg.copy() for arg in args])
+        t_vectorized = (time.perf_counter() - start)/n_calls
+        out_reference = np.array(out_reference, dtype=float)
+        max_diff = max(np.max(np.abs(out_reference - np.array(out_scalar, dtype=float))),
+                       np.max(np.abs(out_reference - out_vectorized)))
+        print('{}: numpy {:.2f} us/call, scalar {:.2f} us/call, vectorized {:.3f} us/point, '
+              'max difference {:.1e}'.format(name, t_reference*1e6, t_scalar*1e6,
+                                             t_vectorized*1e6, max_diff))
+        assert max_diff <= tolerance, '{} differs from the previous implementation'.format(name)
+        results[name] = (t_reference, t_scalar, t_vectorized)
+    return results
+        
+def net2_inference_benchmark(n_calls=5000):
+    '''
+    Reports the per-call latency of evaluating a Net2 neurocontroller as
+    NN2Control did before (a new torch tensor per call, then conversion back
+    through Numpy), through torch without autograd, and with the Numpy and
+    pure-Python Net2Inference backends. Also reports the largest difference
+    from the torch output.
+    '''
+    import torch
+    from Network1 import Net2
+    from net2_inference import Net2Inference
+    network = Net2().float()
+    rng = np.random.default_rng(0)
+    inputs = (rng.normal(0,1,(n_calls,6))*[1,0.5,10,1,5,0.2] + [0,0,20,0,0,0]).tolist()
+    def torch_autograd(x):
+        return float(network(torch.tensor(x)).data.numpy()[0])
+    def torch_no_grad(x):
+        with torch.no_grad():
+            return network(torch.tensor(x)).item()
+    candidates = [('torch (previous)', torch_autograd), ('torch no_grad', torch_no_grad)]
+    for backend in ('numpy','python'):
+        candidates.append(('Net2Inference ' + backend, Net2Inference.from_network(network,backend=backend).predict))
+    reference = [torch_autograd(x) for x in inputs]
+    results = {}
+    for name, predict in candidates:
+        start = time.perf_counter()
+        out = [predict(x) for x in inputs]
+        elapsed = (time.perf_counter() - start)/n_calls
+        max_diff = np.max(np.abs(np.subtract(out,reference)))
+        print('{}: {:.2f} us/call, max difference {:.1e}'.format(name, elapsed*1e6, max_diff))
+        results[name] = elapsed
+    return results
+
+def optimizer_benchmark(n_generations=20, n_paths=2, sigma=0.3, seed=0):
+    '''
+    Reports best fitness against wall-clock time for the EvolutionaryAlgorithm,
+    CMAES and OpenAIES optimizers, all started from the same random Net2 and
+    evaluated on the same fixed set of n_paths random paths with fixed seeds.
+    The EvolutionaryAlgorithm's initial evaluation in its constructor is not
+    timed. Returns each optimizer's run_optimizer history.
+    '''
+    import torch
+    from Network1 import Net2
+    from net2_inference import network_to_vector
+    from evolutionary_algorithm import EvolutionaryAlgorithm, ScenarioFitness, draw_scenarios
+    from optimizers import CMAES, OpenAIES, run_optimizer
+    torch.manual_seed(seed)
+    np.random.seed(seed)
+    network = Net2().float()
+    evaluate = ScenarioFitness(draw_scenarios(n_paths))
+    params = network_to_vector(network)
+    print('Initial fitness: {:.1f}'.format(evaluate(params)[0]))
+    optimizers = [('EvolutionaryAlgorithm', lambda: EvolutionaryAlgorithm(network)),
+                  ('CMAES', lambda: CMAES(params,sigma=sigma,seed=seed)),
+                  ('OpenAIES', lambda: OpenAIES(params,sigma=sigma,popsize=20,learning_rate=0.1,seed=seed))]
+    results = {}
+    for name, make_optimizer in optimizers:
+        np.random.seed(seed)
+        history = run_optimizer(make_optimizer(),evaluate,n_generations)
+        print(name)
+        # Every few generations, and the last one if the stride missed it
+        shown = list(range(0,len(history),max(1,n_generations//5)))
+        if shown and shown[-1] != len(history)-1:
+            shown.append(len(history)-1)
+        for elapsed, n_evaluations, best_fitness in [history[i] for i in shown]:
+            print('  {:6.2f} s, {:4d} candidates: best fitness {:.1f}'.format(elapsed, n_evaluations, best_fitness))
+        results[name] = history
+    return results
+        
+if __name__ == "__main__":
+    simulate_timestep_benchmark()
+    geometry_benchmark()
+    net2_inference_benchmark()
+    optimizer_benchmark()
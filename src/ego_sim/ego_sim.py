@@ -7,11 +7,19 @@ Created on Sat Oct 19 16:43:57 2019
 """
 import numpy as np
 from scipy.integrate import odeint
+from scipy.linalg import expm
 from scipy import interpolate
-import copy
+import math
+from truck_params import TruckParams, DEFAULTS
+from geometry import wrap_to_pi, wrap_angles_to_pi
+from lru_cache import LRUCache
 
 class EgoSim(object):
-    def __init__(self,sim_timestep=0.02,world_state_at_front=False):
+    # Size of the array returned by snapshot
+    SNAPSHOT_SIZE = 10
+    
+    def __init__(self,sim_timestep=0.02,world_state_at_front=False,propagator='zoh',
+                 cache=None,velocity_quantum=1e-6):
         '''
         Initialization function. EgoSim simulates at constant timesteps given by
         sim_timestep. 
@@ -21,69 +29,78 @@ class EgoSim(object):
             world_state_at_front: dictates whether the simulation output state
                 is given in coordinates at the truck's front axle (if True) or 
                 at the truck's center of gravity (if False).
+            propagator: method used to advance the truck state over a timestep.
+                'zoh' uses the exact zero-order-hold discretization of the
+                linear model (control held constant over the timestep); 'odeint'
+                integrates the model numerically and is kept as a reference.
+            cache: SystemMatrixCache used to store the system matrices and their
+                discretizations. May be shared between EgoSim objects; a new
+                cache is created if not given.
+            velocity_quantum: Resolution (m/s) to which the control velocity is
+                rounded when looking up and computing cached system matrices.
         '''
+        if propagator not in ('zoh','odeint'):
+            raise ValueError("propagator must be 'zoh' or 'odeint', got {}".format(propagator))
         self.init = False
         self.set_default_truck_params()
         self.world_state = np.zeros(5)
         self.truck_state = np.zeros(4)
-        self.M = self.calculate_mass_matrix()
-        self.B = np.array([self.P['C1'],self.P['a1']*self.P['C1'],0,0])
+        # Work buffers for the allocation-free timestep
+        self._next_truck_state = np.zeros(4)
+        self._input_term = np.zeros(4)
+        self._steer = np.zeros(())
         self.sim_time = 0
         self.sim_timestep = sim_timestep
         self.world_state_at_front = world_state_at_front
+        self.propagator = propagator
+        self.cache = cache if cache is not None else SystemMatrixCache()
+        self.velocity_quantum = velocity_quantum
+        # System matrices of the last lookup and what they were computed for
+        self.system_matrices = None
+        self.system_vel = np.nan
+        self.system_params = None
+        self.system_params_version = -1
+        self.system_timestep = None
         
     def set_default_truck_params(self):
         '''
         Default parameters to be used for the simulation. Run at initialization.
         If other parameters are desired, the corresponding entries in the P
-        dictionary for the EgoSim object may be overwritten.
-        '''
-        P = {'m1': 9159.63, # Mass of the truck, kg
-               'I1': 55660.3, # Inertia of the truck, kg*m^2
-               'm2': 27091.8, # Mass of the trailer, kg
-               'I2': 386841, # INertia of the trailer, kg*m^2
-               'a1': 2.43264, # Distance from truck COG to front axle, m
-               'c': 0.2286, # Firth-wheel offset from truck drive axle virtual center, m
-               'l1': 5.7404, # Wheelbase from truck front axle to drive axle virtual center, m
-               'l2': 16.104-0.914-3.083-1.2446/2, # Distance from trailer axle to fifth wheel, m
-               'a2': 5.9336, # Distance from fifth wheel to trailer COG, m
-               'h1': 3.0792, # Distance from truck COG to fifth wheel, m
-               'b1': 3.3078, # Distance from truck COG to drive axle virtual center, m
-               'b2': 5.5511, # Distance from trailer COG to trailer axle, m
-               'C1': 187020.2*2, # Sum of truck front axle cornering stiffness, N/rad
-               'C2': 130274.0*4, # Sum of truck's first drive axle cornering stiffness, N/rad
-               'C3': 130274.0*4, # Sum of truck's second drive axle cornering stiffness, N/rad
-               'C4': 115000.0*4, # Sum of trailer's first axle cornering stiffness, N/rad
-               'C5': 115000.0*4, # Sum of trailer's second drive axle cornering stiffness, N/rad
-               # The following parameters are used for visualization or more advanced collision checking only
-               'truck_width': 2.57,
-               'truck_str_ax2front': 1.295,
-               'truck_str_ax2rear': 7.275,
-               'trailer_width': 2.59,
-               'trailer_5th2front': 0.914,
-               'trailer_5th2rear': 16.104
-               }
-        P['Cs1'] = P['a1']*P['C1'] - P['b1']*(P['C2']+P['C3'])
-        P['Cq1'] = P['a1']**2*P['C1'] + P['b1']**2*(P['C2']+P['C3'])
-        self.P = P
+        parameter object for the EgoSim object may be overwritten; derived
+        quantities such as the mass matrix are then recomputed automatically.
+        '''
+        self.P = TruckParams()
+        
+    @property
+    def M(self):
+        '''
+        Mass matrix of the Luijten model for the current parameters.
+        '''
+        return self.P.M
+    
+    @property
+    def B(self):
+        '''
+        Steer input vector of the Luijten model for the current parameters.
+        '''
+        return self.P.B
         
     def modify_parameters(self,m1_alpha=1,m2_alpha=1,Csteer_alpha=1,Cdrive_alpha=1,Ctrailer_alpha=1,l2_alpha=1):
         '''
         Modifies loading conditions and tire stiffness for the truck and trailer.
         '''
-        self.P['m1'] = m1_alpha*9159.63
-        self.P['I1'] = m1_alpha*55660.3
-        self.P['m2'] = m2_alpha*27091.8
-        self.P['I2'] = m2_alpha*386841
-        self.P['C1'] = Csteer_alpha*187020.2*2
-        self.P['C2'] = Cdrive_alpha*130274.0*4
-        self.P['C3'] = Cdrive_alpha*130274.0*4
-        self.P['C4'] = Ctrailer_alpha*115000.0*4
-        self.P['C5'] = Ctrailer_alpha*115000.0*4
-        self.P['l2'] = l2_alpha*(16.104-0.914-3.083-1.2446/2)
-        self.P['a2'] = l2_alpha*5.9336
-        self.P['b2'] = l2_alpha*5.5511
-        
+        self.P['m1'] = m1_alpha*DEFAULTS['m1']
+        self.P['I1'] = m1_alpha*DEFAULTS['I1']
+        self.P['m2'] = m2_alpha*DEFAULTS['m2']
+        self.P['I2'] = m2_alpha*DEFAULTS['I2']
+        self.P['C1'] = Csteer_alpha*DEFAULTS['C1']
+        self.P['C2'] = Cdrive_alpha*DEFAULTS['C2']
+        self.P['C3'] = Cdrive_alpha*DEFAULTS['C3']
+        self.P['C4'] = Ctrailer_alpha*DEFAULTS['C4']
+        self.P['C5'] = Ctrailer_alpha*DEFAULTS['C5']
+        self.P['l2'] = l2_alpha*DEFAULTS['l2']
+        self.P['a2'] = l2_alpha*DEFAULTS['a2']
+        self.P['b2'] = l2_alpha*DEFAULTS['b2']
         
     def calculate_mass_matrix(self):
         '''
@@ -92,43 +109,121 @@ class EgoSim(object):
         Output:
             Mass matrix for linearized dynamic model, as a Numpy matrix.
         '''
-        P = self.P
-        M = np.matrix([[P['m1']+P['m2'], -P['m2']*(P['h1']+P['a2']),-P['m2']*P['a2'],0],\
-                  [-P['m2']*P['h1'], P['I1']+P['m2']*P['h1']*(P['h1']+P['a2']), P['m2']*P['h1']*P['a2'], 0],\
-                  [-P['m2']*P['a2'], P['I2']+P['m2']*P['a2']*(P['h1']+P['a2']), P['I2']+P['m2']*P['a2']**2, 0],\
-                  [0, 0, 0, 1]])
-        return M
+        return self.P.M
     
-    def simulate_timestep(self,ctrl):
+    def simulate_timestep(self,ctrl,out=None):
         '''
         Simulates the truck-trailer system for a single timestep, using the saved
-        truck state as the initial condition.
+        truck state as the initial condition. With the 'zoh' propagator and an
+        output buffer given, no memory is allocated per step once the system
+        matrices for the velocity are cached.
         
         Inputs:
             ctrl: Numpy array of shape (2,) with the control velocity in the first index
                 and control steer tire angle (radians) in the second.
+            out: Optional Numpy array of shape (5,) into which the output state
+                is written.
                 
         Outputs:
             Truck's state in world coordinates, either at the front axle (if
                 self.truck_state_at_front is True) or at the truck center of gravity
-                (if self.truck_state_at_front is False)
-        '''
-        # Craft the stiffness matrix
-        A = self.calculate_stiffness_matrix(ctrl)
-        # Define start and end solve time for this timestep
-        t = np.array([self.sim_time, self.sim_time + self.sim_timestep])
-        # Solve the system for this timestep
-        self.truck_state = odeint(canonical_ode,self.truck_state,t,args=(self.M,A,self.B,ctrl[1]))[-1]
+                (if self.truck_state_at_front is False). This is out if given;
+                otherwise a new array at the front axle, or self.world_state itself.
+        '''
+        # Look up the system matrices for this velocity; these are only
+        # recomputed when the velocity or truck parameters change
+        Ac, Bc, Ad, Bd = self.get_system_matrices(ctrl[0])
+        if self.propagator == 'odeint':
+            # Solve the system for this timestep
+            t = np.array([self.sim_time, self.sim_time + self.sim_timestep])
+            self.truck_state = odeint(linear_ode,self.truck_state,t,args=(Ac,Bc,ctrl[1]))[-1]
+        else:
+            # The model is linear in the truck state for a fixed velocity and
+            # steer angle, so the step is a single matrix-vector product,
+            # computed in preallocated buffers
+            # (the steer angle goes through a 0-d buffer, as multiplying by
+            # a Python scalar allocates a temporary array)
+            np.dot(Ad,self.truck_state,out=self._next_truck_state)
+            self._steer[()] = ctrl[1]
+            np.multiply(Bd,self._steer,out=self._input_term)
+            np.add(self._next_truck_state,self._input_term,out=self.truck_state)
         # Update the world state with the new truck state and update sim time
         self.update_world_state(ctrl)
-        self.sim_time = t[-1]
+        self.sim_time = self.sim_time + self.sim_timestep
         
         # Output the results either at the front axle coordinates or the truck C.O.G. coordinates.
         if self.world_state_at_front:
-            return self.convert_world_state_to_front()
+            return self.convert_world_state_to_front(out)
+        elif out is not None:
+            np.copyto(out,self.world_state)
+            return out
         else:
             return self.world_state
         
+    def simulate_trajectory(self,ctrl_sequence):
+        '''
+        Simulates the truck-trailer system open-loop over a whole sequence of
+        controls, starting from the saved truck state. The discrete propagator is
+        looked up once for each run of constant velocity in the sequence and the
+        world state is integrated for all timesteps at once.
+        
+        Inputs:
+            ctrl_sequence: Numpy array of shape (T,2) with the control velocity in
+                the first column and control steer tire angle (radians) in the second.
+                May be empty, in which case empty arrays are returned.
+                
+        Outputs:
+            world_states: Numpy array of shape (T,5) with the truck's state in world
+                coordinates after each timestep, at the front axle or center of
+                gravity as given by self.world_state_at_front
+            truck_states: Numpy array of shape (T,4) with the truck state after
+                each timestep
+        '''
+        ctrl_sequence = np.asarray(ctrl_sequence,dtype=float)
+        T = len(ctrl_sequence)
+        if T == 0:
+            # Nothing to simulate; the state is left unchanged
+            return np.zeros((0,5)), np.zeros((0,4))
+        vel = ctrl_sequence[:,0]
+        delta = ctrl_sequence[:,1]
+        truck_states = np.zeros((T,4))
+        world_states = np.zeros((T,5))
+        if self.propagator == 'odeint':
+            # Reference mode: step through the sequence one timestep at a time
+            for k in range(0,T):
+                self.simulate_timestep(ctrl_sequence[k])
+                world_states[k] = self.world_state
+                truck_states[k] = self.truck_state
+        else:
+            # Propagate the truck state through each run of constant velocity
+            run_starts = np.concatenate(([0],np.flatnonzero(np.diff(vel))+1))
+            run_ends = np.concatenate((run_starts[1:],[T]))
+            x = self.truck_state
+            for start, end in zip(run_starts,run_ends):
+                _, _, Ad, Bd = self.get_system_matrices(vel[start])
+                for k in range(start,end):
+                    x = np.dot(Ad,x) + Bd*delta[k]
+                    x[3] = wrap_to_pi(x[3])
+                    truck_states[k] = x
+            # Integrate theta1dot and travel along the world-frame velocity
+            dt = self.sim_timestep
+            theta1 = self.world_state[3] + np.cumsum(truck_states[:,1]*dt)
+            cos_th = np.cos(theta1)
+            sin_th = np.sin(theta1)
+            world_states[:,0] = self.world_state[0] + np.cumsum((cos_th*vel - sin_th*truck_states[:,0])*dt)
+            world_states[:,1] = self.world_state[1] + np.cumsum((sin_th*vel + cos_th*truck_states[:,0])*dt)
+            world_states[:,2] = delta
+            world_states[:,3] = wrap_angles_to_pi(theta1)
+            world_states[:,4] = wrap_angles_to_pi(theta1 + truck_states[:,3])
+            self.truck_state = x
+            self.world_state = world_states[-1].copy()
+            self.sim_time = self.sim_time + T*dt
+        
+        if self.world_state_at_front:
+            world_states[:,0] += self.P.a1*np.cos(world_states[:,3])
+            world_states[:,1] += self.P.a1*np.sin(world_states[:,3])
+        return world_states, truck_states
+        
     def calculate_stiffness_matrix(self,ctrl):
         '''
         Calculates the stiffness matrix A from the Luijten dynamic model equation
@@ -144,24 +239,138 @@ class EgoSim(object):
         # First element of control signal is longitudinal velocity
         u1 = ctrl[0]
         P = self.P
+        C_t = P.C_trailer
         # Following calculations come from the Luijten dynamic model
-        a11 = P['C1'] + P['C2'] + P['C3'] + P['C4'] + P['C5']
-        a12 = P['Cs1'] - (P['C4']+P['C5'])*(P['h1']+P['l2']) + (P['m1']+P['m2'])*u1**2
-        a13 = -(P['C4']+P['C5'])*P['l2']
-        a14 = -(P['C4']+P['C5'])*u1
-        a21 = P['Cs1'] - (P['C4']+P['C5'])*P['h1']
-        a22 = P['Cq1'] + (P['C4']+P['C5'])*(P['h1']+P['l2'])*P['h1'] - P['m2']*P['h1']*u1**2
-        a23 = (P['C4']+P['C5'])*P['h1']*P['l2']
-        a24 = (P['C4']+P['C5'])*P['h1']*u1
-        a31 = -(P['C4']+P['C5'])*P['l2']
-        a32 = (P['C4']+P['C5'])*P['l2']*(P['h1']+P['l2']) - P['m2']*P['a2']*u1**2
-        a33 = (P['C4']+P['C5'])*P['l2']**2
-        a34 = (P['C4']+P['C5'])*P['l2']*u1
+        a11 = P.C_total
+        a12 = P.Cs1 - C_t*P.h1_l2 + (P.m1+P.m2)*u1**2
+        a13 = -C_t*P.l2
+        a14 = -C_t*u1
+        a21 = P.Cs1 - C_t*P.h1
+        a22 = P.Cq1 + C_t*P.h1_l2*P.h1 - P.m2*P.h1*u1**2
+        a23 = C_t*P.h1*P.l2
+        a24 = C_t*P.h1*u1
+        a31 = -C_t*P.l2
+        a32 = C_t*P.l2*P.h1_l2 - P.m2*P.a2*u1**2
+        a33 = C_t*P.l2**2
+        a34 = C_t*P.l2*u1
         return -(1/u1)*np.matrix([[a11, a12, a13, a14],\
                                [a21, a22, a23, a24],\
                                [a31, a32, a33, a34],\
                                [0, 0, -u1, 0]])
         
+    def calculate_discrete_propagator(self,ctrl):
+        '''
+        Calculates the zero-order-hold discretization of the Luijten dynamic model
+        for the control velocity in ctrl and the simulation timestep, such that
+        x[k+1] = Ad*x[k] + Bd*delta[k].
+        
+        Inputs:
+            ctrl: Numpy array of shape (2,) with the control velocity in the first index
+                and control steer angle (radians) in the second. 
+                
+        Outputs:
+            Ad: State transition matrix, as a Numpy array of shape (4,4)
+            Bd: Steer input vector, as a Numpy array of shape (4,)
+        '''
+        _, _, Ad, Bd = self.get_system_matrices(ctrl[0])
+        return Ad, Bd
+    
+    def get_system_matrices(self,u1):
+        '''
+        Returns the system matrices of the model x' = Ac*x + Bc*delta and their
+        zero-order-hold discretization x[k+1] = Ad*x[k] + Bd*delta[k], using
+        the cache when these were already computed for the current truck
+        parameters, (quantized) velocity and timestep.
+        
+        Inputs:
+            u1: Control velocity, m/s
+            
+        Outputs:
+            Ac: M^-1*A, as a Numpy array of shape (4,4)
+            Bc: M^-1*B, as a Numpy array of shape (4,)
+            Ad: Discrete state transition matrix, as a Numpy array of shape (4,4)
+            Bd: Discrete steer input vector, as a Numpy array of shape (4,)
+        '''
+        # Skip the lookup when nothing changed since the previous call, which
+        # is every step at constant velocity
+        if (u1 == self.system_vel and self.P is self.system_params
+                and self.P.version == self.system_params_version
+                and self.sim_timestep == self.system_timestep):
+            return self.system_matrices
+        vel = u1
+        if self.velocity_quantum:
+            q = int(round(u1/self.velocity_quantum))
+            u1 = q*self.velocity_quantum
+        else:
+            q = u1
+        key = (self.parameter_fingerprint(), q, self.sim_timestep)
+        entry = self.cache.get(key)
+        if entry is None:
+            M_inv = np.linalg.inv(self.M)
+            Ac = np.asarray(M_inv*self.calculate_stiffness_matrix([u1,0]))
+            Bc = np.asarray(M_inv).dot(self.B)
+            Ad, Bd = discretize_zoh(Ac,Bc,self.sim_timestep)
+            entry = (Ac, Bc, Ad, Bd)
+            self.cache.put(key,entry)
+        self.system_matrices = entry
+        self.system_vel = vel
+        self.system_params = self.P
+        self.system_params_version = self.P.version
+        self.system_timestep = self.sim_timestep
+        return entry
+    
+    def parameter_fingerprint(self):
+        '''
+        Returns a hashable fingerprint of the truck parameters, used to key the
+        system matrix cache. The mass and input matrices are derived from the
+        parameters, so they are covered by the same fingerprint. The fingerprint
+        is the tuple of parameter values rather than their hash, so two
+        parameter sets whose hashes collide never share cache entries.
+        '''
+        return self.P.values_tuple()
+    
+    def cache_info(self):
+        '''
+        Returns the hit/miss statistics of the system matrix cache.
+        '''
+        return self.cache.info()
+    
+    def snapshot(self,out=None):
+        '''
+        Returns the simulation state as a flat array of size SNAPSHOT_SIZE,
+        [sim_time, world_state (5), truck_state (4)], which can be passed to
+        restore to return the simulation to this point.
+        
+        Inputs:
+            out: Optional Numpy array of shape (SNAPSHOT_SIZE,) to write into.
+        '''
+        if out is None:
+            out = np.empty(self.SNAPSHOT_SIZE)
+        out[0] = self.sim_time
+        out[1:6] = self.world_state
+        out[6:10] = self.truck_state
+        return out
+    
+    def restore(self,snapshot):
+        '''
+        Restores the simulation state saved by snapshot.
+        '''
+        self.sim_time = float(snapshot[0])
+        self.world_state[:] = snapshot[1:6]
+        self.truck_state[:] = snapshot[6:10]
+        
+    def fork(self):
+        '''
+        Returns a new EgoSim in the same state as this one, with its own copy of
+        the truck parameters and sharing the system matrix cache, so that it can
+        be simulated independently from this point on.
+        '''
+        other = EgoSim(self.sim_timestep,self.world_state_at_front,self.propagator,
+                       cache=self.cache,velocity_quantum=self.velocity_quantum)
+        other.P = self.P.copy()
+        other.restore(self.snapshot())
+        return other
+    
     
     def update_world_state(self,ctrl):
         '''
@@ -177,82 +386,110 @@ class EgoSim(object):
         # self.truck_state is [v1, theta1dot, phidot, phi]
         # ctrl is [u1, delta]
         
+        # Elements are read with item() so the arithmetic is done on Python
+        # floats, which unlike Numpy scalars allocate no memory
+        ws = self.world_state
+        ts = self.truck_state
+        dt = self.sim_timestep
+        v1 = ts.item(0)
+        phi = ts.item(3)
         # Integrate theta1dot
-        self.world_state[3] += self.truck_state[1]*self.sim_timestep
+        theta1 = ws.item(3) + ts.item(1)*dt
         
-        # Rotate truck-frame velocity into the world frame
-        vel = np.array([ctrl[0],self.truck_state[0]]) # [u1, v1]
-        vel = np.matmul(self.rotation_matrix(self.world_state[3]),vel)
-        # Travel along the velocity vector for the time step
-        self.world_state[0:2] += vel.A1[0:2]*self.sim_timestep
+        # Rotate truck-frame velocity [u1, v1] into the world frame and travel
+        # along the velocity vector for the time step
+        cos_th = math.cos(theta1)
+        sin_th = math.sin(theta1)
+        ws[0] = ws.item(0) + (cos_th*ctrl[0] - sin_th*v1)*dt
+        ws[1] = ws.item(1) + (sin_th*ctrl[0] + cos_th*v1)*dt
         
         # Calculate absolute orientation of the trailer
-        self.world_state[4] = self.world_state[3] + self.truck_state[3]
+        ws[4] = wrap_to_pi(theta1 + phi)
         
         # Output steer angle
-        self.world_state[2] = ctrl[1]
-        self.world_state[3] = wrap_to_pi(self.world_state[3])
-        self.world_state[4] = wrap_to_pi(self.world_state[4])
-        self.truck_state[3]=wrap_to_pi(self.truck_state[3])
+        ws[2] = ctrl[1]
+        ws[3] = wrap_to_pi(theta1)
+        ts[3] = wrap_to_pi(phi)
         
-    def convert_world_state_to_front(self):
+    def convert_world_state_to_front(self,out=None):
         '''
         Outputs the world state with the truck coordinate frame placed on the front
         axle rather than the truck's center of gravity. Does not modify the
         world state in memory.
+        
+        Inputs:
+            out: Optional Numpy array of shape (5,) into which the state is
+                written instead of a newly allocated array.
         '''
         # Move along vector from x and y coordinates of world_state in direction of theta
-        state = copy.deepcopy(self.world_state)
-        state[0] += self.P['a1']*np.cos(state[3])
-        state[1] += self.P['a1']*np.sin(state[3])
-        return state
+        if out is None:
+            out = self.world_state.copy()
+        else:
+            np.copyto(out,self.world_state)
+        a1 = self.P.a1
+        theta1 = out.item(3)
+        out[0] = out.item(0) + a1*math.cos(theta1)
+        out[1] = out.item(1) + a1*math.sin(theta1)
+        return out
         
     def rotation_matrix(self,theta):
         '''
         Generates and returns a 2D roration matrix for the angle theta.
         '''
-        return np.matrix([[np.cos(theta),-np.sin(theta)],[np.sin(theta),np.cos(theta)]])
+        return np.array([[np.cos(theta),-np.sin(theta)],[np.sin(theta),np.cos(theta)]])
+    
+class SystemMatrixCache(LRUCache):
+    def __init__(self,maxsize=64):
+        '''
+        Bounded least-recently-used cache of system matrices, keyed on
+        (parameter fingerprint, quantized velocity, timestep).
+        
+        Inputs:
+            maxsize: Maximum number of entries kept; the least recently used
+                entry is evicted when the cache is full.
+        '''
+        super(SystemMatrixCache, self).__init__(maxsize)
     
-def canonical_ode(y, t, M, A, B, u):
+def linear_ode(y, t, Ac, Bc, u):
     '''
-    Canonical ODE for My' = Ay + Bu. Used for ODE solver.
+    ODE for y' = Ac*y + Bc*u with Ac = M^-1*A and Bc = M^-1*B precomputed.
+    Used for ODE solver.
     '''
-    dydt = np.matmul(np.linalg.inv(M)*A,y) + np.matmul(np.linalg.inv(M),B)*u
-    return dydt.A1
+    return np.dot(Ac,y) + Bc*u
+
+def discretize_zoh(Ac, Bc, dt):
+    '''
+    Exact zero-order-hold discretization of the system x' = Ac*x + Bc*u for a
+    scalar input u held constant over the timestep dt. Uses the matrix exponential
+    of the augmented matrix [[Ac, Bc], [0, 0]].
+    
+    Inputs:
+        Ac: Continuous-time state matrix, Numpy array of shape (n,n)
+        Bc: Continuous-time input vector, Numpy array of shape (n,)
+        dt: Timestep, in seconds
+        
+    Outputs:
+        Ad: Discrete-time state transition matrix, Numpy array of shape (n,n)
+        Bd: Discrete-time input vector, Numpy array of shape (n,)
+    '''
+    n = Ac.shape[0]
+    aug = np.zeros((n+1,n+1))
+    aug[:n,:n] = Ac
+    aug[:n,n] = Bc
+    E = expm(aug*dt)
+    # Contiguous copies, so that products with them need no temporary copies
+    return np.ascontiguousarray(E[:n,:n]), np.ascontiguousarray(E[:n,n])
 
 def sinusoid_input():
     ego = EgoSim()
-    x = []
-    y = []
-    delta = []
-    th1 = []
-    th2 = []
     t = np.arange(0,20,step=0.02)
     ctrl_vel = 31
-    for i in range(0,len(t)):
-        ctrl_delta = 2*np.pi*np.sin(t[i]*3.5)/5
-        xt,yt,deltat,th1t,th2t = ego.simulate_timestep([ctrl_vel,ctrl_delta])
-        x.append(xt); y.append(yt); delta.append(deltat); th1.append(th1t); th2.append(th2t)
-        
+    ctrl_delta = 2*np.pi*np.sin(t*3.5)/5
+    world_states, _ = ego.simulate_trajectory(np.column_stack((ctrl_vel*np.ones(len(t)),ctrl_delta)))
+    x, y, delta, th1, th2 = world_states.T
     
     return x, y
 
-def wrap_to_pi(angle):
-    '''
-    Wraps the input angle to the range [-pi, pi]
-    
-    Inputs:
-        angle: Angle to be wrapped to range [-pi, pi]
-        
-    Output:
-        Equivalent angle within range [-pi, pi]
-    '''
-    #print(angle)
-    wrap = np.remainder(angle, 2*np.pi)
-    if abs(wrap) > np.pi:
-        wrap -= 2*np.pi * np.sign(wrap)
-    return wrap
-
 if __name__ == "__main__":
     x, y = sinusoid_input()
     import matplotlib.pyplot as plt
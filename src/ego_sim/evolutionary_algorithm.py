@@ -7,174 +7,425 @@ Created on Mon Nov 25 13:32:01 2019
 """
 import numpy as np
 import copy
-import torch
-from stanley_pid import StanleyPID
+from concurrent.futures import ProcessPoolExecutor
+from stanley_pid import StanleyPID, BatchStanleyPID
 from ego_sim import EgoSim
-from nn2_control import NN2Control
+from batch_ego_sim import BatchEgoSim
+from nn2_control import NN2Control, BatchNN2Control
+from net2_inference import (Net2Inference, BatchNet2Inference, NET2_PARAM_OFFSETS,
+                            network_to_vector, vector_to_network)
 from random_path_generator import RandomPathGenerator
-from Min_dist_test import calc_off_tracking
-import random
+from baseline_cache import BASELINE_CACHE, baseline_key
+from optimizers import Optimizer
+from fitness_memo import FitnessMemo, FITNESS_POLICIES, hash_arrays, scenario_key
+from Min_dist_test import OffTrackingAccumulator, off_tracking_errors
 import pickle
 import matplotlib.pyplot as  plt
 
 
-class EvolutionaryAlgorithm(object):
-    def __init__(self,nn_controller,pop_size=10,pct_weight_variation=0.2):
+# Mutation scale of each parameter in the flat vector, in the order of
+# NET2_PARAM_SHAPES: fc1.weight, fc1.bias, fc2.weight, fc2.bias, fc3.weight, fc3.bias
+MUTATION_SCALES = (5,1,5,1,2.5,0.2)
+# Whether each parameter's perturbation is divided by the norm of its random draw
+MUTATION_NORMALIZED = (True,True,True,True,True,False)
+# Ways of combining a controller's fitness on several scenarios; see aggregate_fitness
+AGGREGATES = ('mean','quantile','worst')
+
+class EvolutionaryAlgorithm(Optimizer):
+    def __init__(self,nn_controller,pop_size=10,pct_weight_variation=0.2,
+                 n_elite=10,early_abort=None,batched=True,n_workers=1,chunk_size=4,
+                 fitness_policy='reevaluate',ema_weight=0.5,n_paths=1,parameter_variants=None,
+                 aggregate='mean',quantile=0.9,resample_scenarios=True):
+        '''
+        Evolves a population of Net2 neurocontrollers. The population is stored
+        as one (P,N_NET2_PARAMS) array, self.population, whose rows are the
+        flat parameter vectors of the networks, so mutation and selection are
+        array operations. Torch networks are only built when self.controllers
+        is read.
+
+        With n_workers > 1, batched fitness evaluation is split into tasks of
+        chunk_size controllers run by a pool of n_workers processes. The
+        workers are given the scenario set when they start, and are restarted
+        when it changes; call close() to stop them when done.
+
+        fitness_policy sets how controllers that already have a fitness are
+        treated when a generation is evaluated on a new path; see
+        evaluate_fitness and fitness_memo.FITNESS_POLICIES.
+
+        Each generation is evaluated on n_paths random paths, each simulated
+        with every entry of parameter_variants, a list of modify_parameters
+        arguments such as those from parameter_sweep.parameter_grid (by default
+        only the design parameters). The fitness on the scenarios is
+        aggregated as set by aggregate ('mean', 'quantile' or 'worst'). With
+        resample_scenarios False the same scenario set is used for every
+        generation.
+
+        early_abort stops the rollout of a controller once it can no longer be
+        selected (see evaluate_fitness). It only works when controllers are
+        simulated one at a time on a single scenario, so it requires
+        batched=False, n_paths=1, a single parameter variant and a
+        fitness_policy other than 'ema'; a ValueError is raised if it is set
+        to True otherwise. By default (None) it is used whenever possible.
+        '''
         # Save number of controllers to keep through each iteration
         #print('bias value in start of evo',nn_controller.fc3.bias.data)
         self.pop_size = pop_size
+        self.n_elite = n_elite
+        # Simulate the whole pool at once, or one controller at a time
+        self.batched = batched
+        if n_workers < 1 or chunk_size < 1:
+            raise ValueError('n_workers and chunk_size must be at least 1')
+        self.n_workers = n_workers
+        self.chunk_size = chunk_size
+        self._executor = None
+        # Scenario set the executor's workers were started with
+        self._executor_scenarios = None
+        if fitness_policy not in FITNESS_POLICIES:
+            raise ValueError('fitness_policy must be one of {}, not {}'.format(FITNESS_POLICIES,fitness_policy))
+        self.fitness_policy = fitness_policy
+        self.ema_weight = ema_weight
+        # Fitness of each controller on each scenario it has been simulated on
+        self.memo = FitnessMemo()
+        if aggregate not in AGGREGATES:
+            raise ValueError('aggregate must be one of {}, not {}'.format(AGGREGATES,aggregate))
+        if n_paths < 1:
+            raise ValueError('n_paths must be at least 1')
+        self.n_paths = n_paths
+        self.parameter_variants = parameter_variants if parameter_variants is not None else [{}]
+        self.aggregate = aggregate
+        self.quantile = quantile
+        self.resample_scenarios = resample_scenarios
+        self.scenarios = None
+        # Stop serial rollouts of controllers that can no longer make the next generation
+        abort_supported = (not batched and fitness_policy != 'ema' and
+                           n_paths*len(self.parameter_variants) == 1)
+        if early_abort is None:
+            early_abort = abort_supported
+        elif early_abort and not abort_supported:
+            raise ValueError("early_abort requires batched=False, a single scenario and a "
+                             "fitness_policy other than 'ema'")
+        self.early_abort = early_abort
         self.pid_fitness=0
         # Save the percent weight variation to use when permutating controllers
         self.pct_weight_var = pct_weight_variation
-        nn_controller=nn_controller.float()
-        temp_controllers = pickle.loads(pickle.dumps(nn_controller))
-        #print('bias value in temp of evo',temp_controllers.fc3.bias.data)
+        # Network whose copies are loaded with population rows in self.controllers
+        self.template = pickle.loads(pickle.dumps(nn_controller.float()))
         # Initialize population of controllers randomly perturbed from the input controller
-        self.controllers=[nn_controller,nn_controller,nn_controller,nn_controller,nn_controller]
-        for i in range(4):
-            self.controllers[i] = self.permutate_controller(temp_controllers)
-        
-        #for i in  range(len(self.controllers)):
-            #print('bias value in end of evo',self.controllers[i].fc3.bias.data)
+        params = network_to_vector(self.template)
+        self.population = np.vstack((self.mutate(np.tile(params,(4,1))),params))
+        self.controller_fitness = np.zeros(len(self.population))
+        # Whether each controller has a fitness from an earlier generation
+        self.evaluated = np.zeros(len(self.population),dtype=bool)
         fitnesses = self.evaluate_fitness()
         
         # Save the best controller's index
         self.best_controller_idx = np.argmin(fitnesses)
-    
-        
+
+    @property
+    def population(self):
+        return self._population
+
+    @population.setter
+    def population(self,population):
+        self._population = np.asarray(population,dtype=float)
+        self._controllers = None
+
+    @property
+    def controllers(self):
+        '''
+        List of torch Net2 networks with the parameters of the population's
+        rows. They are built on first access after the population changes;
+        modifying them does not change the population.
+        '''
+        if self._controllers is None:
+            self._controllers = [vector_to_network(params,copy.deepcopy(self.template))
+                                 for params in self._population]
+        return self._controllers
+
+    @controllers.setter
+    def controllers(self,controllers):
+        self.population = np.array([network_to_vector(network) for network in controllers])
+
+    def mutate(self,parents):
+        '''
+        Returns randomly perturbed copies of the rows of parents, a
+        (M,N_NET2_PARAMS) array. Each parameter tensor gets uniform noise in
+        [-0.5,0.5), divided by the norm of the random draw (except for the
+        output bias) and multiplied by its entry in MUTATION_SCALES.
+        '''
+        parents = np.atleast_2d(parents)
+        draw = np.random.random(parents.shape)
+        step = draw - 0.5
+        for start, stop, scale, normalized in zip(NET2_PARAM_OFFSETS[:-1],NET2_PARAM_OFFSETS[1:],
+                                                  MUTATION_SCALES,MUTATION_NORMALIZED):
+            if normalized:
+                scale = scale/np.linalg.norm(draw[:,start:stop],axis=1,keepdims=True)
+            step[:,start:stop] *= scale
+        return parents + step
+
     def permutate_controller(self,nn_controller_orig):
         '''
-        Modifies the weights in nn_controller randomly to create a new controller
-        '''
-        #modify the weights of the 1st layer
-        #nn_controller2=nn_controller.deepcopy()
-        #print('nn_weight data',nn_controller.fc1.weight.data)
-        #print('nn_weight data len',len(nn_controller.fc1.weight.data))
-        #print('nn_weight data',nn_controller.fc1.weight.data)
-        nn_controller= pickle.loads(pickle.dumps(nn_controller_orig))
-        nn_controller=nn_controller.float()
-        #print('start permute: ',nn_controller.fc3.bias.data)
-        temp=list(nn_controller.fc1.weight.data.shape)
-        weight_add=torch.rand(temp)
-
-        weight_add=(-0.5+weight_add)/np.linalg.norm(weight_add)
-
-        nn_controller.fc1.weight.data=nn_controller.fc1.weight.data+weight_add*5
-        #modify the weights of the 2nd layer
-        temp=list(nn_controller.fc2.weight.data.shape)
-        weight_add=torch.rand(temp)
-        weight_add=(-0.5+weight_add)/np.linalg.norm(weight_add)
-        nn_controller.fc2.weight.data=nn_controller.fc2.weight.data+weight_add*5
-        #modify the weights of the 3rd layer
-        temp=list(nn_controller.fc3.weight.data.shape)
-        weight_add=torch.rand(temp)
-        weight_add=(-0.5+weight_add)/np.linalg.norm(weight_add)
-        nn_controller.fc3.weight.data=nn_controller.fc3.weight.data+weight_add*2.5
-        #modify the biases of the 1st layer
-        temp=list(nn_controller.fc1.bias.data.shape)
-        weight_add=torch.rand(temp)
-        weight_add=(-0.5+weight_add)/np.linalg.norm(weight_add)
-        nn_controller.fc1.bias.data=nn_controller.fc1.bias.data+weight_add*1
-        #modify the biases of the 2nd layer
-        temp=list(nn_controller.fc2.bias.data.shape)
-        weight_add=torch.rand(temp)
-        weight_add=(-0.5+weight_add)/np.linalg.norm(weight_add)
-        nn_controller.fc2.bias.data=nn_controller.fc2.bias.data+weight_add*1
-        #modify the biases of the 3rd layer
-        temp=list(nn_controller.fc3.bias.data.shape)
-        weight_add=torch.rand(temp)
-        weight_add=(-0.5+weight_add)
-        nn_controller.fc3.bias.data=nn_controller.fc3.bias.data+weight_add*0.2
-        #print('end permute: ',nn_controller.fc3.bias.data)
-        
-        return nn_controller
+        Returns a copy of the torch network nn_controller_orig with its weights
+        modified randomly, as done by mutate for rows of the population.
+        '''
+        params = self.mutate(network_to_vector(nn_controller_orig))[0]
+        return vector_to_network(params,copy.deepcopy(self.template))
     
+    def draw_scenarios(self):
+        '''
+        Returns the scenario set of a generation: n_paths random paths, each
+        combined with every entry of parameter_variants, as a list of
+        (x_true, y_true, t, vel, variant) tuples. All controllers of the
+        generation are evaluated on the same set.
+        '''
+        return draw_scenarios(self.n_paths,self.parameter_variants)
+
     def evaluate_fitness(self):
         '''
-        Evaluates and returns the fitness of all controllers in pool
+        Evaluates and returns the fitness of all controllers in pool.
+        
+        Every controller is evaluated on the generation's scenario set (see
+        draw_scenarios), which is drawn anew for each generation unless
+        resample_scenarios is False. The fitness on each scenario is stored in
+        self.fitness_matrix, of shape (P,S), and aggregated over the scenarios
+        by aggregate_fitness: their mean, a quantile, or the worst case.
+        Controllers that are not simulated under the 'new_only' policy have
+        their rows filled from the memo where possible and NaN elsewhere, and
+        with 'ema' the rows hold only this generation's values, so
+        self.controller_fitness, not self.fitness_matrix, is the fitness used
+        for selection.
+        
+        Fitness values are memoized per (controller parameters, scenario) in
+        self.memo, so a controller is never simulated twice on the same
+        scenario. How controllers that already have a fitness are treated on a
+        new scenario set is set by fitness_policy (see
+        fitness_memo.FITNESS_POLICIES); with 'ema', the fitness is ema_weight
+        times the new aggregate plus 1-ema_weight times the previous fitness.
+        
+        If batched is set, every controller and scenario to be simulated and
+        the PID baselines are simulated together (see scenario_rollout_fitness),
+        so a generation costs about as much as one rollout, or one rollout per
+        chunk spread over n_workers processes. The PID baseline's fitness on a
+        scenario is taken from the shared baseline_cache.BASELINE_CACHE when the
+        scenario has been seen before.
+        
+        Otherwise controllers are evaluated in pool order, so the surviving
+        elites come first. With early_abort (see __init__), once n_elite
+        controllers have been evaluated each further rollout is stopped as
+        soon as its running off-tracking exceeds the current n_elite-th best
+        fitness, since that controller can no longer be selected. An aborted controller's fitness is its partial
+        sum, which is a lower bound on its full fitness, and it is flagged in
+        self.aborted. Aborted values are not memoized, and early abort is not
+        used with the 'ema' policy since averaged values are not comparable to
+        a partial sum.
         '''
         
-        rpg=RandomPathGenerator()
-        controller = NN2Control()
-        x_true, y_true, t, vel=rpg.get_harder_path(end_time=10)
-        x_truck=[]
-        y_truck=[]
-        self.controller_fitness=np.zeros(len(self.controllers))
-        th1t=0
-        th2t=0
-        th1=[]
-        th2=[]
-        pid=StanleyPID()
-        for i in range(len(self.controllers)+1):
-            #print(t)
-            #print(x_true)
-            #print(y_true)
-            #print(vel)    
-            ego=EgoSim(sim_timestep = t[1]-t[0], world_state_at_front=True)
+        if self.resample_scenarios or self.scenarios is None:
+            self.scenarios = self.draw_scenarios()
+        scenarios = self.scenarios
+        n_scenarios = len(scenarios)
+        scenario_keys = [scenario_key(*scenario) for scenario in scenarios]
+        param_keys = [hash_arrays(params) for params in self.population]
+        
+        n = len(self.population)
+        fitness_matrix = np.full((n,n_scenarios),np.nan)
+        aborted = np.zeros((n,n_scenarios),dtype=bool)
+        if self.fitness_policy == 'new_only':
+            keep = self.evaluated
+        else:
+            keep = np.zeros(n,dtype=bool)
+        for i in range(n):
+            for k in range(n_scenarios):
+                stored = self.memo.get(param_keys[i],scenario_keys[k])
+                if stored is not None:
+                    fitness_matrix[i,k] = stored
+        rows, cols = np.nonzero(np.isnan(fitness_matrix) & ~keep[:,None])
+        # PID baselines are only simulated on scenarios not in the shared cache
+        baselines = [baseline_key(x_true, y_true, t, vel, P=scenario_vehicle(variant).P)
+                     for x_true, y_true, t, vel, variant in scenarios]
+        cached = [BASELINE_CACHE.get(baseline) for baseline in baselines]
+        pid_scenarios = [k for k in range(n_scenarios) if cached[k] is None]
+        pid_fitness = np.array([entry[0] if entry is not None else np.nan for entry in cached])
+        if len(rows) > 0 or len(pid_scenarios) > 0:
+            if self.batched:
+                fitness, rollout_aborted, new_pid_fitness = self._evaluate_fitness_batched(
+                    self.population[rows], cols, scenarios, pid_scenarios)
+            else:
+                known = fitness_matrix[~keep]
+                reference = np.concatenate((self.controller_fitness[keep],known[~np.isnan(known)]))
+                fitness, rollout_aborted, new_pid_fitness = self._evaluate_fitness_serial(
+                    self.population[rows], cols, scenarios, pid_scenarios, reference)
+            fitness_matrix[rows,cols] = fitness
+            aborted[rows,cols] = rollout_aborted
+            pid_fitness[pid_scenarios] = new_pid_fitness
+            for k, value in zip(pid_scenarios,new_pid_fitness):
+                BASELINE_CACHE.put(baselines[k], (value, None))
+        for i, k in zip(rows,cols):
+            if not aborted[i,k]:
+                self.memo.put(param_keys[i],scenario_keys[k],fitness_matrix[i,k])
+        
+        fitness = aggregate_fitness(fitness_matrix,self.aggregate,self.quantile)
+        fitness[keep] = self.controller_fitness[keep]
+        if self.fitness_policy == 'ema':
+            fitness[self.evaluated] = (self.ema_weight*fitness[self.evaluated] +
+                                       (1-self.ema_weight)*self.controller_fitness[self.evaluated])
+        self.controller_fitness = fitness
+        self.fitness_matrix = fitness_matrix
+        self.aborted = aborted.any(axis=1)
+        self.pid_scenario_fitness = pid_fitness
+        self.pid_fitness = aggregate_fitness(pid_fitness[None],self.aggregate,self.quantile)[0]
+        self.evaluated = np.ones(n,dtype=bool)
+        return self.controller_fitness
+
+    def _evaluate_fitness_serial(self, population, scenario_idx, scenarios, pid_scenarios, reference):
+        '''
+        Simulates row i of population on scenario scenario_idx[i], one at a
+        time with early abort (see evaluate_fitness), followed by the PID
+        baseline on each of pid_scenarios. reference holds the fitness of this
+        generation's controllers that are not simulated, which count towards
+        the early-abort budget.
+        
+        Returns the rows' fitness and abort flags and the PID baselines' fitness.
+        '''
+        n = len(population)
+        controller_fitness=np.zeros(n)
+        aborted=np.zeros(n,dtype=bool)
+        pid_fitness = np.zeros(len(pid_scenarios))
+        early_abort = self.early_abort and self.fitness_policy != 'ema' and len(scenarios) == 1
+        rollouts = [(i,scenario_idx[i]) for i in range(n)] + [(n+m,k) for m, k in enumerate(pid_scenarios)]
+        for i, k in rollouts:
+            x_true, y_true, t, vel, variant = scenarios[k]
+            ego=scenario_vehicle(variant, sim_timestep = t[1]-t[0])
             controller = NN2Control()
-            #print('controller: ', i)
+            pid=StanleyPID()
+            budget = None
+            if i < n:
+                network = Net2Inference.from_vector(population[i])
+            if early_abort and self.n_elite <= i+len(reference) and i < n:
+                known = np.concatenate((reference,controller_fitness[:i]))
+                budget = np.partition(known,self.n_elite-1)[self.n_elite-1]
+            off_tracking = OffTrackingAccumulator(ego.P, x_true, y_true, budget=budget)
             th1t=0
             th2t=0
-            th1=[]
-            th2=[]
-            x_truck=[]
-            y_truck=[]
             for j in range(len(t)):
-                if i == len(self.controllers):
-                    state = ego.convert_world_state_to_front()
-                    ctrl_delta, ctrl_vel, err, interr, differr = pid.calc_steer_control(t[i],state,x_true,y_true, vel)
-                    xt,yt,deltat,th1t,th2t = ego.simulate_timestep([ctrl_vel,ctrl_delta])
-                    x_truck.append(xt)
-                    y_truck.append(yt)
-                    th1.append(th1t)
-                    th2.append(th2t)
+                state = ego.convert_world_state_to_front()
+                if i >= n:
+                    ctrl_delta, ctrl_vel, err, interr, differr = pid.calc_steer_control(t[j],state,x_true,y_true, vel)
                 else:
-                    state = ego.convert_world_state_to_front()
-                    
-                    ctrl_delta, ctrl_vel, err, interr, differr = controller.calc_steer_control(t[i],state,x_true,y_true, vel, th1t-th2t, self.controllers[i])
-                    #print(ctrl_delta)
-                    xt,yt,deltat,th1t,th2t = ego.simulate_timestep([ctrl_vel,ctrl_delta])
-                    x_truck.append(xt)
-                    y_truck.append(yt)
-                    th1.append(th1t)
-                    th2.append(th2t)
-                #inputs=np.concatenate((err,ctrl_vel,interr,differr),axis=None)
-                #network_input=torch.tensor(inputs)
-                #out=self.controllers[i](network_input)
-                #x.append(xt); y.append(yt); delta.append(deltat); th1.append(th1t); th2.append(th2t)
-            if i == len(self.controllers):
-                self.pid_fitness, CTerr =calc_off_tracking(x_truck, y_truck, th1, th2, ego.P, x_true, y_true)
+                    ctrl_delta, ctrl_vel, err, interr, differr = controller.calc_steer_control(t[j],state,x_true,y_true, vel, th1t-th2t, network)
+                xt,yt,deltat,th1t,th2t = ego.simulate_timestep([ctrl_vel,ctrl_delta])
+                if not off_tracking.update(xt,yt,th1t,th2t):
+                    break
+            if i >= n:
+                pid_fitness[i-n], CTerr = off_tracking.result()
             else:
-                self.controller_fitness[i], CTerr = calc_off_tracking(x_truck, y_truck, th1, th2, ego.P, x_true, y_true)
-            #print('pid:',self.pid_fitness)
-            #print('controller',self.controller_fitness[i])
-            #plt.plot(x_truck,y_truck)
-            #plt.plot(x_true,y_true,'--r')
-            #plt.show()
-            
-        
+                controller_fitness[i], CTerr = off_tracking.result()
+                aborted[i] = off_tracking.exceeded
+        return controller_fitness, aborted, pid_fitness
+    
+    def _evaluate_fitness_batched(self, population, scenario_idx, scenarios, pid_scenarios):
+        '''
+        Simulates row i of population on scenario scenario_idx[i], and the PID
+        baseline on each of pid_scenarios, as rigs of one BatchEgoSim (see
+        scenario_rollout_fitness), or, with n_workers > 1, as chunks of
+        chunk_size rows spread over a process pool. Returns values as
+        _evaluate_fitness_serial does.
+        '''
+        if self.n_workers > 1 and len(population) > 0:
+            controller_fitness, pid_fitness = self._evaluate_fitness_parallel(
+                population, scenario_idx, scenarios, pid_scenarios)
+        else:
+            controller_fitness, pid_fitness = scenario_rollout_fitness(
+                population, scenarios, scenario_idx, pid_scenarios)
+        return controller_fitness, np.zeros(len(population),dtype=bool), pid_fitness
+
+    def _evaluate_fitness_parallel(self, population, scenario_idx, scenarios, pid_scenarios):
+        '''
+        Submits one task per chunk of chunk_size rows to the process pool; the
+        PID baselines run with the last chunk. The scenario set is sent to
+        each worker once, when the pool is started for it, so a task only
+        carries its rows and their scenario indices. Rollouts use no random
+        numbers, so results do not depend on the number of workers.
+        '''
+        if self._executor is None or self._executor_scenarios is not scenarios:
+            self.close()
+            self._executor = ProcessPoolExecutor(max_workers=self.n_workers, initializer=_init_worker,
+                                                 initargs=(scenarios,))
+            self._executor_scenarios = scenarios
+        n = len(population)
+        starts = list(range(0,n,self.chunk_size))
+        futures = [self._executor.submit(_rollout_task, population[start:start+self.chunk_size],
+                                         scenario_idx[start:start+self.chunk_size],
+                                         pid_scenarios if start == starts[-1] else [])
+                   for start in starts]
+        results = [future.result() for future in futures]
+        controller_fitness = np.concatenate([fitness for fitness, pid_fitness in results])
+        return controller_fitness, results[-1][1]
+
+    def close(self):
+        '''
+        Shuts down the worker processes used when n_workers > 1. They are
+        started again if fitness is evaluated afterwards.
+        '''
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+            self._executor_scenarios = None
     
     def iterate(self,epsilon=0.1):
-        # Pick a network to modify using the epsilon-greedy method
-
-            
-        # Randomly modify the network parameters and add it to the pool
-        for i in  range(10):
-            prob = np.random.random()
-            if prob > epsilon:
-                new_ctrlr = pickle.loads(pickle.dumps(self.controllers[self.best_controller_idx]))
-            else:
-                new_ctrlr = pickle.loads(pickle.dumps(random.choice(self.controllers)))
-            new_ctrlr = self.permutate_controller(new_ctrlr)
-            self.controllers.append(new_ctrlr)
-            #print(self.controller_fitness)
-            self.controller_fitness=np.append(self.controller_fitness,0)
+        # Add mutated children to the pool
+        self.ask(epsilon)
         # Evaluate fitness of all controllers on a randomly generated path
         self.evaluate_fitness()
         # Select next generation from pool
         self.select_next_generation()
         self.update_best_controller()
 
+    def ask(self,epsilon=0.1):
+        '''
+        Adds 10 mutated children to the pool and returns the pool's parameter
+        vectors, as an optimizers.Optimizer. The parents are picked with the
+        epsilon-greedy method: the best controller with probability
+        1-epsilon, otherwise a random one.
+        '''
+        n_children = 10
+        explore = np.random.random(n_children) <= epsilon
+        parents = np.where(explore,np.random.randint(len(self.population),size=n_children),
+                           self.best_controller_idx)
+        # Randomly modify the network parameters and add them to the pool
+        self.population = np.vstack((self.population,self.mutate(self.population[parents])))
+        self.controller_fitness = np.append(self.controller_fitness,np.zeros(n_children))
+        self.evaluated = np.append(self.evaluated,np.zeros(n_children,dtype=bool))
+        self.fitness_matrix = np.vstack((self.fitness_matrix,np.full((n_children,self.fitness_matrix.shape[1]),np.nan)))
+        self.aborted = np.append(self.aborted,np.zeros(n_children,dtype=bool))
+        return self.population
+
+    def tell(self,fitness):
+        '''
+        Selects the next generation using fitness values of the pool returned
+        by ask that were computed outside of evaluate_fitness.
+        '''
+        fitness = np.asarray(fitness,dtype=float)
+        if fitness.shape != (len(self.population),):
+            raise ValueError('Expected {} fitness values, got shape {}'.format(len(self.population),fitness.shape))
+        self.controller_fitness = fitness.copy()
+        self.fitness_matrix = fitness[:,None].copy()
+        self.aborted = np.zeros(len(fitness),dtype=bool)
+        self.evaluated = np.ones(len(fitness),dtype=bool)
+        self.select_next_generation()
+        self.update_best_controller()
+
+    @property
+    def best_params(self):
+        '''
+        Parameter vector of the best controller of the current generation.
+        '''
+        return self.population[self.best_controller_idx]
+
+    @property
+    def best_fitness(self):
+        return self.controller_fitness[self.best_controller_idx]
+
         
         
     def update_best_controller(self):
@@ -185,14 +436,182 @@ class EvolutionaryAlgorithm(object):
         
     def select_next_generation(self):
         '''
-        Selects next generation of controllers based on fitness
+        Selects next generation of controllers based on fitness: the n_elite
+        fittest rows of the population are kept, best first
         '''
-        best_controller=np.argsort(self.controller_fitness)
-        new_controllers=copy.deepcopy(self.controllers[0:10])
-        new_controller_fitness=copy.deepcopy(self.controller_fitness[0:10])
-        for i in range(10):
-            new_controllers[i]=self.controllers[best_controller[i]]
-            new_controller_fitness[i]=self.controller_fitness[best_controller[i]]
-        self.controllers=new_controllers
-        self.controller_fitness=new_controller_fitness
-        
+        best_controller = np.argsort(self.controller_fitness,kind='stable')[:self.n_elite]
+        self.population = self.population[best_controller]
+        self.controller_fitness = self.controller_fitness[best_controller]
+        self.aborted = self.aborted[best_controller]
+        self.evaluated = self.evaluated[best_controller]
+        self.fitness_matrix = self.fitness_matrix[best_controller]
+
+def draw_scenarios(n_paths, parameter_variants=None):
+    '''
+    Returns n_paths random paths, each combined with every entry of
+    parameter_variants (by default only the design parameters), as a list of
+    (x_true, y_true, t, vel, variant) tuples.
+    '''
+    if parameter_variants is None:
+        parameter_variants = [{}]
+    rpg=RandomPathGenerator()
+    paths = [rpg.get_harder_path(end_time=10) for i in range(n_paths)]
+    return [tuple(path) + (variant,) for path in paths for variant in parameter_variants]
+
+class ScenarioFitness(object):
+    def __init__(self, scenarios, aggregate='mean', quantile=0.9):
+        '''
+        Fitness function of flat Net2 parameter vectors on a fixed scenario
+        set, for use with optimizers.run_optimizer. Calling it with a
+        (P,N_NET2_PARAMS) array simulates every candidate on every scenario
+        in one batched rollout (see scenario_rollout_fitness) and returns the
+        aggregated fitness of each candidate.
+
+        Inputs:
+            scenarios: List of (x_true, y_true, t, vel, variant) tuples, e.g.
+                from draw_scenarios
+            aggregate, quantile: As for aggregate_fitness
+        '''
+        if aggregate not in AGGREGATES:
+            raise ValueError('aggregate must be one of {}, not {}'.format(AGGREGATES,aggregate))
+        self.scenarios = scenarios
+        self.aggregate = aggregate
+        self.quantile = quantile
+
+    def __call__(self, population):
+        population = np.atleast_2d(population)
+        n_scenarios = len(self.scenarios)
+        # Row i*S+k of the batch is candidate i on scenario k
+        fitness, _ = scenario_rollout_fitness(np.repeat(population,n_scenarios,axis=0), self.scenarios,
+                                              np.tile(np.arange(n_scenarios),len(population)))
+        return aggregate_fitness(fitness.reshape(len(population),n_scenarios),self.aggregate,self.quantile)
+
+def aggregate_fitness(fitness_matrix, aggregate='mean', quantile=0.9):
+    '''
+    Aggregates a (P,S) matrix of fitness values on S scenarios into one
+    fitness per row.
+
+    Inputs:
+        fitness_matrix: Numpy array of shape (P,S)
+        aggregate: 'mean', 'quantile' (the given quantile of each row) or
+            'worst' (the largest value of each row)
+        quantile: Quantile used with aggregate='quantile', in [0,1]
+
+    Outputs:
+        Numpy array of shape (P,)
+    '''
+    if aggregate == 'mean':
+        return np.mean(fitness_matrix,axis=1)
+    elif aggregate == 'quantile':
+        return np.quantile(fitness_matrix,quantile,axis=1)
+    elif aggregate == 'worst':
+        return np.max(fitness_matrix,axis=1)
+    raise ValueError('aggregate must be one of {}, not {}'.format(AGGREGATES,aggregate))
+
+def scenario_vehicle(variant, sim_timestep=0.02):
+    '''
+    Returns an EgoSim, with its state given at the front axle, whose
+    parameters are modified by the modify_parameters arguments in variant.
+    '''
+    ego = EgoSim(sim_timestep=sim_timestep, world_state_at_front=True)
+    if variant:
+        ego.modify_parameters(**variant)
+    return ego
+
+def scenario_rollout_fitness(population, scenarios, scenario_idx=None, pid_scenarios=()):
+    '''
+    Simulates controllers, each on one scenario, and optionally the PID
+    baseline on some of the scenarios, as rigs of one BatchEgoSim. Every rig
+    has the truck parameters of its scenario, and the controller rigs'
+    network layers are stacked so each timestep evaluates every controller
+    with one batched matrix product per layer.
+
+    Inputs:
+        population: Numpy array of shape (R,N_NET2_PARAMS) of the Net2
+            parameter vectors of the controller rigs
+        scenarios: List of (x_true, y_true, t, vel, variant) tuples, where
+            variant is a dictionary of modify_parameters arguments. All
+            scenarios must share the same time vector.
+        scenario_idx: Index into scenarios of each row's scenario; all rows
+            use the first scenario if not given
+        pid_scenarios: Indices of the scenarios on which the StanleyPID
+            baseline is simulated
+
+    Outputs:
+        fitness: Numpy array of shape (R,) of the controllers' fitness
+        pid_fitness: Numpy array of the PID baseline's fitness on each of pid_scenarios
+    '''
+    t = scenarios[0][2]
+    for scenario in scenarios[1:]:
+        if len(scenario[2]) != len(t) or not np.allclose(scenario[2],t):
+            raise ValueError('All scenarios must share the same time vector')
+    n = len(population)
+    if scenario_idx is None:
+        scenario_idx = np.zeros(n,dtype=int)
+    rig_scenarios = np.concatenate((np.asarray(scenario_idx,dtype=int),np.asarray(pid_scenarios,dtype=int)))
+    n_rigs = len(rig_scenarios)
+    paths = [(x_true, y_true, vel) for x_true, y_true, t_k, vel, variant in scenarios]
+    vehicles = [scenario_vehicle(scenarios[k][4], t[1]-t[0]) for k in rig_scenarios]
+    ego = BatchEgoSim(sim_timestep = t[1]-t[0], world_state_at_front=True, vehicles=vehicles)
+    network = BatchNet2Inference.from_population(population)
+    controller = BatchNN2Control(n)
+    pid = BatchStanleyPID(n_rigs-n)
+    nn_paths = [paths[k] for k in rig_scenarios[:n]]
+    pid_paths = [paths[k] for k in rig_scenarios[n:]]
+    x_truck = np.zeros((len(t),n_rigs))
+    y_truck = np.zeros((len(t),n_rigs))
+    th1 = np.zeros((len(t),n_rigs))
+    th2 = np.zeros((len(t),n_rigs))
+    ctrl = np.zeros((n_rigs,2))
+    for j in range(len(t)):
+        state = ego.convert_world_state_to_front()
+        if n > 0:
+            ctrl_delta, ctrl_vel, err, interr, differr = controller.calc_steer_control(t[j],state[:n],nn_paths,state[:n,3]-state[:n,4],network)
+            ctrl[:n,0] = ctrl_vel
+            ctrl[:n,1] = ctrl_delta
+        if n_rigs > n:
+            ctrl_delta, ctrl_vel, err, interr, differr = pid.calc_steer_control(t[j],state[n:],pid_paths)
+            ctrl[n:,0] = ctrl_vel
+            ctrl[n:,1] = ctrl_delta
+        state = ego.simulate_timestep(ctrl)
+        x_truck[j] = state[:,0]; y_truck[j] = state[:,1]; th1[j] = state[:,3]; th2[j] = state[:,4]
+    fitness = np.zeros(n_rigs)
+    for k in np.unique(rig_scenarios):
+        rigs = np.flatnonzero(rig_scenarios == k)
+        x_true, y_true = scenarios[k][0], scenarios[k][1]
+        truck_err, trail_err = off_tracking_errors(x_truck[:,rigs], y_truck[:,rigs], th1[:,rigs], th2[:,rigs],
+                                                   vehicles[rigs[0]].P, x_true, y_true)
+        fitness[rigs] = np.sum(np.square(truck_err),axis=0) + np.sum(np.square(trail_err),axis=0)
+    return fitness[:n], fitness[n:]
+
+def batched_rollout_fitness(population, x_true, y_true, t, vel, include_pid=True):
+    '''
+    Simulates the controllers of a population, and optionally the PID
+    baseline, on one path with the default truck parameters; see
+    scenario_rollout_fitness.
+
+    Outputs:
+        fitness: Numpy array of shape (P,) of the controllers' fitness
+        pid_fitness: Fitness of the PID baseline, or None if not included
+    '''
+    fitness, pid_fitness = scenario_rollout_fitness(population, [(x_true, y_true, t, vel, {})],
+                                                    pid_scenarios=[0] if include_pid else [])
+    return fitness, (pid_fitness[0] if include_pid else None)
+
+# Scenario set of the generation being evaluated, in a worker process
+_worker_scenarios = None
+
+def _init_worker(scenarios):
+    '''
+    Process pool initializer of EvolutionaryAlgorithm: stores the scenario
+    set in the worker, so tasks need not carry it.
+    '''
+    global _worker_scenarios
+    _worker_scenarios = scenarios
+
+def _rollout_task(population, scenario_idx, pid_scenarios):
+    '''
+    Process pool task of EvolutionaryAlgorithm: returns
+    scenario_rollout_fitness for the given rows on the worker's scenario set.
+    '''
+    return scenario_rollout_fitness(population, _worker_scenarios, scenario_idx, pid_scenarios)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 22:14:51 2026
+
+@author: Zeke
+"""
+import hashlib
+import numpy as np
+from lru_cache import LRUCache
+
+# How EvolutionaryAlgorithm treats controllers that already have a fitness when
+# a generation is evaluated on a new scenario:
+#   'reevaluate': every controller is simulated on the new scenario, and its
+#       fitness is replaced by the new value
+#   'ema': every controller is simulated on the new scenario, and its fitness
+#       becomes an exponential moving average over the scenarios it has seen
+#   'new_only': only controllers without a fitness are simulated; the others
+#       keep the fitness they were selected with
+FITNESS_POLICIES = ('reevaluate','ema','new_only')
+
+def hash_arrays(*arrays):
+    '''
+    Returns a hex digest of the shapes and float64 contents of the arrays.
+    Equal contents give equal digests, whatever the arrays' identity or dtype.
+    '''
+    digest = hashlib.sha1()
+    for array in arrays:
+        array = np.ascontiguousarray(array,dtype=float)
+        digest.update(str(array.shape).encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+class FitnessMemo(LRUCache):
+    def __init__(self,maxsize=10000):
+        '''
+        Least-recently-used store of fitness values keyed on (parameter hash,
+        scenario hash), so that a controller is never simulated twice on the
+        same scenario. Parameter hashes are hash_arrays of a flat parameter
+        vector and scenario hashes hash_arrays of the scenario's path arrays.
+
+        Inputs:
+            maxsize: Maximum number of fitness values kept
+        '''
+        super(FitnessMemo, self).__init__(maxsize)
+
+    def get(self,param_key,scenario_key):
+        '''
+        Returns the fitness stored for the pair, or None if there is none.
+        '''
+        return super(FitnessMemo, self).get((param_key,scenario_key))
+
+    def put(self,param_key,scenario_key,fitness):
+        '''
+        Stores fitness for the pair, evicting the least recently used entry if full.
+        '''
+        super(FitnessMemo, self).put((param_key,scenario_key),fitness)
+
+def scenario_key(x_true,y_true,t,vel,variant=None):
+    '''
+    Returns the hash of a scenario: a path and an optional dictionary of
+    modify_parameters arguments applied to the truck.
+    '''
+    variant = sorted(variant.items()) if variant else []
+    return hashlib.sha1((hash_arrays(x_true,y_true,t,vel)+repr(variant)).encode()).hexdigest()
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 18:02:26 2026
+
+@author: Zeke
+"""
+import math
+import numpy as np
+
+TWO_PI = 2*math.pi
+
+# Scalar kernels. These work on Python floats with the math module, which is
+# several times faster than Numpy for a single point since there is no
+# per-call array overhead. Points may be given as any sequence of length 2.
+
+def calc_path_error(state,path_x,path_y,I_min,include_steer=False):
+    '''
+    Calculates cross-track and heading error for a given state relative to a path.
+
+    Inputs:
+        state: numpy array containing [x_front, y_front, delta, theta1, theta2] which represent, as follows:
+            x_front: x-coordinate of current front axle location in world coordinates
+            y_front: y-coordinate of current front axle location in world coordinates
+            delta: current steer tire angle relative to vehicle (radians)
+            theta1: absolute orientation of truck in world coordinates (radians)
+            theta2: absolute orientation of trailer in world coordinates (radians)
+        path_x: Array of x-coordinates for points that discretize the desired path
+        path_y: Array of y-coordinates for points that discretize the desired path
+        I_min: index of point relative to which error should be calculated; typically,
+            the index of the point with the shortest distance to state.
+        include_steer: If True, the heading of the truck is taken as
+            delta + theta1 (as used by the neural network controllers);
+            otherwise theta1 (as used by StanleyPID).
+    '''
+    # Start by determining closest three points on the desired path curve
+    closest_pt = (float(path_x[I_min]),float(path_y[I_min]))
+    if I_min > 0:
+        closest_pt_rev = (float(path_x[I_min-1]),float(path_y[I_min-1]))
+    else:
+        closest_pt_rev = closest_pt
+    if I_min < len(path_x)-1:
+        closest_pt_fwd = (float(path_x[I_min+1]),float(path_y[I_min+1]))
+    else:
+        closest_pt_fwd = closest_pt
+
+    # Get the cross track error by finding minimum distance from the line
+    # segments defined by these three points
+    ct_error = path_distance(closest_pt_rev, closest_pt, closest_pt_fwd, (float(state[0]),float(state[1])))
+
+    # Get the heading of the path by taking the arctangent of the vector
+    # from the reverse closest point to the forward closest point
+    path_angle = math.atan2(closest_pt_fwd[1]-closest_pt_rev[1],closest_pt_fwd[0]-closest_pt_rev[0])
+    if include_steer:
+        heading = float(state[2]) + float(state[3])
+    else:
+        heading = float(state[3])
+    heading_error = wrap_to_pi(heading - path_angle)
+
+    return ct_error, heading_error
+
+def path_distance(path_pt_rev, path_pt, path_pt_fwd, cur_point):
+    '''
+    Calculates the distance from a given point to a path segment discretized as two
+    line segments. The segments run from path_pt_rev to path_pt and from path_pt to path_pt_fwd.
+
+    Inputs:
+        path_pt_rev: First point of first line segment
+        path_pt: Second point of first line segment, first point of second line segment
+        path_pt_fwd: Second point of second line segment
+        cur_point: Coordinates of point where distance from path is measured
+
+    Output:
+        Distance from cur_point to the path segment.
+    '''
+    # Determine the absolute minimum distance between the path and the
+    # current point based on line segments given by the three points
+    dist_rev = minimum_distance(path_pt_rev, path_pt, cur_point)
+    dist_fwd = minimum_distance(path_pt, path_pt_fwd, cur_point)
+    # Return absolute minimum distance
+    if abs(dist_rev) < abs(dist_fwd):
+        return dist_rev
+    else:
+        return dist_fwd
+
+def minimum_distance(v,w,p):
+    '''
+    Calculates the directional distance between a line segment and a point.
+    Projects the point onto the line segment and then utilizes the cross product
+    to determine whether the distance is "positive" or "negative". Positive values
+    indicate the point lies on the "right-hand" side of the vector if the vector
+    is pointing upward; negative values indicate the opposite.
+
+    Inputs:
+        v: First point of line segment
+        w: Second point of line segment
+        p: Point to which distance is to be calculated
+
+    Output:
+        Signed distance from point to line
+    '''
+    # Project the point on the line segment to obtain the projected point
+    proj_x, proj_y = project_point_on_segment(v,w,p)
+    dx = w[0] - v[0]
+    dy = w[1] - v[1]
+    if dx == 0 and dy == 0:
+        return math.sqrt((p[0]-proj_x)**2 + (p[1]-proj_y)**2)
+    else:
+        # Take the cross product of the vector between the point and the projection and
+        # the normalized vector of the line segment; this returns the signed distance
+        norm = math.sqrt(dx*dx + dy*dy)
+        return (p[0]-proj_x)*(dy/norm) - (p[1]-proj_y)*(dx/norm)
+
+def project_point_on_segment(v, w, p):
+    '''
+    Projects a point p onto the line segment running from point v to point w.
+
+    Inputs:
+        v: First point of line segment
+        w: Second point of line segment
+        p: Point to which distance is to be calculated
+
+    Output:
+        Projection of point p onto line segment vw, as a tuple (x, y)
+    '''
+    dx = w[0] - v[0]
+    dy = w[1] - v[1]
+    # Equation for distance from a point to a line segment
+    length_sq = dx*dx + dy*dy
+    if length_sq == 0:
+        return v[0], v[1]
+    else:
+        # Project point on the line given by line segment and restrict
+        # the projection to the range [0,1]
+        t = ((p[0]-v[0])*dx + (p[1]-v[1])*dy)/length_sq
+        if t < 0:
+            t = 0
+        elif t > 1:
+            t = 1
+        return v[0] + t*dx, v[1] + t*dy
+
+def wrap_to_pi(angle):
+    '''
+    Wraps the input angle to the range [-pi, pi]
+
+    Inputs:
+        angle: Angle to be wrapped to range [-pi, pi]
+
+    Output:
+        Equivalent angle within range [-pi, pi]
+    '''
+    # Python float modulo has the same sign convention as np.remainder
+    wrap = angle % TWO_PI
+    if wrap > math.pi:
+        wrap -= TWO_PI
+    return wrap
+
+# Vectorized kernels. These take Numpy arrays with any number of leading
+# dimensions, with points stored along a last axis of size 2, and evaluate
+# all of them in one pass.
+
+def calc_path_errors(states,path_x,path_y,I_min,include_steer=False):
+    '''
+    Array form of calc_path_error.
+
+    Inputs:
+        states: Numpy array of shape (...,5) of [x_front, y_front, delta, theta1, theta2]
+        path_x: Array of x-coordinates for points that discretize the desired path
+        path_y: Array of y-coordinates for points that discretize the desired path
+        I_min: Integer array of shape (...) of the path point indices relative
+            to which the errors are calculated
+        include_steer: As for calc_path_error
+
+    Outputs:
+        ct_error: Numpy array of shape (...) of cross-track errors
+        heading_error: Numpy array of shape (...) of heading errors
+    '''
+    states = np.asarray(states,dtype=float)
+    path = np.stack((np.asarray(path_x,dtype=float),np.asarray(path_y,dtype=float)),axis=-1)
+    I_min = np.asarray(I_min,dtype=int)
+    closest_pt = path[I_min]
+    closest_pt_rev = path[np.maximum(I_min-1,0)]
+    closest_pt_fwd = path[np.minimum(I_min+1,len(path)-1)]
+    ct_error = path_distances(closest_pt_rev, closest_pt, closest_pt_fwd, states[...,0:2])
+    tan_vec = closest_pt_fwd - closest_pt_rev
+    path_angle = np.arctan2(tan_vec[...,1],tan_vec[...,0])
+    heading = states[...,3] + states[...,2] if include_steer else states[...,3]
+    heading_error = wrap_angles_to_pi(np.array(heading - path_angle,ndmin=1)).reshape(path_angle.shape)
+    return ct_error, heading_error
+
+def path_distances(path_pt_rev, path_pt, path_pt_fwd, cur_point):
+    '''
+    Array form of path_distance; all inputs are arrays of shape (...,2).
+    '''
+    dist_rev = minimum_distances(path_pt_rev, path_pt, cur_point)
+    dist_fwd = minimum_distances(path_pt, path_pt_fwd, cur_point)
+    return np.where(np.abs(dist_rev) < np.abs(dist_fwd), dist_rev, dist_fwd)
+
+def minimum_distances(v,w,p):
+    '''
+    Array form of minimum_distance; all inputs are arrays of shape (...,2).
+    '''
+    proj = project_points_on_segments(v,w,p)
+    q = p - proj
+    d = w - v
+    norm = np.sqrt(d[...,0]*d[...,0] + d[...,1]*d[...,1])
+    degenerate = norm == 0
+    norm = np.where(degenerate,1,norm)
+    signed = q[...,0]*(d[...,1]/norm) - q[...,1]*(d[...,0]/norm)
+    return np.where(degenerate, np.sqrt(q[...,0]**2 + q[...,1]**2), signed)
+
+def project_points_on_segments(v, w, p):
+    '''
+    Array form of project_point_on_segment; all inputs are arrays of shape
+    (...,2) and the projections are returned as an array of the same shape.
+    '''
+    v = np.asarray(v,dtype=float)
+    w = np.asarray(w,dtype=float)
+    p = np.asarray(p,dtype=float)
+    d = w - v
+    length_sq = d[...,0]*d[...,0] + d[...,1]*d[...,1]
+    t = ((p[...,0]-v[...,0])*d[...,0] + (p[...,1]-v[...,1])*d[...,1])/np.where(length_sq == 0,1,length_sq)
+    t = np.clip(t,0,1)
+    return v + t[...,None]*d
+
+def wrap_angles_to_pi(angle):
+    '''
+    Wraps an array of angles to the range [-pi, pi]; array form of wrap_to_pi.
+
+    Inputs:
+        angle: Numpy array of angles to be wrapped to range [-pi, pi]
+
+    Output:
+        Equivalent angles within range [-pi, pi]
+    '''
+    wrap = np.remainder(angle, 2*np.pi)
+    wrap[wrap > np.pi] -= 2*np.pi
+    return wrap
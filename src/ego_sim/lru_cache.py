@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 23:41:09 2026
+
+@author: Zeke
+"""
+from collections import OrderedDict
+
+class LRUCache(object):
+    def __init__(self,maxsize=128):
+        '''
+        Bounded least-recently-used cache with hit and miss counters. Shared by
+        the system matrix, PID baseline and fitness caches, which differ only
+        in their keys and entries.
+
+        Inputs:
+            maxsize: Maximum number of entries kept; the least recently used
+                entry is evicted when the cache is full.
+        '''
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+
+    def get(self,key):
+        '''
+        Returns the entry stored under key, or None if there is none.
+        '''
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self,key,entry):
+        '''
+        Stores entry under key, evicting the least recently used entry if full.
+        '''
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        '''
+        Removes all entries and resets the hit/miss counters.
+        '''
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def info(self):
+        '''
+        Returns a dictionary with the hit and miss counts and the current and
+        maximum number of entries.
+        '''
+        return {'hits': self.hits, 'misses': self.misses,
+                'size': len(self.entries), 'maxsize': self.maxsize}
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 19:26:48 2026
+
+@author: Zeke
+"""
+import math
+import operator
+import numpy as np
+from scipy.special import expit
+
+BACKENDS = ('numpy','python')
+# Shapes of Net2's parameters in the order they are stored in a flat parameter
+# vector: fc1.weight, fc1.bias, fc2.weight, fc2.bias, fc3.weight, fc3.bias
+NET2_PARAM_SHAPES = ((10,6),(10,),(5,10),(5,),(1,5),(1,))
+NET2_PARAM_SIZES = tuple(int(np.prod(shape)) for shape in NET2_PARAM_SHAPES)
+NET2_PARAM_OFFSETS = tuple(int(offset) for offset in np.cumsum((0,)+NET2_PARAM_SIZES))
+N_NET2_PARAMS = NET2_PARAM_OFFSETS[-1]
+
+class Net2Inference(object):
+    def __init__(self,W1,b1,W2,b2,W3,b3,backend='numpy'):
+        '''
+        Forward pass of a 6-10-5-1 Net2 neurocontroller without torch, for use
+        in rollouts where the network is only evaluated and never trained. The
+        three sigmoid layers are evaluated either as Numpy matrix products or
+        as pure-Python loops over lists of floats; see
+        benchmarks.net2_inference_benchmark for their latency. Computations
+        are in double precision, so outputs agree with the single-precision
+        torch network to about 1e-6.
+
+        An instance can be passed to NN2Control.calc_steer_control in place of
+        the torch network.
+
+        Inputs:
+            W1, b1: Weights (10,6) and biases (10,) of the first layer
+            W2, b2: Weights (5,10) and biases (5,) of the second layer
+            W3, b3: Weights (1,5) and biases (1,) of the output layer
+            backend: 'numpy' or 'python'
+        '''
+        if backend not in BACKENDS:
+            raise ValueError('backend must be one of {}, not {}'.format(BACKENDS,backend))
+        self.backend = backend
+        self.weights = [np.array(W,dtype=float) for W in (W1,W2,W3)]
+        self.biases = [np.array(b,dtype=float) for b in (b1,b2,b3)]
+        # Rows of (weights, bias) per neuron for the pure-Python backend
+        self._layers = [[(list(row),bias) for row, bias in zip(W.tolist(),b.tolist())]
+                        for W, b in zip(self.weights,self.biases)]
+
+    @classmethod
+    def from_network(cls,network,backend='numpy'):
+        '''
+        Exports the current weights of a torch Net2. Later changes to the
+        network's weights are not reflected in the returned object.
+        '''
+        params = []
+        for layer in (network.fc1,network.fc2,network.fc3):
+            params.append(layer.weight.detach().cpu().double().numpy())
+            params.append(layer.bias.detach().cpu().double().numpy())
+        return cls(*params,backend=backend)
+
+    @classmethod
+    def from_vector(cls,vector,backend='numpy'):
+        '''
+        Builds the network from a flat parameter vector of size N_NET2_PARAMS,
+        laid out as described by NET2_PARAM_SHAPES.
+        '''
+        return cls(*parameter_views(vector),backend=backend)
+
+    def predict(self,inputs):
+        '''
+        Evaluates the network for one input vector.
+
+        Inputs:
+            inputs: Sequence of the 6 network inputs, [ct_err, hd_err, ctrl_vel,
+                ct_err_diff, ct_err_int, HD2] for NN2Control
+
+        Outputs:
+            Steer angle command (radians) as a float
+        '''
+        if self.backend == 'python':
+            x = inputs
+            for layer in self._layers:
+                x = [_sigmoid(sum(map(operator.mul,row,x)) + bias) for row, bias in layer]
+            out = x[0]
+        else:
+            x = np.asarray(inputs,dtype=float)
+            for W, b in zip(self.weights,self.biases):
+                x = expit(np.dot(W,x) + b)
+            out = float(x[0])
+        return out*4/5*math.pi - 2*math.pi/5
+
+    def __call__(self,inputs):
+        return self.predict(inputs)
+
+def _sigmoid(x):
+    '''
+    Numerically stable logistic function of a float.
+    '''
+    if x >= 0:
+        return 1/(1 + math.exp(-x))
+    else:
+        e = math.exp(x)
+        return e/(1 + e)
+
+class BatchNet2Inference(object):
+    def __init__(self,W1,b1,W2,b2,W3,b3):
+        '''
+        Forward pass of a population of P Net2 neurocontrollers at once. The
+        weights of all networks are stacked into (P,10,6), (P,5,10) and (P,1,5)
+        arrays, so each layer is one batched matrix product that gives every
+        network's output for its own input.
+
+        Inputs:
+            W1, b1: Stacked weights (P,10,6) and biases (P,10) of the first layer
+            W2, b2: Stacked weights (P,5,10) and biases (P,5) of the second layer
+            W3, b3: Stacked weights (P,1,5) and biases (P,1) of the output layer
+        '''
+        # Views of the caller's arrays are kept when possible, so a population
+        # array can be evaluated without copying it
+        self.weights = [np.asarray(W,dtype=float) for W in (W1,W2,W3)]
+        self.biases = [np.asarray(b,dtype=float) for b in (b1,b2,b3)]
+        self.n = len(self.weights[0])
+        for W, b in zip(self.weights,self.biases):
+            if W.ndim != 3 or len(W) != self.n or b.shape != W.shape[:2]:
+                raise ValueError('Stacked weights and biases must have shapes (P,out,in) and (P,out)')
+
+    @classmethod
+    def from_networks(cls,networks):
+        '''
+        Stacks the current weights of a list of torch Net2 networks or
+        Net2Inference objects.
+        '''
+        params = []
+        for network in networks:
+            if not isinstance(network,Net2Inference):
+                network = Net2Inference.from_network(network)
+            params.append([p for W, b in zip(network.weights,network.biases) for p in (W,b)])
+        # Stack each of W1, b1, ..., b3 across the population
+        return cls(*[np.stack(layer) for layer in zip(*params)])
+
+    @classmethod
+    def from_population(cls,population):
+        '''
+        Evaluates a population stored as a (P,N_NET2_PARAMS) array of flat
+        parameter vectors. The layers are views into population, so later
+        changes to it are seen by the returned object.
+        '''
+        return cls(*parameter_views(population))
+
+    def predict(self,inputs):
+        '''
+        Evaluates every network on its own input vector.
+
+        Inputs:
+            inputs: Numpy array of shape (P,6); row k is the input of network k
+
+        Outputs:
+            Numpy array of shape (P,) of steer angle commands (radians)
+        '''
+        x = np.asarray(inputs,dtype=float)
+        for W, b in zip(self.weights,self.biases):
+            x = expit(np.matmul(W,x[:,:,None])[:,:,0] + b)
+        return x[:,0]*4/5*math.pi - 2*math.pi/5
+
+    def __call__(self,inputs):
+        return self.predict(inputs)
+
+def parameter_views(params):
+    '''
+    Splits flat Net2 parameter vectors into the network's layer parameters.
+
+    Inputs:
+        params: Numpy array of shape (N_NET2_PARAMS,) for one network, or
+            (P,N_NET2_PARAMS) for a population
+
+    Outputs:
+        List of views of params with the shapes in NET2_PARAM_SHAPES, each with
+        a leading population axis if params is two-dimensional
+    '''
+    params = np.asarray(params)
+    if params.shape[-1] != N_NET2_PARAMS:
+        raise ValueError('Expected {} parameters, got {}'.format(N_NET2_PARAMS,params.shape[-1]))
+    lead = params.shape[:-1]
+    return [params[...,start:stop].reshape(lead+shape) for start, stop, shape in
+            zip(NET2_PARAM_OFFSETS[:-1],NET2_PARAM_OFFSETS[1:],NET2_PARAM_SHAPES)]
+
+def network_to_vector(network):
+    '''
+    Returns the parameters of a torch Net2 as a flat float64 vector.
+    '''
+    return np.concatenate([layer_param.detach().cpu().double().numpy().ravel()
+                           for layer in (network.fc1,network.fc2,network.fc3)
+                           for layer_param in (layer.weight,layer.bias)])
+
+def vector_to_network(vector,network):
+    '''
+    Copies a flat parameter vector into the parameters of a torch Net2, in
+    place, and returns the network.
+    '''
+    import torch
+    views = parameter_views(vector)
+    params = [layer_param for layer in (network.fc1,network.fc2,network.fc3)
+              for layer_param in (layer.weight,layer.bias)]
+    with torch.no_grad():
+        for layer_param, view in zip(params,views):
+            layer_param.copy_(torch.from_numpy(np.ascontiguousarray(view)))
+    return network
@@ -14,9 +14,17 @@ Created on Wed Nov  6 12:23:05 2019
 @author: Zeke
 """
 import numpy as np
+from path_index import get_path_index, group_by_path
+import geometry
+# Geometry kernels, re-exported for existing importers
+from geometry import path_distance, minimum_distance, project_point_on_segment, wrap_to_pi
 import torch
+from net2_inference import Net2Inference
 
 class NN2Control(object):
+    # Size of the array returned by snapshot
+    SNAPSHOT_SIZE = 8
+    
     def __init__(self,
               control_lookahead = 50):
         '''
@@ -44,6 +52,43 @@ class NN2Control(object):
         self.last_closest_idx = 0
         self.t_d1 = 0
         
+    def snapshot(self,out=None):
+        '''
+        Returns the controller state as a flat array of size SNAPSHOT_SIZE,
+        [err_int (2), err_d1 (2), diff_d1 (2), last_closest_idx, t_d1], which
+        can be passed to restore to return the controller to this point.
+        
+        Inputs:
+            out: Optional Numpy array of shape (SNAPSHOT_SIZE,) to write into.
+        '''
+        if out is None:
+            out = np.empty(self.SNAPSHOT_SIZE)
+        out[0:2] = self.err_int
+        out[2:4] = self.err_d1
+        out[4:6] = self.diff_d1
+        out[6] = self.last_closest_idx
+        out[7] = self.t_d1
+        return out
+    
+    def restore(self,snapshot):
+        '''
+        Restores the controller state saved by snapshot.
+        '''
+        self.err_int = np.array(snapshot[0:2])
+        self.err_d1 = np.array(snapshot[2:4])
+        self.diff_d1 = np.array(snapshot[4:6])
+        self.last_closest_idx = int(snapshot[6])
+        self.t_d1 = float(snapshot[7])
+        
+    def fork(self):
+        '''
+        Returns a new controller with the same settings and in the same state as
+        this one, which can be run independently from this point on.
+        '''
+        other = NN2Control(self.ctrl_look)
+        other.restore(self.snapshot())
+        return other
+    
     def calc_steer_control(self,t,state,path_x,path_y,path_vel,HD2,network,noise=None):
         '''
         Calculates steering control given a path and current state.
@@ -59,6 +104,10 @@ class NN2Control(object):
             path_x: Array of x-coordinates for points that discretize the desired path
             path_y: Array of y-coordinates for points that discretize the desired path
             path_vel: Array of truck velocities desired at each point that discretizes the desired path
+            HD2: Articulation angle between truck and trailer fed to the network
+            network: Net2 torch module, or a Net2Inference exported from one for
+                faster evaluation
+            noise: Standard deviation of noise added to the errors
             
             Note that path_x, path_y, and path_vel must be the same length for correct functionality.
             
@@ -69,15 +118,12 @@ class NN2Control(object):
         # Find index of closest point along path
         # Note that this method assumes positive progress along the path at every time step
         # since it only checks points ahead of the last closest index
-        dist_squared = [(state[0]-x)**2 + (state[1]-y)**2 
-                  for x,y in zip(path_x[self.last_closest_idx:self.last_closest_idx+self.ctrl_look],
-                     path_y[self.last_closest_idx:self.last_closest_idx+self.ctrl_look])]
-        
-        I_min = self.last_closest_idx + np.argmin(dist_squared)
+        path_index = get_path_index(path_x,path_y)
+        I_min = path_index.closest_point_in_window(state[0],state[1],self.last_closest_idx,self.ctrl_look)
         # Get the desired velocity at the closest point
         ctrl_vel = path_vel[I_min]
         # Find cross-track and heading error between the current ppsition and desired path
-        ct_err, hd_err = calc_path_error(state,path_x,path_y,I_min)
+        ct_err, hd_err = path_index.path_error(state,I_min,include_steer=True)
         if noise is not None:
             added_noise = np.random.normal(0,noise)
             added_ct_noise=np.random.normal(0,noise)
@@ -89,12 +135,12 @@ class NN2Control(object):
         tau = 0.1 # Time constant for filtering discrete derivatives
         err_diff = ((2*tau-Ts)/(2*tau+Ts))*self.diff_d1 + (2/(2*tau+Ts))*(err-self.err_d1)
         self.err_int += (err+self.err_d1)/2
-        stuff1=list(err)
-        stuff2=list(err_diff)
-        stuff3=list(self.err_int)
-        ctrl_delta=network(torch.tensor([float(stuff1[0]),float(stuff1[1]),float(ctrl_vel),float(stuff2[0]),float(stuff3[0]),float(HD2)]))
-        ctrl_delta=ctrl_delta.data.numpy()
-        ctrl_delta=np.asscalar(ctrl_delta)
+        inputs = [float(err[0]),float(err[1]),float(ctrl_vel),float(err_diff[0]),float(self.err_int[0]),float(HD2)]
+        if isinstance(network,Net2Inference):
+            ctrl_delta = network.predict(inputs)
+        else:
+            with torch.no_grad():
+                ctrl_delta = network(torch.tensor(inputs)).item()
         # Limit the steer angle command
         if ctrl_delta > 2*np.pi/5:
             ctrl_delta = 2*np.pi/5
@@ -109,44 +155,99 @@ class NN2Control(object):
         
         return ctrl_delta, ctrl_vel, err, self.err_int, err_diff
         
+class BatchNN2Control(object):
+    # Number of columns of the array returned by snapshot
+    SNAPSHOT_SIZE = NN2Control.SNAPSHOT_SIZE
+
+    def __init__(self,n_vehicles,control_lookahead = 50):
+        '''
+        Neural network controller for N vehicles, equivalent to N independent
+        NN2Control objects but with the controller state stored in arrays and
+        every step vectorized across vehicles. Each vehicle is driven by its own
+        network from a BatchNet2Inference population.
+
+        Inputs:
+            n_vehicles: Number of vehicles controlled
+            control_lookahead: Number of points ahead of the previous closest
+                point on the path that the controller looks to find the next
+                closest point.
+        '''
+        self.n = n_vehicles
+        self.ctrl_look = control_lookahead
+        self.reset()
+
+    def reset(self):
+        '''
+        Resets the integral and derivative terms of all vehicles
+        '''
+        self.err_int = np.zeros((self.n,2))
+        self.err_d1 = np.zeros((self.n,2))
+        self.diff_d1 = np.zeros((self.n,2))
+        self.last_closest_idx = np.zeros(self.n,dtype=int)
+        self.t_d1 = np.zeros(self.n)
+
+    def calc_steer_control(self,t,states,paths,HD2,network,noise=None):
+        '''
+        Calculates steering control for all vehicles given their paths and
+        current states.
+
+        Inputs:
+            t: Current time value of simulation, as a float or an array of shape (N,)
+            states: Numpy array of shape (N,5) of [x_front, y_front, delta,
+                theta1, theta2] for each vehicle, as for NN2Control
+            paths: Either one (path_x, path_y, path_vel) tuple followed by all
+                vehicles, or a list of N such tuples
+            HD2: Numpy array of shape (N,) of the articulation angles fed to the networks
+            network: BatchNet2Inference with one network per vehicle
+            noise: Standard deviation of noise added to the errors
+
+        Returns:
+            ctrl_delta: Numpy array of shape (N,) of desired steer tire angles
+            ctrl_vel: Numpy array of shape (N,) of desired velocities
+            err: Numpy array of shape (N,2) of cross-track and heading errors
+            err_int: Numpy array of shape (N,2) of integrated errors
+            err_diff: Numpy array of shape (N,2) of filtered error derivatives
+        '''
+        if network.n != self.n:
+            raise ValueError('Expected {} networks, got {}'.format(self.n,network.n))
+        states = np.asarray(states,dtype=float)
+        I_min = np.empty(self.n,dtype=int)
+        ctrl_vel = np.empty(self.n)
+        err = np.empty((self.n,2))
+        for (path_x,path_y,path_vel), idx in group_by_path(paths,self.n):
+            # Find index of closest point along path and the errors relative to it
+            path_index = get_path_index(path_x,path_y)
+            I_min[idx] = path_index.closest_points_in_window(states[idx,0],states[idx,1],self.last_closest_idx[idx],self.ctrl_look)
+            ctrl_vel[idx] = np.asarray(path_vel)[I_min[idx]]
+            err[idx,0], err[idx,1] = path_index.path_errors(states[idx],I_min[idx],include_steer=True)
+        if noise is not None:
+            err[:,1] += np.random.normal(0,noise,self.n)
+            err[:,0] += np.random.normal(0,noise,self.n)
+        # Compute desired steering angle
+        Ts = (t - self.t_d1)[:,None]
+        tau = 0.1 # Time constant for filtering discrete derivatives
+        err_diff = ((2*tau-Ts)/(2*tau+Ts))*self.diff_d1 + (2/(2*tau+Ts))*(err-self.err_d1)
+        self.err_int += (err+self.err_d1)/2
+        inputs = np.column_stack((err[:,0],err[:,1],ctrl_vel,err_diff[:,0],self.err_int[:,0],HD2))
+        ctrl_delta = network.predict(inputs)
+        # Limit the steer angle command
+        ctrl_delta = np.clip(ctrl_delta,-2*np.pi/5,2*np.pi/5)
+
+        # Age the data
+        self.t_d1 = np.broadcast_to(np.asarray(t,dtype=float),(self.n,)).copy()
+        self.err_d1 = err
+        self.diff_d1 = err_diff
+        self.last_closest_idx = I_min
+
+        return ctrl_delta, ctrl_vel, err, self.err_int, err_diff
+
 def calc_path_error(state,path_x,path_y,I_min):
     '''
-    Calculates cross-track and heading error for a given state relative to a path.
-    
-    Inputs:
-        state: numpy array containing [x_front, y_front, delta, theta1, theta2] which represent, as follows:
-            x_front: x-coordinate of current front axle location in world coordinates
-            y_front: y-coordinate of current front axle location in world coordinates
-            delta: current steer tire angle relative to vehicle (radians)
-            theta1: absolute orientation of truck in world coordinates (radians)
-            theta2: absolute orientation of trailer in world coordinates (radians)
-        path_x: Array of x-coordinates for points that discretize the desired path
-        path_y: Array of y-coordinates for points that discretize the desired path
-        I_min: index of point relative to which error should be calculated; typically,
-            the index of the point with the shortest distance to state.
+    Calculates cross-track and heading error for a given state relative to a
+    path, taking the heading of the truck as delta + theta1. See
+    geometry.calc_path_error.
     '''
-    # Start by determining closest three points on the desired path curve
-    closest_pt = np.array([path_x[I_min],path_y[I_min]])
-    if I_min > 0:
-        closest_pt_rev = np.array([path_x[I_min-1],path_y[I_min-1]])
-    else:
-        closest_pt_rev = closest_pt
-    if I_min < len(path_x)-1:
-        closest_pt_fwd = np.array([path_x[I_min+1],path_y[I_min+1]])
-    else:
-        closest_pt_fwd = closest_pt
-        
-    # Get the cross track error by finding minimum distance from the line
-    # segments defined by these three points
-    ct_error = path_distance(closest_pt_rev, closest_pt, closest_pt_fwd, np.array([state[0],state[1]]))
-    
-    # Get the heading of the path by taking the arctangent of the vector
-    # from the reverse closest point to the forward closest point
-    tan_vec = closest_pt_fwd - closest_pt_rev
-    path_angle = np.arctan2(tan_vec[1],tan_vec[0])
-    heading_error = wrap_to_pi(state[2] + state[3] - path_angle)
-    
-    return ct_error, heading_error
+    return geometry.calc_path_error(state,path_x,path_y,I_min,include_steer=True)
 
 def calc_trailer_error(state,path_x,path_y):
     '''
@@ -183,90 +284,4 @@ def calc_trailer_error(state,path_x,path_y):
     
     return ct_error
         
-    
-def path_distance(path_pt_rev, path_pt, path_pt_fwd, cur_point):
-    '''
-    Calculates the distance from a given point to a path segment discretized as two
-    line segments. The segments run from path_pt_rev to path_pt and from path_pt to path_pt_fwd.
-    
-    Inputs:
-        path_pt_rev: Numpy array, first point of first line segment. Must be of shape (2,)
-        path_pt: Numpy array, second point of first line segment, first point of second line segment. Must be of shape (2,)
-        path_pt_fwd: Numpy array, second point of second line segment. Must be of shape (2,)
-        cur_point: Numpy array, coordinates of point where distance from path is measured. Must be of shape (2,)
-        
-    Output:
-        Distance from cur_point to the path segment.
-    '''
-    # Determine the absolute minimum distance between the path and the 
-    # current point based on line segments given by the three points
-    dist_rev = minimum_distance(path_pt_rev, path_pt, cur_point)
-    dist_fwd = minimum_distance(path_pt, path_pt_fwd, cur_point)
-    # Return absolute minimum distance
-    if abs(dist_rev) < abs(dist_fwd):
-        return dist_rev
-    else:
-        return dist_fwd
-    
-def minimum_distance(v,w,p):
-    '''
-    Calculates the directional distance between a line segment and a point.
-    Projects the point onto the line segment and then utilizes the cross product
-    to determine whether the distance is "positive" or "negative". Positive values
-    indicate the point lies on the "right-hand" side of the vector if the vector 
-    is pointing upward; negative values indicate the opposite.
-    
-    Inputs:
-        v: First point of line segment; must be a Numpy array of shape (2,)
-        w: Second point of line segment; must be a Numpy array of shape (2,)
-        p: Point to which distance is to be calculated; must be a Numpy array of shape (2,)
-        
-    Output:
-        Signed distance from point to line
-    '''
-    
-    # Project the point on the line segment to obtain the projected point
-    proj = project_point_on_segment(v,w,p)
-    if np.array_equal(v,w):
-        return np.sqrt((p[0]-proj[0])**2 + (p[1]-proj[1])**2)
-    else:
-        # Take the cross product of the vector between the point and the projection and
-        # the normalized vector of the line segment; this returns the signed distance
-        return np.cross(p-proj, (w-v)/np.linalg.norm(w-v))
-
-def project_point_on_segment(v, w, p):
-    '''
-    Projects a point p onto the line segment running from point v to point w.
-    
-    Inputs:
-        v: First point of line segment; must be a Numpy array of shape (2,)
-        w: Second point of line segment; must be a Numpy array of shape (2,)
-        p: Point to which distance is to be calculated; must be a Numpy array of shape (2,)
-        
-    Output:
-        Projection of point p onto line segment vw, as a Numpy array of shape (2,)
-    '''
-    # Equation for distance from a point to a line segment
-    length_sq = (v[0]-w[0])**2 + (v[1]-w[1])**2
-    if length_sq == 0:
-        return v
-    else:
-        # Project point on the line given by line segment and restrict
-        # the projection to the range [0,1]
-        t = np.max([0, np.min([1, np.dot(p-v,w-v)/length_sq])])
-        return v + t*(w-v)
-        
-def wrap_to_pi(angle):
-    '''
-    Wraps the input angle to the range [-pi, pi]
-    
-    Inputs:
-        angle: Angle to be wrapped to range [-pi, pi]
-        
-    Output:
-        Equivalent angle within range [-pi, pi]
-    '''
-    wrap = np.remainder(angle, 2*np.pi)
-    if abs(wrap) > np.pi:
-        wrap -= 2*np.pi * np.sign(wrap)
-    return wrap
\ No newline at end of file
+    
\ No newline at end of file
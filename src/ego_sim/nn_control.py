@@ -14,6 +14,10 @@ Created on Wed Nov  6 12:23:05 2019
 @author: Zeke
 """
 import numpy as np
+from path_index import get_path_index
+import geometry
+# Geometry kernels, re-exported for existing importers
+from geometry import path_distance, minimum_distance, project_point_on_segment, wrap_to_pi
 import torch
 
 class NNControl(object):
@@ -69,15 +73,12 @@ class NNControl(object):
         # Find index of closest point along path
         # Note that this method assumes positive progress along the path at every time step
         # since it only checks points ahead of the last closest index
-        dist_squared = [(state[0]-x)**2 + (state[1]-y)**2 
-                  for x,y in zip(path_x[self.last_closest_idx:self.last_closest_idx+self.ctrl_look],
-                     path_y[self.last_closest_idx:self.last_closest_idx+self.ctrl_look])]
-        
-        I_min = self.last_closest_idx + np.argmin(dist_squared)
+        path_index = get_path_index(path_x,path_y)
+        I_min = path_index.closest_point_in_window(state[0],state[1],self.last_closest_idx,self.ctrl_look)
         # Get the desired velocity at the closest point
         ctrl_vel = path_vel[I_min]
         # Find cross-track and heading error between the current ppsition and desired path
-        ct_err, hd_err = calc_path_error(state,path_x,path_y,I_min)
+        ct_err, hd_err = path_index.path_error(state,I_min,include_steer=True)
         err = np.array([ct_err,hd_err])
         # Compute desired steering angle
         Ts = t - self.t_d1
@@ -92,8 +93,7 @@ class NNControl(object):
         stuff3=list(self.err_int)
         ctrl_delta=network(torch.tensor([float(stuff[0]),float(stuff[1]),ctrl_vel,float(stuff2[0]),float(stuff2[1]),float(stuff3[0]),float(stuff3[1])]))
         #print(ctrl_vel, path_vel)
-        ctrl_delta=ctrl_delta.data.numpy()
-        ctrl_delta=np.asscalar(ctrl_delta)
+        ctrl_delta=ctrl_delta.item()
         # Age the data
         self.t_d1 = t
         self.err_d1 = err
@@ -102,128 +102,11 @@ class NNControl(object):
         
         return ctrl_delta, ctrl_vel, err, self.err_int, err_diff
         
-def calc_path_error(state,path_x,path_y,I_min):
-    '''
-    Calculates cross-track and heading error for a given state relative to a path.
-    
-    Inputs:
-        state: numpy array containing [x_front, y_front, delta, theta1, theta2] which represent, as follows:
-            x_front: x-coordinate of current front axle location in world coordinates
-            y_front: y-coordinate of current front axle location in world coordinates
-            delta: current steer tire angle relative to vehicle (radians)
-            theta1: absolute orientation of truck in world coordinates (radians)
-            theta2: absolute orientation of trailer in world coordinates (radians)
-        path_x: Array of x-coordinates for points that discretize the desired path
-        path_y: Array of y-coordinates for points that discretize the desired path
-        I_min: index of point relative to which error should be calculated; typically,
-            the index of the point with the shortest distance to state.
-    '''
-    # Start by determining closest three points on the desired path curve
-    closest_pt = np.array([path_x[I_min],path_y[I_min]])
-    if I_min > 0:
-        closest_pt_rev = np.array([path_x[I_min-1],path_y[I_min-1]])
-    else:
-        closest_pt_rev = closest_pt
-    if I_min < len(path_x)-1:
-        closest_pt_fwd = np.array([path_x[I_min+1],path_y[I_min+1]])
-    else:
-        closest_pt_fwd = closest_pt
-        
-    # Get the cross track error by finding minimum distance from the line
-    # segments defined by these three points
-    ct_error = path_distance(closest_pt_rev, closest_pt, closest_pt_fwd, np.array([state[0],state[1]]))
-    
-    # Get the heading of the path by taking the arctangent of the vector
-    # from the reverse closest point to the forward closest point
-    tan_vec = closest_pt_fwd - closest_pt_rev
-    path_angle = np.arctan2(tan_vec[1],tan_vec[0])
-    heading_error = wrap_to_pi(state[2] + state[3] - path_angle)
-    
-    return ct_error, heading_error
-    
-def path_distance(path_pt_rev, path_pt, path_pt_fwd, cur_point):
-    '''
-    Calculates the distance from a given point to a path segment discretized as two
-    line segments. The segments run from path_pt_rev to path_pt and from path_pt to path_pt_fwd.
-    
-    Inputs:
-        path_pt_rev: Numpy array, first point of first line segment. Must be of shape (2,)
-        path_pt: Numpy array, second point of first line segment, first point of second line segment. Must be of shape (2,)
-        path_pt_fwd: Numpy array, second point of second line segment. Must be of shape (2,)
-        cur_point: Numpy array, coordinates of point where distance from path is measured. Must be of shape (2,)
-        
-    Output:
-        Distance from cur_point to the path segment.
-    '''
-    # Determine the absolute minimum distance between the path and the 
-    # current point based on line segments given by the three points
-    dist_rev = minimum_distance(path_pt_rev, path_pt, cur_point)
-    dist_fwd = minimum_distance(path_pt, path_pt_fwd, cur_point)
-    # Return absolute minimum distance
-    if abs(dist_rev) < abs(dist_fwd):
-        return dist_rev
-    else:
-        return dist_fwd
-    
-def minimum_distance(v,w,p):
-    '''
-    Calculates the directional distance between a line segment and a point.
-    Projects the point onto the line segment and then utilizes the cross product
-    to determine whether the distance is "positive" or "negative". Positive values
-    indicate the point lies on the "right-hand" side of the vector if the vector 
-    is pointing upward; negative values indicate the opposite.
-    
-    Inputs:
-        v: First point of line segment; must be a Numpy array of shape (2,)
-        w: Second point of line segment; must be a Numpy array of shape (2,)
-        p: Point to which distance is to be calculated; must be a Numpy array of shape (2,)
-        
-    Output:
-        Signed distance from point to line
-    '''
-    
-    # Project the point on the line segment to obtain the projected point
-    proj = project_point_on_segment(v,w,p)
-    if np.array_equal(v,w):
-        return np.sqrt((p[0]-proj[0])**2 + (p[1]-proj[1])**2)
-    else:
-        # Take the cross product of the vector between the point and the projection and
-        # the normalized vector of the line segment; this returns the signed distance
-        return np.cross(p-proj, (w-v)/np.linalg.norm(w-v))
 
-def project_point_on_segment(v, w, p):
-    '''
-    Projects a point p onto the line segment running from point v to point w.
-    
-    Inputs:
-        v: First point of line segment; must be a Numpy array of shape (2,)
-        w: Second point of line segment; must be a Numpy array of shape (2,)
-        p: Point to which distance is to be calculated; must be a Numpy array of shape (2,)
-        
-    Output:
-        Projection of point p onto line segment vw, as a Numpy array of shape (2,)
-    '''
-    # Equation for distance from a point to a line segment
-    length_sq = (v[0]-w[0])**2 + (v[1]-w[1])**2
-    if length_sq == 0:
-        return v
-    else:
-        # Project point on the line given by line segment and restrict
-        # the projection to the range [0,1]
-        t = np.max([0, np.min([1, np.dot(p-v,w-v)/length_sq])])
-        return v + t*(w-v)
-        
-def wrap_to_pi(angle):
+def calc_path_error(state,path_x,path_y,I_min):
     '''
-    Wraps the input angle to the range [-pi, pi]
-    
-    Inputs:
-        angle: Angle to be wrapped to range [-pi, pi]
-        
-    Output:
-        Equivalent angle within range [-pi, pi]
+    Calculates cross-track and heading error for a given state relative to a
+    path, taking the heading of the truck as delta + theta1. See
+    geometry.calc_path_error.
     '''
-    wrap = np.remainder(angle, 2*np.pi)
-    if abs(wrap) > np.pi:
-        wrap -= 2*np.pi * np.sign(wrap)
-    return wrap
\ No newline at end of file
+    return geometry.calc_path_error(state,path_x,path_y,I_min,include_steer=True)
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 23:02:18 2026
+
+@author: Zeke
+"""
+import math
+from abc import ABC, abstractmethod
+import time
+import numpy as np
+
+class Optimizer(ABC):
+    '''
+    Interface of the population-based optimizers of flat Net2 parameter
+    vectors. Each generation, ask returns the candidates to evaluate as a
+    (P,N_NET2_PARAMS) array, and tell takes their fitness (lower is better)
+    in the same order. best_params and best_fitness give the best candidate
+    found so far. EvolutionaryAlgorithm, CMAES and OpenAIES implement it; a
+    subclass that does not implement all four cannot be instantiated.
+    '''
+    @abstractmethod
+    def ask(self):
+        pass
+
+    @abstractmethod
+    def tell(self,fitness):
+        pass
+
+    @property
+    @abstractmethod
+    def best_params(self):
+        pass
+
+    @property
+    @abstractmethod
+    def best_fitness(self):
+        pass
+
+class CMAES(Optimizer):
+    def __init__(self,mean,sigma=0.1,popsize=None,seed=None):
+        '''
+        Covariance matrix adaptation evolution strategy with the default
+        parameters of Hansen's tutorial (rank-one and rank-mu updates, and
+        cumulative step-size adaptation). Each generation's candidates are
+        drawn as one (popsize,n) matrix of normal samples.
+
+        Inputs:
+            mean: Initial mean of the search distribution, e.g. the flat
+                parameter vector of a Net2 from network_to_vector
+            sigma: Initial step size
+            popsize: Number of candidates per generation; 4 + 3 ln(n) if not given
+            seed: Seed of the optimizer's own random number generator
+        '''
+        self.mean = np.array(mean,dtype=float)
+        n = self.n = len(self.mean)
+        self.sigma = sigma
+        self.popsize = popsize if popsize is not None else 4 + int(3*math.log(n))
+        if self.popsize < 2:
+            raise ValueError('popsize must be at least 2')
+        self.rng = np.random.default_rng(seed)
+        # Recombination weights of the best mu candidates
+        self.mu = self.popsize//2
+        weights = math.log(self.mu + 0.5) - np.log(np.arange(1,self.mu+1))
+        self.weights = weights/np.sum(weights)
+        self.mueff = 1/np.sum(self.weights**2)
+        # Adaptation rates
+        self.cc = (4 + self.mueff/n)/(n + 4 + 2*self.mueff/n)
+        self.cs = (self.mueff + 2)/(n + self.mueff + 5)
+        self.c1 = 2/((n + 1.3)**2 + self.mueff)
+        self.cmu = min(1 - self.c1, 2*(self.mueff - 2 + 1/self.mueff)/((n + 2)**2 + self.mueff))
+        self.damps = 1 + 2*max(0, math.sqrt((self.mueff - 1)/(n + 1)) - 1) + self.cs
+        self.chi_n = math.sqrt(n)*(1 - 1/(4*n) + 1/(21*n**2))
+        # Evolution paths and covariance matrix C = B diag(D^2) B^T
+        self.pc = np.zeros(n)
+        self.ps = np.zeros(n)
+        self.C = np.eye(n)
+        self.B = np.eye(n)
+        self.D = np.ones(n)
+        self.generation = 0
+        self._steps = None
+        self._best_params = self.mean.copy()
+        self._best_fitness = np.inf
+
+    def ask(self):
+        '''
+        Returns popsize candidates drawn from N(mean, sigma^2 C).
+        '''
+        z = self.rng.standard_normal((self.popsize,self.n))
+        self._steps = np.dot(z*self.D,self.B.T)
+        return self.mean + self.sigma*self._steps
+
+    def tell(self,fitness):
+        '''
+        Updates the mean, evolution paths, covariance matrix and step size
+        from the fitness of the candidates returned by the last ask.
+        '''
+        fitness = np.asarray(fitness,dtype=float)
+        if self._steps is None or fitness.shape != (self.popsize,):
+            raise ValueError('tell must be given the fitness of the {} candidates of the last ask'.format(self.popsize))
+        order = np.argsort(fitness,kind='stable')
+        if fitness[order[0]] < self._best_fitness:
+            self._best_fitness = fitness[order[0]]
+            self._best_params = self.mean + self.sigma*self._steps[order[0]]
+        selected = self._steps[order[:self.mu]]
+        step = np.dot(self.weights,selected)
+        self.mean = self.mean + self.sigma*step
+        # Cumulation of the step in the isotropic and anisotropic evolution paths
+        inv_sqrt_C_step = np.dot(self.B,np.dot(self.B.T,step)/self.D)
+        self.ps = (1 - self.cs)*self.ps + math.sqrt(self.cs*(2 - self.cs)*self.mueff)*inv_sqrt_C_step
+        self.generation += 1
+        ps_norm = np.linalg.norm(self.ps)
+        hsig = ps_norm/math.sqrt(1 - (1 - self.cs)**(2*self.generation))/self.chi_n < 1.4 + 2/(self.n + 1)
+        self.pc = (1 - self.cc)*self.pc + hsig*math.sqrt(self.cc*(2 - self.cc)*self.mueff)*step
+        # Rank-one and rank-mu updates of the covariance matrix
+        rank_one = np.outer(self.pc,self.pc) + (1 - hsig)*self.cc*(2 - self.cc)*self.C
+        rank_mu = np.dot(selected.T*self.weights,selected)
+        self.C = (1 - self.c1 - self.cmu)*self.C + self.c1*rank_one + self.cmu*rank_mu
+        self.sigma *= math.exp((self.cs/self.damps)*(ps_norm/self.chi_n - 1))
+        self.C = (self.C + self.C.T)/2
+        eigvals, self.B = np.linalg.eigh(self.C)
+        self.D = np.sqrt(np.maximum(eigvals,1e-20))
+        self._steps = None
+
+    @property
+    def best_params(self):
+        return self._best_params
+
+    @property
+    def best_fitness(self):
+        return self._best_fitness
+
+class OpenAIES(Optimizer):
+    def __init__(self,mean,sigma=0.1,popsize=50,learning_rate=0.01,seed=None):
+        '''
+        Natural evolution strategy in the style of Salimans et al. (2017):
+        candidates are mean + sigma*eps with antithetic pairs (eps, -eps), the
+        fitness is shaped by centered ranks, and the mean follows the
+        resulting gradient estimate with Adam.
+
+        Inputs:
+            mean: Initial mean of the search distribution, e.g. the flat
+                parameter vector of a Net2 from network_to_vector
+            sigma: Standard deviation of the perturbations
+            popsize: Number of candidates per generation; must be even
+            learning_rate: Adam step size
+            seed: Seed of the optimizer's own random number generator
+        '''
+        if popsize < 2 or popsize % 2:
+            raise ValueError('popsize must be an even number of at least 2, not {}'.format(popsize))
+        self.mean = np.array(mean,dtype=float)
+        self.n = len(self.mean)
+        self.sigma = sigma
+        self.popsize = popsize
+        self.learning_rate = learning_rate
+        self.rng = np.random.default_rng(seed)
+        # Adam moment estimates
+        self.beta1 = 0.9
+        self.beta2 = 0.999
+        self.m = np.zeros(self.n)
+        self.v = np.zeros(self.n)
+        self.generation = 0
+        self._eps = None
+        self._best_params = self.mean.copy()
+        self._best_fitness = np.inf
+
+    def ask(self):
+        '''
+        Returns popsize candidates; the second half mirrors the first.
+        '''
+        half = self.rng.standard_normal((self.popsize//2,self.n))
+        self._eps = np.vstack((half,-half))
+        return self.mean + self.sigma*self._eps
+
+    def tell(self,fitness):
+        '''
+        Moves the mean along the rank-shaped gradient estimate of the fitness
+        of the candidates returned by the last ask.
+        '''
+        fitness = np.asarray(fitness,dtype=float)
+        if self._eps is None or fitness.shape != (self.popsize,):
+            raise ValueError('tell must be given the fitness of the {} candidates of the last ask'.format(self.popsize))
+        best = np.argmin(fitness)
+        if fitness[best] < self._best_fitness:
+            self._best_fitness = fitness[best]
+            self._best_params = self.mean + self.sigma*self._eps[best]
+        # Centered ranks in [-0.5,0.5], lowest fitness first
+        ranks = np.empty(self.popsize)
+        ranks[np.argsort(fitness,kind='stable')] = np.arange(self.popsize)
+        utilities = ranks/(self.popsize - 1) - 0.5
+        grad = np.dot(utilities,self._eps)/(self.popsize*self.sigma)
+        self.generation += 1
+        self.m = self.beta1*self.m + (1 - self.beta1)*grad
+        self.v = self.beta2*self.v + (1 - self.beta2)*grad**2
+        m_hat = self.m/(1 - self.beta1**self.generation)
+        v_hat = self.v/(1 - self.beta2**self.generation)
+        # Fitness is minimized, so the mean moves against the gradient
+        self.mean = self.mean - self.learning_rate*m_hat/(np.sqrt(v_hat) + 1e-8)
+        self._eps = None
+
+    @property
+    def best_params(self):
+        return self._best_params
+
+    @property
+    def best_fitness(self):
+        return self._best_fitness
+
+def run_optimizer(optimizer,evaluate,n_generations,time_budget=None):
+    '''
+    Runs an Optimizer for n_generations, or until time_budget seconds have
+    passed.
+
+    Inputs:
+        optimizer: Optimizer to run
+        evaluate: Function returning the fitness of a (P,N_NET2_PARAMS)
+            array of candidates as a Numpy array of shape (P,), e.g. a
+            ScenarioFitness
+        n_generations: Maximum number of generations
+        time_budget: Optional wall-clock limit, in seconds
+
+    Outputs:
+        List of (elapsed seconds, number of evaluations, best fitness so far)
+        after each generation
+    '''
+    history = []
+    n_evaluations = 0
+    start = time.perf_counter()
+    for generation in range(n_generations):
+        candidates = optimizer.ask()
+        optimizer.tell(evaluate(candidates))
+        n_evaluations += len(candidates)
+        elapsed = time.perf_counter() - start
+        history.append((elapsed, n_evaluations, optimizer.best_fitness))
+        if time_budget is not None and elapsed > time_budget:
+            break
+    return history
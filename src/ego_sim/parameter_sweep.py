@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 10:05:31 2026
+
+@author: Zeke
+"""
+import itertools
+import numpy as np
+import pandas as pd
+from ego_sim import EgoSim
+from batch_ego_sim import BatchEgoSim
+from stanley_pid import BatchStanleyPID
+from nn2_control import BatchNN2Control
+from net2_inference import BatchNet2Inference
+from Min_dist_test import calc_off_tracking
+
+PARAMETER_NAMES = ['m1_alpha','m2_alpha','Csteer_alpha','Cdrive_alpha','Ctrailer_alpha','l2_alpha']
+
+def parameter_grid(**alphas):
+    '''
+    Builds the full grid of EgoSim.modify_parameters arguments from lists of
+    alpha values, e.g. parameter_grid(m2_alpha=[0.5,1], Ctrailer_alpha=[0.5,1])
+    gives the four combinations of trailer mass and trailer stiffness.
+
+    Inputs:
+        alphas: Keyword arguments of modify_parameters, each given a list of values.
+
+    Outputs:
+        List of dictionaries, one per combination, that can be passed to
+        modify_parameters as keyword arguments.
+    '''
+    for name in alphas:
+        if name not in PARAMETER_NAMES:
+            raise ValueError('Unknown parameter {}; must be one of {}'.format(name,PARAMETER_NAMES))
+    names = list(alphas.keys())
+    return [dict(zip(names,values)) for values in itertools.product(*[alphas[name] for name in names])]
+
+def run_parameter_sweep(grid, paths, networks=None, noise=None):
+    '''
+    Runs every combination of parameter variant, path and controller as one
+    vectorized batch of closed-loop rollouts and returns the fitness of each.
+    Paths sharing the same time vector are simulated in the same BatchEgoSim.
+
+    Inputs:
+        grid: List of dictionaries of modify_parameters arguments, e.g. from
+            parameter_grid.
+        paths: List of (x_true, y_true, t, vel) tuples, as returned by
+            RandomPathGenerator.
+        networks: Dictionary mapping controller names to the network driving an
+            NN2Control, or to None for the StanleyPID baseline. Defaults to
+            {'PID': None}.
+        noise: Standard deviation of noise added to the controllers' errors.
+
+    Outputs:
+        pandas DataFrame with one row per rollout and columns for each
+        parameter in the grid, the path index, the controller name and the
+        fitness (sum squared off-tracking).
+    '''
+    if networks is None:
+        networks = {'PID': None}
+    names = [name for name in PARAMETER_NAMES if any(name in variant for variant in grid)]
+    rows = []
+    # Group paths that share a time vector so they can run in lockstep
+    groups = {}
+    for i, path in enumerate(paths):
+        t = path[2]
+        groups.setdefault((len(t), t[1]-t[0]), []).append(i)
+    for path_idxs in groups.values():
+        combos = list(itertools.product(range(len(grid)), path_idxs, networks.keys()))
+        t = paths[path_idxs[0]][2]
+        # One parameter holder per rollout, modified to its variant
+        vehicles = []
+        for variant_idx, path_idx, name in combos:
+            vehicle = EgoSim(sim_timestep = t[1]-t[0])
+            vehicle.modify_parameters(**grid[variant_idx])
+            vehicles.append(vehicle)
+        fitness = _batch_closed_loop_fitness(vehicles, combos, paths, networks, t, noise)
+        for k, (variant_idx, path_idx, name) in enumerate(combos):
+            row = {param: grid[variant_idx].get(param,1) for param in names}
+            row.update({'path': path_idx, 'controller': name, 'fitness': fitness[k]})
+            rows.append(row)
+    return pd.DataFrame(rows,columns=names+['path','controller','fitness'])
+
+def _batch_closed_loop_fitness(vehicles, combos, paths, networks, t, noise):
+    '''
+    Simulates the closed-loop rollouts described by combos in one BatchEgoSim
+    and returns the fitness of each rollout as a Numpy array. All StanleyPID
+    rollouts are controlled by one BatchStanleyPID and all neural network
+    rollouts by one BatchNN2Control, with their networks stacked in one
+    BatchNet2Inference.
+    '''
+    n = len(combos)
+    ego = BatchEgoSim(sim_timestep = t[1]-t[0], world_state_at_front=True, vehicles=vehicles)
+    nets = [networks[name] for _, _, name in combos]
+    pid_idx = np.array([k for k in range(n) if nets[k] is None],dtype=int)
+    nn_idx = np.array([k for k in range(n) if nets[k] is not None],dtype=int)
+    pid = BatchStanleyPID(len(pid_idx))
+    pid_paths = [(paths[combos[k][1]][0],paths[combos[k][1]][1],paths[combos[k][1]][3]) for k in pid_idx]
+    controller = BatchNN2Control(len(nn_idx))
+    nn_paths = [(paths[combos[k][1]][0],paths[combos[k][1]][1],paths[combos[k][1]][3]) for k in nn_idx]
+    if len(nn_idx) > 0:
+        network = BatchNet2Inference.from_networks([nets[k] for k in nn_idx])
+    x = np.zeros((len(t),n))
+    y = np.zeros((len(t),n))
+    th1 = np.zeros((len(t),n))
+    th2 = np.zeros((len(t),n))
+    ctrl = np.zeros((n,2))
+    for i in range(0,len(t)):
+        state = ego.convert_world_state_to_front()
+        if len(pid_idx) > 0:
+            ctrl_delta, ctrl_vel, _,_,_ = pid.calc_steer_control(t[i],state[pid_idx],pid_paths,noise=noise)
+            ctrl[pid_idx,0] = ctrl_vel
+            ctrl[pid_idx,1] = ctrl_delta
+        if len(nn_idx) > 0:
+            nn_state = state[nn_idx]
+            ctrl_delta, ctrl_vel, _,_,_ = controller.calc_steer_control(t[i],nn_state,nn_paths,nn_state[:,4]-nn_state[:,3],network,noise=noise)
+            ctrl[nn_idx,0] = ctrl_vel
+            ctrl[nn_idx,1] = ctrl_delta
+        state = ego.simulate_timestep(ctrl)
+        x[i] = state[:,0]; y[i] = state[:,1]; th1[i] = state[:,3]; th2[i] = state[:,4]
+    fitness = np.zeros(n)
+    for k, (_, path_idx, _) in enumerate(combos):
+        x_true, y_true, _, _ = paths[path_idx]
+        fitness[k], _ = calc_off_tracking(x[:,k], y[:,k], th1[:,k], th2[:,k], vehicles[k].P, x_true, y_true)
+    return fitness
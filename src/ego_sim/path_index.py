@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 16:40:12 2026
+
+@author: Zeke
+"""
+import math
+import numpy as np
+from collections import OrderedDict
+from scipy.spatial import cKDTree
+from geometry import wrap_to_pi, wrap_angles_to_pi
+
+class PathIndex(object):
+    def __init__(self,path_x,path_y):
+        '''
+        Precomputed geometry of a discretized path, built once per path so that
+        cross-track and heading errors can be looked up in constant time instead
+        of recomputing segment vectors and headings on every control step.
+        Results match geometry.calc_path_error to rounding error.
+
+        Segment i runs from path point i to path point i+1.
+
+        Inputs:
+            path_x: Array of x-coordinates for points that discretize the path
+            path_y: Array of y-coordinates for points that discretize the path
+        '''
+        if len(path_x) != len(path_y):
+            raise ValueError('path_x and path_y must be the same length')
+        if len(path_x) == 0:
+            raise ValueError('Path must contain at least one point')
+        self.path_x = path_x
+        self.path_y = path_y
+        # Read-only copies, so the index cannot be changed through them
+        self.x = np.array(path_x,dtype=float)
+        self.y = np.array(path_y,dtype=float)
+        self.x.flags.writeable = False
+        self.y.flags.writeable = False
+        self.n = len(self.x)
+        # Segment vectors, squared lengths and unit direction vectors
+        self.seg_dx = np.diff(self.x)
+        self.seg_dy = np.diff(self.y)
+        self.seg_len_sq = self.seg_dx**2 + self.seg_dy**2
+        self.seg_len = np.sqrt(self.seg_len_sq)
+        nonzero = self.seg_len_sq > 0
+        self.unit_x = np.zeros(self.n-1)
+        self.unit_y = np.zeros(self.n-1)
+        self.unit_x[nonzero] = self.seg_dx[nonzero]/self.seg_len[nonzero]
+        self.unit_y[nonzero] = self.seg_dy[nonzero]/self.seg_len[nonzero]
+        # Heading at each point from the reverse neighbour to the forward neighbour
+        idx = np.arange(self.n)
+        rev = np.maximum(idx-1,0)
+        fwd = np.minimum(idx+1,self.n-1)
+        self.heading = np.arctan2(self.y[fwd]-self.y[rev],self.x[fwd]-self.x[rev])
+        # Python lists are faster than Numpy arrays for scalar indexing
+        self._x = self.x.tolist()
+        self._y = self.y.tolist()
+        self._dx = self.seg_dx.tolist()
+        self._dy = self.seg_dy.tolist()
+        self._len_sq = self.seg_len_sq.tolist()
+        self._ux = self.unit_x.tolist()
+        self._uy = self.unit_y.tolist()
+        self._heading = self.heading.tolist()
+        self._tree = None
+
+    @property
+    def tree(self):
+        '''
+        KD-tree over the path points, built on first use.
+        '''
+        if self._tree is None:
+            self._tree = cKDTree(np.column_stack((self.x,self.y)))
+        return self._tree
+
+    def nearest_point_indices(self,px,py,k=8):
+        '''
+        Finds the index of the closest path point to each of a set of points
+        using the KD-tree. The result is identical to taking np.argmin of the
+        squared distances to every path point, including returning the lowest
+        index when several path points are equally close: the k nearest
+        candidates are re-checked with the brute-force distance formula, and
+        points whose candidates may not contain every tied path point fall
+        back to a full scan.
+
+        Inputs:
+            px: Array of x-coordinates of the query points, of any shape
+            py: Array of y-coordinates of the query points
+            k: Number of candidate path points returned by the KD-tree per query
+
+        Outputs:
+            Numpy integer array of closest path point indices, of the same shape
+            as px
+        '''
+        px = np.asarray(px,dtype=float)
+        py = np.asarray(py,dtype=float)
+        shape = px.shape
+        px = px.ravel()
+        py = py.ravel()
+        k = min(k,self.n)
+        _, cand = self.tree.query(np.column_stack((px,py)),k=k)
+        cand = cand.reshape(len(px),k)
+        # Re-evaluate the candidates exactly as the brute-force scan does
+        dist_squared = (px[:,None]-self.x[cand])**2 + (py[:,None]-self.y[cand])**2
+        best = dist_squared.min(axis=1)
+        I_min = np.where(dist_squared == best[:,None],cand,self.n).min(axis=1)
+        if k < self.n:
+            # If the farthest candidate is (nearly) as close as the best one,
+            # tied points may lie outside the candidate set
+            ambiguous = np.flatnonzero(dist_squared.max(axis=1) <= best*(1+1e-9) + 1e-300)
+            for i in ambiguous:
+                I_min[i] = np.argmin((px[i]-self.x)**2 + (py[i]-self.y)**2)
+        return I_min.reshape(shape)
+
+    def closest_point_in_window(self,px,py,start,window):
+        '''
+        Index of the closest path point to (px,py) among the points
+        start..start+window-1, found with one vectorized operation. Identical to
+        the controllers' previous list-based search followed by np.argmin.
+        '''
+        d_x = self.x[start:start+window] - px
+        d_y = self.y[start:start+window] - py
+        return start + int(np.argmin(d_x*d_x + d_y*d_y))
+
+    def closest_points_in_window(self,px,py,start,window):
+        '''
+        Batched closest_point_in_window for N vehicles on this path.
+
+        Inputs:
+            px, py: Arrays of shape (N,) of vehicle positions
+            start: Integer array of shape (N,) of each vehicle's first index to search
+            window: Number of points searched ahead of start
+
+        Outputs:
+            Integer array of shape (N,) of closest point indices
+        '''
+        start = np.asarray(start,dtype=int)
+        # Indices past the end of the path repeat the last point, so the first
+        # minimum is the same as in a truncated window
+        idx = np.minimum(start[:,None] + np.arange(window),self.n-1)
+        d_x = self.x[idx] - np.asarray(px,dtype=float)[:,None]
+        d_y = self.y[idx] - np.asarray(py,dtype=float)[:,None]
+        return start + np.argmin(d_x*d_x + d_y*d_y,axis=1)
+
+    def matches(self,path_x,path_y):
+        '''
+        Returns True if this index was built from exactly these path arrays.
+        '''
+        return self.path_x is path_x and self.path_y is path_y
+
+    def segment_distance(self,i,px,py):
+        '''
+        Signed distance from point (px,py) to segment i, equivalent to
+        geometry.minimum_distance(v,w,p). Zero-length segments give the
+        unsigned distance to the point.
+        '''
+        vx = self._x[i]
+        vy = self._y[i]
+        len_sq = self._len_sq[i]
+        if len_sq == 0:
+            return math.sqrt((px-vx)**2 + (py-vy)**2)
+        dx = self._dx[i]
+        dy = self._dy[i]
+        # Project the point on the segment, restricted to the range [0,1]
+        t = ((px-vx)*dx + (py-vy)*dy)/len_sq
+        if t < 0:
+            t = 0
+        elif t > 1:
+            t = 1
+        qx = px - (vx + t*dx)
+        qy = py - (vy + t*dy)
+        # Cross product with the segment's unit vector gives the signed distance
+        return qx*self._uy[i] - qy*self._ux[i]
+
+    def cross_track_error(self,px,py,I_min):
+        '''
+        Signed cross-track error of point (px,py) relative to the two segments
+        adjoining path point I_min, as in geometry.path_distance.
+        '''
+        if I_min > 0:
+            dist_rev = self.segment_distance(I_min-1,px,py)
+        else:
+            dist_rev = math.sqrt((px-self._x[0])**2 + (py-self._y[0])**2)
+        if I_min < self.n-1:
+            dist_fwd = self.segment_distance(I_min,px,py)
+        else:
+            dist_fwd = math.sqrt((px-self._x[I_min])**2 + (py-self._y[I_min])**2)
+        if abs(dist_rev) < abs(dist_fwd):
+            return dist_rev
+        else:
+            return dist_fwd
+
+    def segment_distances(self,i,px,py):
+        '''
+        Vectorized segment_distance: signed distance from each point
+        (px[j],py[j]) to segment i[j]. All inputs must broadcast together.
+        '''
+        vx = self.x[i]
+        vy = self.y[i]
+        dx = self.seg_dx[i]
+        dy = self.seg_dy[i]
+        len_sq = self.seg_len_sq[i]
+        degenerate = len_sq == 0
+        t = ((px-vx)*dx + (py-vy)*dy)/np.where(degenerate,1,len_sq)
+        t = np.clip(t,0,1)
+        qx = px - (vx + t*dx)
+        qy = py - (vy + t*dy)
+        signed = qx*self.unit_y[i] - qy*self.unit_x[i]
+        if np.any(degenerate):
+            signed = np.where(degenerate,np.sqrt((px-vx)**2 + (py-vy)**2),signed)
+        return signed
+
+    def cross_track_errors(self,px,py,I_min):
+        '''
+        Vectorized cross_track_error: signed cross-track error of every point
+        (px[j],py[j]) relative to the segments adjoining path point I_min[j],
+        computed in one Numpy pass. Inputs may be of any (common) shape, e.g.
+        (T,) for one trajectory or (T,N) for N trajectories along this path.
+
+        Inputs:
+            px: Array of x-coordinates of the points
+            py: Array of y-coordinates of the points
+            I_min: Integer array of path point indices, typically from
+                nearest_point_indices
+
+        Outputs:
+            Numpy array of signed cross-track errors, of the same shape as px
+        '''
+        px = np.asarray(px,dtype=float)
+        py = np.asarray(py,dtype=float)
+        I_min = np.asarray(I_min,dtype=int)
+        point_dist = np.sqrt((px-self.x[I_min])**2 + (py-self.y[I_min])**2)
+        if self.n == 1:
+            return point_dist
+        dist_rev = np.where(I_min > 0,self.segment_distances(np.maximum(I_min-1,0),px,py),point_dist)
+        dist_fwd = np.where(I_min < self.n-1,self.segment_distances(np.minimum(I_min,self.n-2),px,py),point_dist)
+        return np.where(np.abs(dist_rev) < np.abs(dist_fwd),dist_rev,dist_fwd)
+
+    def path_error(self,state,I_min,include_steer=False):
+        '''
+        Calculates cross-track and heading error for a given state relative to
+        the path.
+
+        Inputs:
+            state: Array-like containing [x_front, y_front, delta, theta1, theta2]
+            I_min: index of point relative to which error should be calculated;
+                typically, the index of the point with the shortest distance to state.
+            include_steer: If True, the heading is taken as delta + theta1 (as in
+                nn2_control.calc_path_error); otherwise theta1 (as in
+                stanley_pid.calc_path_error).
+
+        Outputs:
+            ct_error: Signed cross-track error
+            heading_error: Heading error wrapped to [-pi, pi]
+        '''
+        I_min = int(I_min)
+        ct_error = self.cross_track_error(float(state[0]),float(state[1]),I_min)
+        if include_steer:
+            heading = state[2] + state[3]
+        else:
+            heading = state[3]
+        heading_error = wrap_to_pi(float(heading) - self._heading[I_min])
+        return ct_error, heading_error
+
+    def path_errors(self,states,I_min,include_steer=False):
+        '''
+        Vectorized path_error for N states at once.
+
+        Inputs:
+            states: Numpy array of shape (N,5) of [x_front, y_front, delta, theta1, theta2]
+            I_min: Integer array of shape (N,) of path point indices
+            include_steer: As for path_error
+
+        Outputs:
+            ct_error: Numpy array of shape (N,) of signed cross-track errors
+            heading_error: Numpy array of shape (N,) of heading errors
+        '''
+        states = np.asarray(states,dtype=float)
+        I_min = np.asarray(I_min,dtype=int)
+        ct_error = self.cross_track_errors(states[:,0],states[:,1],I_min)
+        if include_steer:
+            heading = states[:,2] + states[:,3]
+        else:
+            heading = states[:,3]
+        heading_error = wrap_angles_to_pi(heading - self.heading[I_min])
+        return ct_error, heading_error
+
+def group_by_path(paths,n):
+    '''
+    Groups N vehicles by the path they follow, for batched controllers.
+
+    Inputs:
+        paths: Either one (path_x, path_y, path_vel) tuple followed by all
+            vehicles, or a list of n such tuples. Tuples holding the same
+            arrays are treated as the same path.
+        n: Number of vehicles
+
+    Outputs:
+        List of ((path_x, path_y, path_vel), indices) pairs, where indices is
+        an integer array of the vehicles following that path
+    '''
+    if isinstance(paths,tuple):
+        return [(paths,np.arange(n))]
+    if len(paths) != n:
+        raise ValueError('Expected {} paths, got {}'.format(n,len(paths)))
+    groups = {}
+    for i, path in enumerate(paths):
+        groups.setdefault(tuple(id(array) for array in path),(path,[]))[1].append(i)
+    return [(path,np.array(idx)) for path, idx in groups.values()]
+
+class PathIndexCache(object):
+    def __init__(self,maxsize=32):
+        '''
+        Least-recently-used cache of PathIndex objects keyed on the identity of
+        the path arrays, so that every controller driving the same path shares
+        one index. Lookups only compare identities, so they cost the same for
+        any path length: paths are treated as immutable, and a path that is
+        modified in place after being indexed keeps its old index. Pass new
+        arrays, or clear the cache, to change a path.
+
+        Inputs:
+            maxsize: Maximum number of paths kept
+        '''
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+
+    def get(self,path_x,path_y):
+        '''
+        Returns the PathIndex for the given path arrays, building it if needed.
+        '''
+        key = (id(path_x),id(path_y))
+        index = self._entries.get(key)
+        # The index holds references to the arrays, so their ids cannot be
+        # reused while the entry exists; the check guards against stale entries
+        if index is not None and index.matches(path_x,path_y):
+            self._entries.move_to_end(key)
+            return index
+        index = PathIndex(path_x,path_y)
+        self._entries[key] = index
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return index
+
+    def clear(self):
+        self._entries.clear()
+
+# Shared by all controllers and fitness functions
+_PATH_INDEX_CACHE = PathIndexCache()
+
+def get_path_index(path_x,path_y):
+    '''
+    Returns the shared PathIndex for the given path arrays, building it on
+    first use. The arrays must not be modified in place afterwards; see
+    PathIndexCache.
+    '''
+    return _PATH_INDEX_CACHE.get(path_x,path_y)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 15:48:03 2026
+
+@author: Zeke
+"""
+import numpy as np
+from ego_sim import EgoSim
+from net2_inference import Net2Inference
+
+class MultiRateScheduler(object):
+    def __init__(self,physics_timestep=0.02,control_period=None):
+        '''
+        Rollout scheduler that runs the truck simulation at a fine physics
+        timestep and updates the controller at a slower control period, holding
+        the last control command (zero-order hold) in between.
+
+        Inputs:
+            physics_timestep: Simulation timestep, in seconds
+            control_period: Time between controller updates, in seconds; must be
+                a whole multiple of physics_timestep. Defaults to physics_timestep,
+                i.e. the controller is updated every simulation step.
+        '''
+        if control_period is None:
+            control_period = physics_timestep
+        self.physics_timestep = physics_timestep
+        self.control_period = control_period
+        self.control_every = steps_per_period(control_period,physics_timestep)
+
+    def run(self,controller,t,x_true,y_true,vel,net=None,noise=None,ego=None):
+        '''
+        Runs a closed-loop rollout of controller along the path. The truck state is
+        recorded at the path's sample times, as in the single-rate loops: entry i
+        is the state after simulating up to t[i] + (t[1]-t[0]).
+
+        Inputs:
+            controller: StanleyPID or NN2Control object
+            t: Array of path sample times; the sample period must be a whole
+                multiple of the physics timestep
+            x_true, y_true, vel: Path coordinates and velocities
+            net: Network for an NN2Control controller (a Net2 or a Net2Inference),
+                or None for a StanleyPID
+            noise: Standard deviation of noise added to the controller's errors
+            ego: Optional EgoSim to simulate, whose sim_timestep must equal the
+                physics timestep. A new one is created if not given.
+
+        Outputs:
+            world_states: Numpy array of shape (len(t),5) of front-axle states
+            n_control_updates: Number of controller evaluations made
+        '''
+        if ego is None:
+            ego = EgoSim(sim_timestep=self.physics_timestep,world_state_at_front=True)
+        elif abs(ego.sim_timestep - self.physics_timestep) > 1e-12:
+            raise ValueError('EgoSim timestep {} does not match physics timestep {}'.format(
+                ego.sim_timestep,self.physics_timestep))
+        if net is not None and not isinstance(net,Net2Inference):
+            net = net.float()
+        sample_every = steps_per_period(t[1]-t[0],self.physics_timestep)
+        n_steps = len(t)*sample_every
+        world_states = np.zeros((len(t),5))
+        state = np.zeros(5)
+        ctrl = [0.0,0.0]
+        n_control_updates = 0
+        for k in range(0,n_steps):
+            if k % self.control_every == 0:
+                ego.convert_world_state_to_front(out=state)
+                if k % sample_every == 0:
+                    sim_t = t[k//sample_every]
+                else:
+                    sim_t = t[0] + k*self.physics_timestep
+                if net is not None:
+                    ctrl_delta, ctrl_vel, _,_,_ = controller.calc_steer_control(sim_t,state,x_true,y_true,vel,state[4]-state[3],net,noise=noise)
+                else:
+                    ctrl_delta, ctrl_vel, _,_,_ = controller.calc_steer_control(sim_t,state,x_true,y_true,vel,noise=noise)
+                ctrl[0] = ctrl_vel
+                ctrl[1] = ctrl_delta
+                n_control_updates += 1
+            ego.simulate_timestep(ctrl)
+            if (k+1) % sample_every == 0:
+                ego.convert_world_state_to_front(out=world_states[(k+1)//sample_every-1])
+        return world_states, n_control_updates
+
+def steps_per_period(period,timestep):
+    '''
+    Returns the number of timesteps in period, which must be a whole multiple
+    of timestep.
+    '''
+    n = int(round(period/timestep))
+    if n < 1 or abs(n*timestep - period) > 1e-9*max(1,period):
+        raise ValueError('Period {} is not a whole multiple of timestep {}'.format(period,timestep))
+    return n
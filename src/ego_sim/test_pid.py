@@ -5,6 +5,7 @@ Created on Wed Nov  6 14:50:41 2019
 
 @author: Zeke
 """
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 from ego_sim import EgoSim
@@ -46,16 +47,8 @@ def ego_ol_test():
 	
 	ego = EgoSim(sim_timestep = t[1]-t[0], world_state_at_front=True)
 
-	x = []
-	y = []
-	delta = []
-	th1 = []
-	th2 = []
-	
-	for i in range(0,len(t)):
-		xt,yt,deltat,th1t,th2t = ego.simulate_timestep([vel[i],steer_angle[i]])
-		x.append(xt); y.append(yt); delta.append(deltat); th1.append(th1t); th2.append(th2t)
-	
+	world_states, _ = ego.simulate_trajectory(np.column_stack((vel,steer_angle)))
+	x, y, delta, th1, th2 = world_states.T
 	
 	plt.plot(x,y)
 	plt.plot(x_true,y_true,'r--')
@@ -122,6 +115,199 @@ def random_path_test():
 	plt.plot(t,hd_err)
 	plt.show()
 	
+def propagator_agreement_test(vels=[5,15,31],end_time=20,tol=1e-3):
+	'''
+	Checks that the exact zero-order-hold propagator and the odeint reference
+	propagator of EgoSim agree when driven by the same sinusoidal steer input
+	at several constant velocities.
+	'''
+	t = np.arange(0,end_time,step=0.02)
+	for vel in vels:
+		ego_zoh = EgoSim(sim_timestep = t[1]-t[0], world_state_at_front=True, propagator='zoh')
+		ego_ode = EgoSim(sim_timestep = t[1]-t[0], world_state_at_front=True, propagator='odeint')
+		max_err = 0
+		for i in range(0,len(t)):
+			ctrl = [vel,0.2*np.sin(1.5*t[i])]
+			state_zoh = ego_zoh.simulate_timestep(ctrl)
+			state_ode = ego_ode.simulate_timestep(ctrl)
+			max_err = max(max_err,np.max(np.abs(state_zoh-state_ode)))
+		print('Velocity {} m/s: max world state difference {:.3e}'.format(vel,max_err))
+		assert max_err < tol
+	
+def torch_parity_test(end_time=10,num_paths=3,tol=1e-6):
+	'''
+	Checks the differentiable TorchEgoSim against the numpy EgoSim, both open-loop
+	on a piecewise-constant velocity sequence and closed-loop with a Net2
+	neurocontroller, where the torch rollout's off-tracking must match
+	calc_off_tracking for the numpy rollout.
+	'''
+	import torch
+	from torch_ego_sim import TorchEgoSim, closed_loop_rollout
+	from nn2_control import NN2Control
+	from Min_dist_test import calc_off_tracking
+	from Network1 import Net2
+	t = np.arange(0,end_time,step=0.02)
+	ctrl = np.column_stack((np.where(t < end_time/2,12.0,25.0),0.2*np.sin(t)))
+	ego = EgoSim(sim_timestep = t[1]-t[0], world_state_at_front=True)
+	world_states, _ = ego.simulate_trajectory(ctrl)
+	ego_torch = TorchEgoSim(1, sim_timestep = t[1]-t[0], world_state_at_front=True)
+	world_states_torch = np.array([ego_torch.simulate_timestep(torch.tensor(c[None,:])).numpy()[0] for c in ctrl])
+	max_err = np.max(np.abs(world_states-world_states_torch))
+	print('Open-loop max world state difference {:.3e}'.format(max_err))
+	assert max_err < tol
+	
+	network = Net2()
+	rpg = RandomPathGenerator()
+	paths = [rpg.get_harder_path(end_time=end_time/2) for i in range(num_paths)]
+	fitness_torch = closed_loop_rollout(network,paths).detach().numpy()
+	for (x_true,y_true,t,vel), fit_torch in zip(paths,fitness_torch):
+		ego = EgoSim(sim_timestep = t[1]-t[0], world_state_at_front=True)
+		controller = NN2Control()
+		x, y, th1, th2 = [], [], [], []
+		for i in range(0,len(t)):
+			state = ego.convert_world_state_to_front()
+			ctrl_delta, ctrl_vel, _,_,_ = controller.calc_steer_control(t[i],state,x_true,y_true,vel,state[3]-state[4],network)
+			xt,yt,deltat,th1t,th2t = ego.simulate_timestep([ctrl_vel,ctrl_delta])
+			x.append(xt); y.append(yt); th1.append(th1t); th2.append(th2t)
+		fitness, _ = calc_off_tracking(x,y,th1,th2,ego.P,x_true,y_true)
+		print('Closed-loop fitness: numpy {:.6f}, torch {:.6f}'.format(fitness,fit_torch))
+		# The network runs in single precision, so allow a looser tolerance
+		assert abs(fitness-fit_torch) < 1e-5*max(1,fitness)
+	
+def nearest_point_test(num_paths=5,num_queries=2000):
+	'''
+	Checks that the KD-tree nearest path point query gives exactly the same
+	indices as the brute-force scan, including on paths with repeated points
+	and query points equidistant from several path points, and that
+	calc_off_tracking gives the same result with and without the spatial index.
+	'''
+	from path_index import PathIndex
+	from Min_dist_test import calc_off_tracking
+	from truck_params import DEFAULTS
+	rpg = RandomPathGenerator()
+	paths = [rpg.get_harder_path(end_time=20)[:2] for i in range(num_paths)]
+	# Integer grid path with repeated points, queried at half-integer points
+	grid_x = np.repeat(np.arange(0,50,dtype=float),3)
+	grid_y = np.zeros_like(grid_x)
+	paths.append((grid_x,grid_y))
+	for path_x, path_y in paths:
+		path_index = PathIndex(path_x,path_y)
+		px = np.random.choice(path_x,num_queries) + np.round(np.random.normal(0,5,num_queries)*2)/2
+		py = np.random.choice(path_y,num_queries) + np.round(np.random.normal(0,5,num_queries)*2)/2
+		I_tree = path_index.nearest_point_indices(px,py)
+		I_brute = np.array([np.argmin([(px[j]-x)**2 + (py[j]-y)**2 for x,y in zip(path_x,path_y)])
+			for j in range(num_queries)])
+		mismatches = np.count_nonzero(I_tree != I_brute)
+		print('{} of {} nearest point indices differ'.format(mismatches,num_queries))
+		assert mismatches == 0
+		
+		th1 = np.random.uniform(-np.pi,np.pi,num_queries)
+		th2 = th1 + np.random.normal(0,0.2,num_queries)
+		fitness_tree, err_tree = calc_off_tracking(px,py,th1,th2,DEFAULTS,path_x,path_y)
+		fitness_brute, err_brute = calc_off_tracking(px,py,th1,th2,DEFAULTS,path_x,path_y,spatial_index=False)
+		print('Off-tracking: KD-tree {:.9f}, brute force {:.9f}'.format(fitness_tree,fitness_brute))
+		assert abs(fitness_tree-fitness_brute) <= 1e-9*max(1,fitness_brute)
+	
+def batch_agreement_test(num_paths=2,end_time=10):
+	'''
+	Checks that N rigs with mixed truck parameters and paths simulated in one
+	BatchEgoSim, controlled by one BatchStanleyPID or one BatchNN2Control,
+	give exactly the same trajectories as N single-rig EgoSim runs with their
+	own StanleyPID or NN2Control.
+	'''
+	import torch
+	from batch_ego_sim import BatchEgoSim
+	from stanley_pid import BatchStanleyPID
+	from nn2_control import NN2Control, BatchNN2Control
+	from net2_inference import Net2Inference, BatchNet2Inference
+	from Network1 import Net2
+	rpg = RandomPathGenerator()
+	paths = [rpg.get_harder_path(end_time=end_time) for i in range(num_paths)]
+	t = paths[0][2]
+	variants = [{}, {'m2_alpha':0.5}, {'Ctrailer_alpha':0.75,'l2_alpha':1.2}]
+	rigs = [(path,variant) for path in paths for variant in variants]
+	torch.manual_seed(0)
+	networks = [Net2Inference.from_network(Net2()) for rig in rigs]
+	for control in ('pid','nn'):
+		# Serial reference: one EgoSim and controller per rig
+		serial = np.zeros((len(t),len(rigs),5))
+		for k, ((x_true,y_true,t,vel),variant) in enumerate(rigs):
+			ego = EgoSim(sim_timestep = t[1]-t[0], world_state_at_front=True)
+			ego.modify_parameters(**variant)
+			controller = StanleyPID() if control == 'pid' else NN2Control()
+			for i in range(len(t)):
+				state = ego.convert_world_state_to_front()
+				if control == 'pid':
+					ctrl_delta, ctrl_vel, _,_,_ = controller.calc_steer_control(t[i],state,x_true,y_true,vel)
+				else:
+					ctrl_delta, ctrl_vel, _,_,_ = controller.calc_steer_control(t[i],state,x_true,y_true,vel,state[3]-state[4],networks[k])
+				serial[i,k] = ego.simulate_timestep([ctrl_vel,ctrl_delta])
+		# All rigs in one batch
+		vehicles = []
+		for path, variant in rigs:
+			vehicle = EgoSim(sim_timestep = t[1]-t[0])
+			vehicle.modify_parameters(**variant)
+			vehicles.append(vehicle)
+		ego = BatchEgoSim(sim_timestep = t[1]-t[0], world_state_at_front=True, vehicles=vehicles)
+		batch_paths = [(x_true,y_true,vel) for (x_true,y_true,_,vel), variant in rigs]
+		if control == 'pid':
+			controller = BatchStanleyPID(len(rigs))
+		else:
+			controller = BatchNN2Control(len(rigs))
+			network = BatchNet2Inference.from_networks(networks)
+		batch = np.zeros((len(t),len(rigs),5))
+		ctrl = np.zeros((len(rigs),2))
+		for i in range(len(t)):
+			state = ego.convert_world_state_to_front()
+			if control == 'pid':
+				ctrl_delta, ctrl_vel, _,_,_ = controller.calc_steer_control(t[i],state,batch_paths)
+			else:
+				ctrl_delta, ctrl_vel, _,_,_ = controller.calc_steer_control(t[i],state,batch_paths,state[:,3]-state[:,4],network)
+			ctrl[:,0] = ctrl_vel
+			ctrl[:,1] = ctrl_delta
+			batch[i] = ego.simulate_timestep(ctrl)
+		print('{}: max world state difference {:.3e}'.format(control,np.max(np.abs(serial-batch))))
+		assert np.array_equal(serial,batch)
+
+def sweep_agreement_test(num_paths=2,end_time=10):
+	'''
+	Checks that the fitness table of parameter_sweep.run_parameter_sweep,
+	which simulates every rollout in one batch, is exactly the same as that of
+	single-rig EgoSim runs with their own StanleyPID or NN2Control.
+	'''
+	import torch
+	from nn2_control import NN2Control
+	from net2_inference import Net2Inference
+	from Network1 import Net2
+	from Min_dist_test import calc_off_tracking
+	from parameter_sweep import parameter_grid, run_parameter_sweep
+	rpg = RandomPathGenerator()
+	paths = [rpg.get_harder_path(end_time=end_time) for i in range(num_paths)]
+	grid = parameter_grid(m2_alpha=[0.5,1.0],Ctrailer_alpha=[0.75,1.0])
+	torch.manual_seed(0)
+	networks = {'PID': None, 'NN1': Net2Inference.from_network(Net2()), 'NN2': Net2Inference.from_network(Net2())}
+	table = run_parameter_sweep(grid,paths,networks)
+	# Serial reference, in the table's row order
+	serial = []
+	for variant in grid:
+		for x_true, y_true, t, vel in paths:
+			for name, network in networks.items():
+				ego = EgoSim(sim_timestep = t[1]-t[0], world_state_at_front=True)
+				ego.modify_parameters(**variant)
+				controller = StanleyPID() if network is None else NN2Control()
+				states = np.zeros((len(t),5))
+				for i in range(len(t)):
+					state = ego.convert_world_state_to_front()
+					if network is None:
+						ctrl_delta, ctrl_vel, _,_,_ = controller.calc_steer_control(t[i],state,x_true,y_true,vel)
+					else:
+						ctrl_delta, ctrl_vel, _,_,_ = controller.calc_steer_control(t[i],state,x_true,y_true,vel,state[4]-state[3],network)
+					states[i] = ego.simulate_timestep([ctrl_vel,ctrl_delta])
+				fitness, _ = calc_off_tracking(states[:,0],states[:,1],states[:,3],states[:,4],ego.P,x_true,y_true)
+				serial.append(fitness)
+	print('sweep: max fitness difference {:.3e}'.format(np.max(np.abs(table['fitness'].values-serial))))
+	assert np.array_equal(table['fitness'].values,serial)
+
 if __name__ == "__main__":
 #	ego_ol_test()
 #	pid_test()
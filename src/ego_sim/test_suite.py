@@ -12,6 +12,9 @@ from nn2_control import NN2Control
 import numpy as np
 import matplotlib.pyplot as plt
 from Min_dist_test import calc_off_tracking
+from parameter_sweep import run_parameter_sweep, parameter_grid
+from rollout import MultiRateScheduler
+from baseline_cache import pid_baseline_fitness
 import pandas as pd
 import matplotlib.pylab as pylab
 params = {'legend.fontsize': 'x-large',
@@ -30,12 +33,10 @@ def basic_fitness_comparison(network,num_tests=10):
         print('{} of {}'.format(i,num_tests))
         # Generate a random path
         x_true, y_true, t, vel = rpg.get_harder_path(end_time=15)
-        # Start a new PID controller and ego_sims for both controllers
-        pid = StanleyPID()
+        # The PID baseline is only simulated if the path is not in the cache
+        pid_fitness[i] = pid_baseline_fitness(x_true,y_true,t,vel)
         nn = NN2Control()
-        ego_pid = EgoSim(sim_timestep = t[1]-t[0], world_state_at_front=True)
         ego_nn = EgoSim(sim_timestep = t[1]-t[0], world_state_at_front=True)
-        pid_fitness[i] = fitness_from_simulation_loop(pid,ego_pid,t,x_true,y_true,vel,net=None)
         nn_fitness[i] = fitness_from_simulation_loop(nn,ego_nn,t,x_true,y_true,vel,net=network)
     plt.boxplot(np.divide(nn_fitness,pid_fitness))
     plt.ylabel('Fitness relative to PID\n(lower is better)')
@@ -47,163 +48,78 @@ def basic_fitness_comparison(network,num_tests=10):
     plt.xticks([1],['Neurocontroller'])
     plt.show()
     
-def trailer_mass_variation_test(network,num_tests=5):
-    # Initialize memory for fitness evaluation
-    
+def random_test_paths(num_tests,end_time=10,vel=25):
+    '''
+    Generates num_tests random paths as a list of (x, y, t, vel) tuples.
+    '''
     rpg = RandomPathGenerator()
-    # Generate a random path
-    xs = []
-    ys = []
-    ts = []
-    vels = []
-    for i in range(0,num_tests):
-        x1,y1,t1,v1 = rpg.get_harder_path(end_time=10,vel=25)
-        xs.append(x1)
-        ys.append(y1)
-        ts.append(t1)
-        vels.append(v1)
-    # Set trailer mass alpha values to be looped through
-    alpha = np.linspace(0.1,1.5,num=20)
-    pid_fitness = []
-    nn_fitness = []
-    print('new')
-    for i in range(0,len(alpha)):
-        print('{} of {}'.format(i,len(alpha)))
-        
-        pid_temp = []
-        nn_temp = []
-        for j in range(0,num_tests):
-            x_true = xs[j]
-            y_true = ys[j]
-            t = ts[j]
-            vel = vels[j]
-            # Start a new PID controller and ego_sims for both controllers
-            pid = StanleyPID()
-            nn = NN2Control()
-            ego_pid = EgoSim(sim_timestep = t[1]-t[0], world_state_at_front=True)
-            ego_pid.modify_parameters(m2_alpha=alpha[i])
-            ego_nn = EgoSim(sim_timestep = t[1]-t[0], world_state_at_front=True)
-            ego_nn.modify_parameters(m2_alpha=alpha[i])
-            pid_temp.append(fitness_from_simulation_loop(pid,ego_pid,t,x_true,y_true,vel,net=None))
-            nn_temp.append(fitness_from_simulation_loop(nn,ego_nn,t,x_true,y_true,vel,net=network))
-        pid_fitness.append(pid_temp)
-        nn_fitness.append(nn_temp)
-        
-    pid_fitness_avg = [np.mean(fitness) for fitness in pid_fitness]
-    nn_fitness_avg = [np.mean(fitness) for fitness in nn_fitness]
-    pid_fitness_std = [np.std(fitness) for fitness in pid_fitness]
-    nn_fitness_std = [np.std(fitness) for fitness in nn_fitness]
+    return [rpg.get_harder_path(end_time=end_time,vel=vel) for i in range(0,num_tests)]
+    
+def sweep_fitness_stats(results,param):
+    '''
+    Computes the mean and standard deviation of the fitness over paths for each
+    controller and value of param in a parameter sweep results table.
+    
+    Outputs:
+        Dictionary mapping controller names to (alpha, mean, std) arrays.
+    '''
+    stats = {}
+    for name, df in results.groupby('controller',sort=False):
+        fitness = df.groupby(param)['fitness']
+        stats[name] = (fitness.mean().index.values, fitness.mean().values, fitness.std(ddof=0).values)
+    return stats
+    
+def plot_variation_test(results,param,xlabel,set_ylim=True):
+    '''
+    Plots PID and neurocontroller fitness against the swept parameter.
+    '''
+    stats = sweep_fitness_stats(results,param)
+    alpha, pid_fitness_avg, pid_fitness_std = stats['PID']
+    _, nn_fitness_avg, nn_fitness_std = stats['Neurocontroller']
     plt.errorbar(alpha*100,pid_fitness_avg,yerr=pid_fitness_std,marker='s',capsize=5,ls='--')
     plt.errorbar(alpha*100,nn_fitness_avg,yerr=nn_fitness_std,marker='s',capsize=5)
-    plt.xlabel('Percentage of design trailer mass (%)')
+    plt.xlabel(xlabel)
     plt.ylabel('Sum squared tracking error, $m^2$\n(lower is better)')
-#    plt.ylim(0,2000)
+    if set_ylim:
+        plt.ylim(0,1.1*(max(pid_fitness_avg)+max(pid_fitness_std)))
     plt.legend(['PID','Neurocontroller'])
     plt.show()
     
-def trailer_stiffness_variation_test(network,num_tests=5):
-    # Initialize memory for fitness evaluation
+def trailer_mass_variation_test(network,num_tests=5):
+    paths = random_test_paths(num_tests)
+    # Set trailer mass alpha values to be swept through
+    alpha = np.linspace(0.1,1.5,num=20)
+    results = run_parameter_sweep(parameter_grid(m2_alpha=alpha),paths,
+                                  {'PID':None,'Neurocontroller':network})
+    plot_variation_test(results,'m2_alpha','Percentage of design trailer mass (%)',set_ylim=False)
+    return results
     
-    rpg = RandomPathGenerator()
-    # Generate a random path
-    xs = []
-    ys = []
-    ts = []
-    vels = []
-    for i in range(0,num_tests):
-        x1,y1,t1,v1 = rpg.get_harder_path(end_time=10,vel=25)
-        xs.append(x1)
-        ys.append(y1)
-        ts.append(t1)
-        vels.append(v1)
-        
-    # Set trailer mass alpha values to be looped through
+def trailer_stiffness_variation_test(network,num_tests=5):
+    paths = random_test_paths(num_tests)
+    # Set trailer stiffness alpha values to be swept through
     alpha = np.linspace(0.25,2,num=20)
-    pid_fitness = []
-    nn_fitness = []
-    for i in range(0,len(alpha)):
-        print('{} of {}'.format(i,len(alpha)))
-
-        pid_temp = []
-        nn_temp = []
-        for j in range(0,num_tests):
-            x_true = xs[j]
-            y_true = ys[j]
-            t = ts[j]
-            vel = vels[j]
-            # Start a new PID controller and ego_sims for both controllers
-            pid = StanleyPID()
-            nn = NN2Control()
-            ego_pid = EgoSim(sim_timestep = t[1]-t[0], world_state_at_front=True)
-            ego_pid.modify_parameters(Ctrailer_alpha=alpha[i])
-            ego_nn = EgoSim(sim_timestep = t[1]-t[0], world_state_at_front=True)
-            ego_nn.modify_parameters(Ctrailer_alpha=alpha[i])
-            pid_temp.append(fitness_from_simulation_loop(pid,ego_pid,t,x_true,y_true,vel,net=None))
-            nn_temp.append(fitness_from_simulation_loop(nn,ego_nn,t,x_true,y_true,vel,net=network))
-        pid_fitness.append(pid_temp)
-        nn_fitness.append(nn_temp)
-        
-    pid_fitness_avg = [np.mean(fitness) for fitness in pid_fitness]
-    nn_fitness_avg = [np.mean(fitness) for fitness in nn_fitness]
-    pid_fitness_std = [np.std(fitness) for fitness in pid_fitness]
-    nn_fitness_std = [np.std(fitness) for fitness in nn_fitness]
-    plt.errorbar(alpha*100,pid_fitness_avg,yerr=pid_fitness_std,marker='s',capsize=5,ls='--')
-    plt.errorbar(alpha*100,nn_fitness_avg,yerr=nn_fitness_std,marker='s',capsize=5)
-    plt.xlabel('Percentage of design trailer tire stiffness (%)')
-    plt.ylabel('Sum squared tracking error, $m^2$\n(lower is better)')
-    plt.ylim(0,1.1*(max(pid_fitness_avg)+max(pid_fitness_std)))
-    plt.legend(['PID','Neurocontroller'])
-    plt.show()
+    results = run_parameter_sweep(parameter_grid(Ctrailer_alpha=alpha),paths,
+                                  {'PID':None,'Neurocontroller':network})
+    plot_variation_test(results,'Ctrailer_alpha','Percentage of design trailer tire stiffness (%)')
+    return results
     
 def trailer_length_variation_test(network,num_tests=5):
-    rpg = RandomPathGenerator()
-    # Generate a random path
-    xs = []
-    ys = []
-    ts = []
-    vels = []
-    for i in range(0,num_tests):
-        x1,y1,t1,v1 = rpg.get_harder_path(end_time=10,vel=25)
-        xs.append(x1)
-        ys.append(y1)
-        ts.append(t1)
-        vels.append(v1)
+    paths = random_test_paths(num_tests)
     alpha = np.linspace(0.25,2,num=20)
+    results = run_parameter_sweep(parameter_grid(l2_alpha=alpha),paths,
+                                  {'PID':None,'Neurocontroller':network})
+    plot_variation_test(results,'l2_alpha','Percentage of design trailer length (%)')
+    return results
     
-    pid_fitness = []
-    nn_fitness = []
-    for i in range(0,len(alpha)):
-        print('{} of {}'.format(i,len(alpha)))
-        
-        pid_temp = []
-        nn_temp = []
-        for j in range(0,num_tests):
-            x_true = xs[j]
-            y_true = ys[j]
-            t = ts[j]
-            vel = vels[j]
-            # Start a new PID controller and ego_sims for both controllers
-            pid = StanleyPID()
-            nn = NN2Control()
-            ego_pid = EgoSim(sim_timestep = t[1]-t[0], world_state_at_front=True)
-            ego_pid.modify_parameters(Ctrailer_alpha=alpha[i])
-            ego_nn = EgoSim(sim_timestep = t[1]-t[0], world_state_at_front=True)
-            ego_nn.modify_parameters(Ctrailer_alpha=alpha[i])
-            pid_temp.append(fitness_from_simulation_loop(pid,ego_pid,t,x_true,y_true,vel,net=None))
-            nn_temp.append(fitness_from_simulation_loop(nn,ego_nn,t,x_true,y_true,vel,net=network))
-        pid_fitness.append(pid_temp)
-        nn_fitness.append(nn_temp)
-    pid_fitness_avg = [np.mean(fitness) for fitness in pid_fitness]
-    nn_fitness_avg = [np.mean(fitness) for fitness in nn_fitness]
-    pid_fitness_std = [np.std(fitness) for fitness in pid_fitness]
-    nn_fitness_std = [np.std(fitness) for fitness in nn_fitness]
-    plt.errorbar(alpha*100,pid_fitness_avg,yerr=pid_fitness_std,marker='s',capsize=5,ls='--')
-    plt.errorbar(alpha*100,nn_fitness_avg,yerr=nn_fitness_std,marker='s',capsize=5)
-    plt.xlabel('Percentage of design trailer length (m)')
-    plt.ylabel('Sum squared tracking error, $m^2$\n(lower is better)')
-    plt.ylim(0,1.1*(max(pid_fitness_avg)+max(pid_fitness_std)))
-    plt.legend(['PID','Neurocontroller'])
-    plt.show()
+def trailer_mass_stiffness_variation_test(network,num_tests=5):
+    '''
+    Two-dimensional sweep of trailer mass and trailer tire stiffness. Returns
+    the results table of the sweep.
+    '''
+    paths = random_test_paths(num_tests)
+    grid = parameter_grid(m2_alpha=np.linspace(0.1,1.5,num=8),
+                          Ctrailer_alpha=np.linspace(0.25,2,num=8))
+    return run_parameter_sweep(grid,paths,{'PID':None,'Neurocontroller':network})
     
 def initial_displacement_test(network):
     Benchmark1=pd.read_csv('Benchmark_DLC_31ms_reduced.csv',sep=',',header=0)
@@ -219,13 +135,11 @@ def initial_displacement_test(network):
     nn_fitness = np.zeros(len(disp))
     for i in range(0,len(disp)):
         print('{} of {}'.format(i,len(disp)))
-        # Start a new PID controller and ego_sims for both controllers
-        pid = StanleyPID()
+        # The PID baseline is only simulated if the path is not in the cache
+        pid_fitness[i] = pid_baseline_fitness(x_true,y_true+disp[i],t,vel)
         nn = NN2Control()
-        ego_pid = EgoSim(sim_timestep = t[1]-t[0], world_state_at_front=True)
         ego_nn = EgoSim(sim_timestep = t[1]-t[0], world_state_at_front=True)
 
-        pid_fitness[i] = fitness_from_simulation_loop(pid,ego_pid,t,x_true,y_true+disp[i],vel,net=None)
         nn_fitness[i] = fitness_from_simulation_loop(nn,ego_nn,t,x_true,y_true+disp[i],vel,net=network)
     plt.plot(disp,pid_fitness,ls='--')
     plt.plot(disp,nn_fitness)
@@ -285,32 +199,18 @@ def noisy_signal_test(network,num_tests=5):
     plt.legend(['PID','Neurocontroller'])
     plt.show()
     
-def fitness_from_simulation_loop(controller,ego,t,x_true,y_true,vel,net=None,noise=None):
-    # initialize memory
-    x = []
-    y = []
-    delta = []
-    th1 = []
-    th2 = []
-    # Run through control loop for both controllers
-    for i in range(0,len(t)):
-        state = ego.convert_world_state_to_front()
-        if net is not None:
-            net = net.float()
-            ctrl_delta, ctrl_vel, _,_,_ = controller.calc_steer_control(t[i],state,x_true,y_true, vel, state[4]-state[3], net, noise=noise)
-        else:
-            ctrl_delta, ctrl_vel, _,_,_ = controller.calc_steer_control(t[i],state,x_true,y_true,vel, noise=noise)
-#        print(ctrl_delta)
-        xt,yt,deltat,th1t,th2t = ego.simulate_timestep([ctrl_vel,ctrl_delta])
-        x.append(xt); y.append(yt); delta.append(deltat); th1.append(th1t); th2.append(th2t)
-        '''
-    plt.plot(x,y)
-    if net is not None:
-        plt.title('Network')
-    else:
-        plt.title('PID')
-    plt.show()
+def fitness_from_simulation_loop(controller,ego,t,x_true,y_true,vel,net=None,noise=None,control_period=None):
+    '''
+    Runs the controller along the path and returns the sum squared off-tracking.
+    The simulation runs at ego's timestep; the controller is updated every
+    control_period seconds (every path sample if not given) with zero-order
+    hold in between.
     '''
+    if control_period is None:
+        control_period = t[1]-t[0]
+    scheduler = MultiRateScheduler(ego.sim_timestep,control_period)
+    world_states, _ = scheduler.run(controller,t,x_true,y_true,vel,net=net,noise=noise,ego=ego)
+    x, y, delta, th1, th2 = world_states.T
     fitness, _ = calc_off_tracking(x, y, th1, th2, ego.P, x_true, y_true)
     
     return fitness
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 14:26:18 2026
+
+@author: Zeke
+"""
+import numpy as np
+import torch
+from truck_params import TruckParams
+
+class TorchEgoSim(object):
+    def __init__(self,n_vehicles=1,sim_timestep=0.02,world_state_at_front=False,params=None,
+                 dtype=torch.float64):
+        '''
+        Differentiable PyTorch implementation of the EgoSim truck-trailer model,
+        simulating n_vehicles rigs in lockstep. Uses the same Luijten dynamic model,
+        zero-order-hold discretization and world state kinematics as EgoSim, so
+        gradients flow from the simulated states back to the steer commands.
+
+        Inputs:
+            n_vehicles: Number of rigs simulated in lockstep.
+            sim_timestep: Simulation timestep to be used, in seconds
+            world_state_at_front: dictates whether the simulation output state
+                is given in coordinates at the truck's front axle (if True) or
+                at the truck's center of gravity (if False).
+            params: TruckParams used for all rigs, or a list of n_vehicles
+                TruckParams. Defaults to the default truck parameters.
+            dtype: Torch floating point type of the simulation.
+        '''
+        if params is None:
+            params = TruckParams()
+        if isinstance(params,TruckParams):
+            params = [params]*n_vehicles
+        self.params = params
+        self.n = n_vehicles
+        self.sim_timestep = sim_timestep
+        self.world_state_at_front = world_state_at_front
+        self.dtype = dtype
+        self.a1 = torch.tensor([P.a1 for P in params],dtype=dtype)
+        # Parameter tensors of shape (n,) for building the stiffness matrices
+        names = ['m1','m2','a2','h1','l2','Cs1','Cq1','C_trailer','C_total','h1_l2']
+        self.P = {name: torch.tensor([P[name] for P in params],dtype=dtype) for name in names}
+        self.M_inv = torch.tensor(np.array([np.linalg.inv(P.M) for P in params]),dtype=dtype)
+        self.B = torch.tensor(np.array([P.B for P in params]),dtype=dtype)
+        self.propagator_vel = None
+        self.reset()
+
+    def reset(self):
+        '''
+        Resets all rigs to the origin at rest and the simulation time to zero.
+        '''
+        self.world_state = torch.zeros((self.n,5),dtype=self.dtype)
+        self.truck_state = torch.zeros((self.n,4),dtype=self.dtype)
+        self.sim_time = 0
+
+    def calculate_stiffness_matrix(self,u1):
+        '''
+        Calculates the stiffness matrices A of the Luijten model Mx' = Ax + Bu.
+
+        Inputs:
+            u1: Tensor of shape (n,) with the control velocity of each rig.
+
+        Outputs:
+            Tensor of shape (n,4,4) with the stiffness matrix of each rig.
+        '''
+        P = self.P
+        C_t = P['C_trailer']
+        zero = torch.zeros_like(u1)
+        rows = [[P['C_total'], P['Cs1'] - C_t*P['h1_l2'] + (P['m1']+P['m2'])*u1**2, -C_t*P['l2'], -C_t*u1],
+                [P['Cs1'] - C_t*P['h1'], P['Cq1'] + C_t*P['h1_l2']*P['h1'] - P['m2']*P['h1']*u1**2,
+                 C_t*P['h1']*P['l2'], C_t*P['h1']*u1],
+                [-C_t*P['l2'], C_t*P['l2']*P['h1_l2'] - P['m2']*P['a2']*u1**2, C_t*P['l2']**2, C_t*P['l2']*u1],
+                [zero, zero, -u1, zero]]
+        A = torch.stack([torch.stack(row,dim=-1) for row in rows],dim=-2)
+        return -(1/u1)[:,None,None]*A
+
+    def calculate_discrete_propagator(self,u1):
+        '''
+        Zero-order-hold discretization of the model for the velocities u1, such
+        that x[k+1] = Ad*x[k] + Bd*delta[k] for each rig.
+
+        Outputs:
+            Ad: Tensor of shape (n,4,4)
+            Bd: Tensor of shape (n,4)
+        '''
+        Ac = torch.matmul(self.M_inv,self.calculate_stiffness_matrix(u1))
+        Bc = torch.matmul(self.M_inv,self.B[:,:,None])
+        aug = torch.zeros((self.n,5,5),dtype=self.dtype)
+        aug[:,:4,:4] = Ac
+        aug[:,:4,4:] = Bc
+        E = torch.matrix_exp(aug*self.sim_timestep)
+        return E[:,:4,:4], E[:,:4,4]
+
+    def simulate_timestep(self,ctrl):
+        '''
+        Simulates all rigs for a single timestep.
+
+        Inputs:
+            ctrl: Tensor of shape (n,2) with the control velocity in the first
+                column and the control steer tire angle (radians) in the second.
+
+        Outputs:
+            Tensor of shape (n,5) with the rigs' states in world coordinates,
+                at the front axle or center of gravity as given by
+                self.world_state_at_front
+        '''
+        u1 = ctrl[:,0].detach()
+        delta = ctrl[:,1]
+        # Propagators only depend on the velocity, which does not need gradients
+        if self.propagator_vel is None or not torch.equal(u1,self.propagator_vel):
+            self.Ad, self.Bd = self.calculate_discrete_propagator(u1)
+            self.propagator_vel = u1.clone()
+        ts = torch.matmul(self.Ad,self.truck_state[:,:,None])[:,:,0] + self.Bd*delta[:,None]
+        ws = self.world_state
+        dt = self.sim_timestep
+        theta1 = ws[:,3] + ts[:,1]*dt
+        cos_th = torch.cos(theta1)
+        sin_th = torch.sin(theta1)
+        x = ws[:,0] + (cos_th*u1 - sin_th*ts[:,0])*dt
+        y = ws[:,1] + (sin_th*u1 + cos_th*ts[:,0])*dt
+        theta2 = wrap_to_pi(theta1 + ts[:,3])
+        self.truck_state = torch.cat((ts[:,:3],wrap_to_pi(ts[:,3:])),dim=1)
+        self.world_state = torch.stack((x,y,delta,wrap_to_pi(theta1),theta2),dim=1)
+        self.sim_time += dt
+
+        if self.world_state_at_front:
+            return self.convert_world_state_to_front()
+        else:
+            return self.world_state
+
+    def convert_world_state_to_front(self):
+        '''
+        Outputs the world states with the truck coordinate frame placed on the
+        front axle rather than the truck's center of gravity.
+        '''
+        ws = self.world_state
+        x = ws[:,0] + self.a1*torch.cos(ws[:,3])
+        y = ws[:,1] + self.a1*torch.sin(ws[:,3])
+        return torch.cat((x[:,None],y[:,None],ws[:,2:]),dim=1)
+
+def wrap_to_pi(angle):
+    '''
+    Wraps a tensor of angles to the range [-pi, pi]. The gradient is one
+    everywhere, as for the unwrapped angle.
+    '''
+    wrap = torch.remainder(angle,2*np.pi)
+    return torch.where(wrap > np.pi,wrap - 2*np.pi,wrap)
+
+def path_error(points,heading,path_x,path_y,I_min):
+    '''
+    Differentiable batched version of calc_path_error. Computes the signed
+    cross-track error from the two path segments around the point I_min and
+    the heading error relative to the path direction there.
+
+    Inputs:
+        points: Tensor of shape (n,2) of positions
+        heading: Tensor of shape (n,) of headings (radians), or None
+        path_x: Tensor of shape (n,L) of path x-coordinates
+        path_y: Tensor of shape (n,L) of path y-coordinates
+        I_min: Long tensor of shape (n,) of path indices
+
+    Outputs:
+        ct_error: Tensor of shape (n,) of signed cross-track errors
+        heading_error: Tensor of shape (n,) of heading errors, or None
+    '''
+    L = path_x.shape[1]
+    i_rev = torch.clamp(I_min-1,min=0)[:,None]
+    i_fwd = torch.clamp(I_min+1,max=L-1)[:,None]
+    I = I_min[:,None]
+    pt = torch.cat((path_x.gather(1,I),path_y.gather(1,I)),dim=1)
+    pt_rev = torch.cat((path_x.gather(1,i_rev),path_y.gather(1,i_rev)),dim=1)
+    pt_fwd = torch.cat((path_x.gather(1,i_fwd),path_y.gather(1,i_fwd)),dim=1)
+    dist_rev = minimum_distance(pt_rev,pt,points)
+    dist_fwd = minimum_distance(pt,pt_fwd,points)
+    ct_error = torch.where(torch.abs(dist_rev) < torch.abs(dist_fwd),dist_rev,dist_fwd)
+    if heading is None:
+        return ct_error, None
+    tan_vec = pt_fwd - pt_rev
+    path_angle = torch.atan2(tan_vec[:,1],tan_vec[:,0])
+    return ct_error, wrap_to_pi(heading - path_angle)
+
+def minimum_distance(v,w,p):
+    '''
+    Differentiable batched version of minimum_distance: signed distance from
+    the points p to the segments running from v to w, all of shape (n,2).
+    Degenerate segments give the unsigned distance to the point v.
+    '''
+    seg = w - v
+    length_sq = (seg**2).sum(dim=1)
+    degenerate = length_sq == 0
+    safe_length_sq = torch.where(degenerate,torch.ones_like(length_sq),length_sq)
+    t = torch.clamp(((p-v)*seg).sum(dim=1)/safe_length_sq,0,1)
+    t = torch.where(degenerate,torch.zeros_like(t),t)
+    diff = p - (v + t[:,None]*seg)
+    length = torch.sqrt(safe_length_sq)
+    signed = (diff[:,0]*seg[:,1] - diff[:,1]*seg[:,0])/length
+    # Small offset keeps the gradient of the unused branch finite at zero distance
+    unsigned = torch.sqrt((diff**2).sum(dim=1) + 1e-30)
+    return torch.where(degenerate,unsigned,signed)
+
+def nearest_path_index(points,path_x,path_y,start=None,window=None):
+    '''
+    Index of the closest path point to each of the points, searching either the
+    whole path or the window [start, start+window). Not differentiable.
+    '''
+    with torch.no_grad():
+        L = path_x.shape[1]
+        if start is None:
+            idx = torch.arange(L)[None,:].expand(path_x.shape[0],L)
+        else:
+            # Clamping repeats the last point, which never beats the first
+            # occurrence in argmin, matching truncated slicing
+            idx = torch.clamp(start[:,None] + torch.arange(window)[None,:],max=L-1)
+        dist_squared = (points[:,0:1] - path_x.gather(1,idx))**2 + (points[:,1:2] - path_y.gather(1,idx))**2
+        return idx.gather(1,torch.argmin(dist_squared,dim=1)[:,None])[:,0]
+
+def off_tracking(state,P,path_x,path_y):
+    '''
+    Differentiable per-step off-tracking of the tractor front axle and trailer
+    axle, as summed by calc_off_tracking.
+
+    Inputs:
+        state: Tensor of shape (n,5) of front-axle world states
+        P: TruckParams of the rigs
+        path_x, path_y: Tensors of shape (n,L) of path coordinates
+
+    Outputs:
+        Tensor of shape (n,) with the sum of the squared tractor and trailer errors
+    '''
+    truck = state[:,0:2]
+    trail = truck - (P['l1'] - P['c'])*torch.stack((torch.cos(state[:,3]),torch.sin(state[:,3])),dim=1) \
+        - P['l2']*torch.stack((torch.cos(state[:,4]),torch.sin(state[:,4])),dim=1)
+    truck_err, _ = path_error(truck,None,path_x,path_y,nearest_path_index(truck,path_x,path_y))
+    trail_err, _ = path_error(trail,None,path_x,path_y,nearest_path_index(trail,path_x,path_y))
+    return truck_err**2 + trail_err**2
+
+def closed_loop_rollout(network,paths,params=None,control_lookahead=50):
+    '''
+    Unrolls closed-loop rollouts of a Net2 neurocontroller driving TorchEgoSim
+    rigs along a batch of paths, keeping the whole rollout in the autograd graph.
+    The controller follows NN2Control: windowed closest-point search, filtered
+    derivative and trapezoidal integral of the errors, and the network inputs
+    [ct_err, hd_err, vel, ct_diff, ct_int, theta1-theta2].
+
+    Inputs:
+        network: Net2 (or any module mapping (n,6) inputs to (n,1) steer angles)
+        paths: List of (x_true, y_true, t, vel) tuples sharing the same time vector
+        params: TruckParams of the rigs; defaults to the default parameters
+        control_lookahead: Lookahead window of the closest-point search
+
+    Outputs:
+        Tensor of shape (n,) with the sum squared off-tracking of each rollout,
+            which can be backpropagated to the network parameters
+    '''
+    if params is None:
+        params = TruckParams()
+    t = paths[0][2]
+    n = len(paths)
+    dtype = torch.float64
+    net_dtype = next(network.parameters()).dtype
+    path_x = torch.tensor(np.array([p[0] for p in paths]),dtype=dtype)
+    path_y = torch.tensor(np.array([p[1] for p in paths]),dtype=dtype)
+    path_vel = torch.tensor(np.array([p[3] for p in paths]),dtype=dtype)
+    sim = TorchEgoSim(n,sim_timestep=t[1]-t[0],world_state_at_front=True,params=params,dtype=dtype)
+    err_int = torch.zeros((n,2),dtype=dtype)
+    err_d1 = torch.zeros((n,2),dtype=dtype)
+    diff_d1 = torch.zeros((n,2),dtype=dtype)
+    last_closest_idx = torch.zeros(n,dtype=torch.long)
+    t_d1 = 0
+    tau = 0.1 # Time constant for filtering discrete derivatives
+    max_steer = 2*np.pi/5
+    fitness = torch.zeros(n,dtype=dtype)
+    state = sim.convert_world_state_to_front()
+    for i in range(0,len(t)):
+        I_min = nearest_path_index(state[:,0:2],path_x,path_y,last_closest_idx,control_lookahead)
+        ctrl_vel = path_vel.gather(1,I_min[:,None])[:,0]
+        ct_err, hd_err = path_error(state[:,0:2],state[:,2]+state[:,3],path_x,path_y,I_min)
+        err = torch.stack((ct_err,hd_err),dim=1)
+        Ts = t[i] - t_d1
+        err_diff = ((2*tau-Ts)/(2*tau+Ts))*diff_d1 + (2/(2*tau+Ts))*(err-err_d1)
+        err_int = err_int + (err+err_d1)/2
+        inputs = torch.stack((err[:,0],err[:,1],ctrl_vel,err_diff[:,0],err_int[:,0],state[:,3]-state[:,4]),dim=1)
+        ctrl_delta = network(inputs.to(net_dtype))[:,0].to(dtype)
+        ctrl_delta = torch.clamp(ctrl_delta,-max_steer,max_steer)
+        t_d1 = t[i]
+        err_d1 = err
+        diff_d1 = err_diff
+        last_closest_idx = I_min
+        state = sim.simulate_timestep(torch.stack((ctrl_vel,ctrl_delta),dim=1))
+        fitness = fitness + off_tracking(state,params,path_x,path_y)
+    return fitness
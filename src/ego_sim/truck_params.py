@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 11:20:07 2026
+
+@author: Zeke
+"""
+import numpy as np
+
+# Default parameters of the truck-trailer combination
+DEFAULTS = {'m1': 9159.63, # Mass of the truck, kg
+            'I1': 55660.3, # Inertia of the truck, kg*m^2
+            'm2': 27091.8, # Mass of the trailer, kg
+            'I2': 386841, # INertia of the trailer, kg*m^2
+            'a1': 2.43264, # Distance from truck COG to front axle, m
+            'c': 0.2286, # Firth-wheel offset from truck drive axle virtual center, m
+            'l1': 5.7404, # Wheelbase from truck front axle to drive axle virtual center, m
+            'l2': 16.104-0.914-3.083-1.2446/2, # Distance from trailer axle to fifth wheel, m
+            'a2': 5.9336, # Distance from fifth wheel to trailer COG, m
+            'h1': 3.0792, # Distance from truck COG to fifth wheel, m
+            'b1': 3.3078, # Distance from truck COG to drive axle virtual center, m
+            'b2': 5.5511, # Distance from trailer COG to trailer axle, m
+            'C1': 187020.2*2, # Sum of truck front axle cornering stiffness, N/rad
+            'C2': 130274.0*4, # Sum of truck's first drive axle cornering stiffness, N/rad
+            'C3': 130274.0*4, # Sum of truck's second drive axle cornering stiffness, N/rad
+            'C4': 115000.0*4, # Sum of trailer's first axle cornering stiffness, N/rad
+            'C5': 115000.0*4, # Sum of trailer's second drive axle cornering stiffness, N/rad
+            # The following parameters are used for visualization or more advanced collision checking only
+            'truck_width': 2.57,
+            'truck_str_ax2front': 1.295,
+            'truck_str_ax2rear': 7.275,
+            'trailer_width': 2.59,
+            'trailer_5th2front': 0.914,
+            'trailer_5th2rear': 16.104
+            }
+
+BASE_PARAMETERS = tuple(DEFAULTS.keys())
+# Quantities computed from the base parameters. Cs1 and Cq1 come from the
+# Luijten model; C_trailer = C4+C5, C_total = C1+...+C5 and h1_l2 = h1+l2 are
+# sums reused in the stiffness matrix; M is the mass matrix and B the steer
+# input vector.
+DERIVED_PARAMETERS = ('Cs1','Cq1','C_trailer','C_total','h1_l2','M','B')
+_BASE_SET = frozenset(BASE_PARAMETERS)
+
+class TruckParams(object):
+    __slots__ = BASE_PARAMETERS + tuple('_'+name for name in DERIVED_PARAMETERS) + ('_valid','_hash','_version')
+
+    def __init__(self,**params):
+        '''
+        Parameters of the Luijten truck-trailer model. Base parameters are set
+        from DEFAULTS unless given as keyword arguments. Derived quantities
+        (Cs1, Cq1, sums of stiffnesses and lengths, the mass matrix M and the
+        input vector B) are computed on first access and recomputed
+        automatically after any base parameter changes.
+
+        Parameters can be read and written either as attributes (P.m1) or as
+        dictionary entries (P['m1']), so a TruckParams can be used wherever the
+        parameter dictionary was used before.
+        '''
+        for name in BASE_PARAMETERS:
+            object.__setattr__(self,name,DEFAULTS[name])
+        object.__setattr__(self,'_valid',False)
+        object.__setattr__(self,'_hash',None)
+        object.__setattr__(self,'_version',0)
+        for name, value in params.items():
+            self[name] = value
+
+    def __setattr__(self,name,value):
+        object.__setattr__(self,name,value)
+        if name in _BASE_SET:
+            # Invalidate derived quantities and the hash
+            object.__setattr__(self,'_valid',False)
+            object.__setattr__(self,'_hash',None)
+            object.__setattr__(self,'_version',self._version + 1)
+
+    def _compute_derived(self):
+        '''
+        Computes and stores the derived quantities from the base parameters.
+        '''
+        C_drive = self.C2 + self.C3
+        C_trailer = self.C4 + self.C5
+        set_derived = lambda name, value: object.__setattr__(self,'_'+name,value)
+        set_derived('Cs1',self.a1*self.C1 - self.b1*C_drive)
+        set_derived('Cq1',self.a1**2*self.C1 + self.b1**2*C_drive)
+        set_derived('C_trailer',C_trailer)
+        set_derived('C_total',self.C1 + C_drive + C_trailer)
+        set_derived('h1_l2',self.h1 + self.l2)
+        M = np.matrix([[self.m1+self.m2, -self.m2*(self.h1+self.a2), -self.m2*self.a2, 0],
+                       [-self.m2*self.h1, self.I1+self.m2*self.h1*(self.h1+self.a2), self.m2*self.h1*self.a2, 0],
+                       [-self.m2*self.a2, self.I2+self.m2*self.a2*(self.h1+self.a2), self.I2+self.m2*self.a2**2, 0],
+                       [0, 0, 0, 1]])
+        B = np.array([self.C1,self.a1*self.C1,0,0])
+        # Shared between all users of these parameters, so protect them
+        M.flags.writeable = False
+        B.flags.writeable = False
+        set_derived('M',M)
+        set_derived('B',B)
+        object.__setattr__(self,'_valid',True)
+
+    @property
+    def version(self):
+        '''
+        Number of times a base parameter has been set, so that users can tell
+        cheaply whether the parameters changed since they last looked.
+        '''
+        return self._version
+
+    def values_tuple(self):
+        '''
+        Returns the base parameter values as a tuple, in BASE_PARAMETERS order.
+        '''
+        return tuple(getattr(self,name) for name in BASE_PARAMETERS)
+
+    def copy(self):
+        '''
+        Returns an independent copy of the parameters.
+        '''
+        return TruckParams(**{name: getattr(self,name) for name in BASE_PARAMETERS})
+
+    def __hash__(self):
+        # Cached until a base parameter changes, so hashing is cheap per step
+        if self._hash is None:
+            object.__setattr__(self,'_hash',hash(self.values_tuple()))
+        return self._hash
+
+    def __eq__(self,other):
+        if not isinstance(other,TruckParams):
+            return NotImplemented
+        return self.values_tuple() == other.values_tuple()
+
+    def __getitem__(self,key):
+        if key in _BASE_SET or key in DERIVED_PARAMETERS:
+            return getattr(self,key)
+        raise KeyError(key)
+
+    def __setitem__(self,key,value):
+        if key not in _BASE_SET:
+            raise KeyError('{} is not a base truck parameter'.format(key))
+        setattr(self,key,value)
+
+    def __contains__(self,key):
+        return key in _BASE_SET or key in DERIVED_PARAMETERS
+
+    def keys(self):
+        return BASE_PARAMETERS + ('Cs1','Cq1')
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def items(self):
+        return [(key,self[key]) for key in self.keys()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __repr__(self):
+        return 'TruckParams({})'.format(', '.join('{}={!r}'.format(name,getattr(self,name)) for name in BASE_PARAMETERS))
+
+def _derived_property(name):
+    attr = '_'+name
+    def getter(self):
+        if not self._valid:
+            self._compute_derived()
+        return getattr(self,attr)
+    return property(getter,doc='Derived quantity {}, recomputed when base parameters change.'.format(name))
+
+for _name in DERIVED_PARAMETERS:
+    setattr(TruckParams,_name,_derived_property(_name))